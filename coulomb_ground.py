@@ -34,8 +34,7 @@ psi12 = psi1 + np.conj(psi2)
 psi = psi12/np.sqrt(np.sum(psi12*np.conj(psi12)))
 data = {'psi': psi1/np.sqrt(np.sum(psi1*np.conj(psi1)))}
 
-for i in range(25):
-    data['psi'] = U(data['psi'])
+data['psi'] = U.evolve(data['psi'], 25)
 
 # Compute ground state wavefunction using analytic formula
 norm_factor = 1.0/np.sqrt(np.sum(np.exp(-2.0*R/5.291772e-11)))
@@ -8,7 +8,6 @@ from splitstep import CoupledTwoSystemNonlinearSplitStepMethod
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-import scipy.constants as const
 
 # Constants (Metric Units)
 N = 256  # Number of points to use
@@ -33,6 +32,9 @@ V = 6.0*1e-18*((X/L)**2 + (Y/L)**2)  # Simple Harmonic Oscillator
 U = CoupledTwoSystemNonlinearSplitStepMethod(V, (L, L), DT,
                                              lambda1 = 0.0,
                                              lambda2 = 0.0)
+# The cubic Gross-Pitaevskii term 1e-17*|psi|^2 for both wavefunctions,
+# using the current density at each kick.
+U.set_power_nonlinearity(1.0e-17, 'cubic')
 # U.set_timestep(-1.0j*DT)
 # U.normalize_at_each_step(True)
 
@@ -60,15 +62,7 @@ def animation_func(*_):
     """
     Animation function
     """
-    psi1, psi2 = data['psi1'], data['psi2']
-    nonlinear_term1 = 1.0e-17*np.abs(psi1)**2
-    nonlinear_term2 = 1.0e-17*np.abs(psi2)**2
-    U.set_nonlinear_term(lambda psi: 
-                         psi*np.exp(-0.25j*nonlinear_term1*DT/const.hbar),
-                         lambda psi: 
-                         psi*np.exp(-0.25j*nonlinear_term2*DT/const.hbar)
-                         )
-    data['psi1'], data['psi2'] = U(psi1, psi2)
+    data['psi1'], data['psi2'] = U.step_inplace(data['psi1'], data['psi2'])
     im.set_data(np.angle(data['psi1'] + data['psi2']
                          ))
     max_val = np.amax((np.abs(data['psi1'] 
@@ -26,7 +26,9 @@ V = 15*1e-18*(X/L)**2 # Simple Harmonic Oscillator
 # V =  3.5*1e-18*(X/L)
 # V = 15*1e-18*((X/L)**2 + np.exp(-0.5*(X/L)**2/0.05**2)/8.0)
 
-U = SplitStepMethod(V, (L, ), -1.0j*DT)
+# The states stay real in imaginary time, so they are stored as real
+# arrays and stepped with real to complex transforms.
+U = SplitStepMethod(V, (L, ), -1.0j*DT, real=True)
 U.normalize_at_each_step(True)
 
 fig = plt.figure()
@@ -52,10 +54,10 @@ def func_animation(*_):
         # prev = sum([psi for psi in wavefunc_data['prev']])
         # prev = prev/np.sqrt(np.sum(np.abs(prev)**2))
         for prev in wavefunc_data['prev']:
-            wavefunc_data['x'] -= np.dot(prev, wavefunc_data['x'])*prev
+            wavefunc_data['x'] -= np.vdot(prev, wavefunc_data['x'])*prev
             # wavefunc_data['x'] = U(wavefunc_data['x'] + prev)
     # else:
-    wavefunc_data['x'] = np.real(U(wavefunc_data['x'])) + 0.0j
+    wavefunc_data['x'] = U(wavefunc_data['x'])
     eps = 1e-3 # if len(wavefunc_data['prev']) == 0 else 1e-2
     diff = psi - wavefunc_data['x']
     if np.sum(np.abs(diff)) < eps:
@@ -53,7 +53,7 @@ def animation_func(*_):
     """
     if data['eigenstates']:
         for prev in data['eigenstates']:
-            data['psi'] -= np.dot(prev, data['psi'])*prev
+            data['psi'] -= np.vdot(prev, data['psi'])*prev
     psi = U(data['psi'])
     data['psi'] = U(psi)
     eps = 1e-1
@@ -77,6 +77,11 @@ U = DiracSplitStepMethod(V  - m*C**2
                         , (L, L), DT, m=m, 
                         # vector_potential=A,
                         )
+# The vector potential is a fixed profile times cos(2 pi f t),
+# where t is counted as steps/120.0.
+# U.set_time_dependent_vector_potential(
+#     time_varying_vector_potential(0.0),
+#     lambda t: np.cos(2.0*np.pi*np.real(t)/(120.0*DT)))
 
 fig = plt.figure()
 ax = fig.add_subplot(1, 1, 1)
@@ -117,9 +122,6 @@ def animation_func(*_):
     """
     Animation function
     """
-    # U.set_potential(V.T # - m*C**2/2.0
-    #                 , # time_varying_vector_potential(data['steps']/120.0)
-    #                )
     for _i in range(1):
         data['psi'] = U(data['psi'])
     im.set_data(np.angle(data['psi'][0]))
@@ -16,8 +16,10 @@ DT = 0.005  # timestep
 # The Potential
 V = -1000.0/(4.0*np.pi*R)
 
+# The closed form of the momentum step needs far less memory
+# than storing its 4x4 matrix at each point of the grid.
 U = DiracSplitStepMethod(V, (L, L, L), DT,
-                         units={'c': 1.0})
+                         units={'c': 1.0}, closed_form_momentum=True)
 # U.normalize_at_each_step(True)
 
 # The wavefunction
@@ -3,6 +3,7 @@ Animation of a particle in 2D Simple Harmonic Oscillator.
 """
 from time import perf_counter
 from splitstep import SplitStepMethod
+from splitstep.render import FrameProducer
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -14,6 +15,7 @@ X, Y = np.meshgrid(L*np.linspace(-0.5, 0.5 - 1.0/N, N),
                     L*np.linspace(-0.5, 0.5 - 1.0/N, N))
 DX = X[1] - X[0]  # Spatial step size
 DT = 5e-17  # timestep in seconds
+STEPS_PER_FRAME = 1  # steps taken by the solver for each frame drawn
 
 # The wavefunction
 SIGMA = 0.056568
@@ -43,21 +45,25 @@ ax.set_xlabel('x (m)')
 ax.set_ylabel('y (m)')
 ax.set_title('Wavefunction')
 data = {'psi': wavefunc, 'steps': 0}
+# The solver steps in a background thread, so that
+# it is not held back by the drawing.
+producer = FrameProducer(U, wavefunc, STEPS_PER_FRAME)
+producer.start()
 t0 = perf_counter()
 
 def animation_func(*_):
     """
     Animation function
     """
-    data['psi'] = U(data['psi'])
+    data['steps'], data['psi'] = producer.latest()
     im.set_data(np.angle(data['psi']))
     im.set_alpha(np.abs(data['psi'])/max_val)
-    data['steps'] += 1
     return (im2, im)
 
 
 ani = animation.FuncAnimation(fig, animation_func, blit=True, interval=1.0)
 plt.show()
+producer.stop()
 fps = 1.0/((perf_counter() - t0)/(data["steps"]))
 print(f'fps: {np.round(fps, 1)}')
 print(np.sum(np.abs(wavefunc)), np.sum(np.abs(data['psi'])))
@@ -1,5 +1,6 @@
 from .splitstep import SplitStepMethod
 from .nonlinear import NonlinearSplitStepMethod
 from .nonlinear import CoupledTwoSystemNonlinearSplitStepMethod
+from .nonlinear import CoupledNonlinearSplitStepMethod
 from .relativistic import DiracSplitStepMethod
 from .relativistic import KleinGordonSplitstep
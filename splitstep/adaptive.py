@@ -0,0 +1,220 @@
+"""
+Adaptive timestep control for the split-step solvers.
+
+The local error of each step is estimated by step doubling: the
+wavefunction is stepped once with the current timestep dt and twice
+with dt/2, and the difference between the two results, scaled by
+1/(2^p - 1) for a scheme of order p, estimates the error of the more
+accurate one, which is kept. If this error is within the tolerance, the
+step is accepted, and dt is doubled for the next step when doubling it
+would still keep the error well within the tolerance. Otherwise dt is
+halved and the step is redone.
+
+Timesteps are kept to powers of two times the solver's initial timestep,
+so that only a few distinct timesteps are ever used. The propagators
+that set_timestep computes for each of these are cached, so that
+switching back to a timestep that was used before costs nothing.
+
+For example, to evolve psi over a time T with a relative error of at
+most 1e-6 per step:
+
+>>> from splitstep import SplitStepMethod
+>>> from splitstep.adaptive import AdaptiveStepper
+>>> U = SplitStepMethod(V, (L, L), DT)
+>>> stepper = AdaptiveStepper(U, tol=1e-6)
+>>> psi = stepper.evolve(psi, T)
+>>> print(stepper.get_history()['dt'])
+
+References:
+
+Hairer E., Norsett S., Wanner G. (1993). Solving Ordinary Differential
+Equations I, section II.4. Springer.
+
+"""
+from typing import Any, Callable, Dict
+import numpy as np
+from .precision import get_norm
+from .splitting_schemes import get_scheme_order
+
+
+class AdaptiveStepper:
+    """
+    Step a split-step solver with a timestep that adapts to keep the
+    estimated local error of each step within tol, relative to the norm
+    of the wavefunction. The timestep ranges over the solver's initial
+    timestep times 2^k, for k from -max_halvings to max_doublings.
+    The order of the solver's splitting scheme is used for the error
+    estimate, unless order is given.
+
+    The time that is reported is in the same units as the timestep of
+    the solver, and is complex if the timestep is.
+    """
+
+    def __init__(self, solver: Any, tol: float = 1e-6,
+                 max_doublings: int = 10, max_halvings: int = 10,
+                 order: int = None):
+        self.solver = solver
+        self.tol = tol
+        self.t = 0.0
+        self._dt0 = solver._dt
+        self._level = 0
+        self._min_level = -max_halvings
+        self._max_level = max_doublings
+        self._order = order if order is not None else \
+            get_scheme_order(getattr(solver, '_scheme', (1.0, )))
+        self._states = {0: self._save_state()}
+        self._history = {'t': [], 'dt': [], 'error': []}
+        self._start = None
+        self._trial = None
+
+    @property
+    def dt(self) -> Any:
+        """
+        The timestep that the next step is tried with.
+        """
+        return self._dt0*2.0**self._level
+
+    def set_potential(self, *args, **kw) -> None:
+        """
+        Change the potential of the solver. This clears the cached
+        propagators, since these depend on the potential.
+        """
+        self.solver.set_potential(*args, **kw)
+        self._states = {}
+        self._states[self._level] = self._save_state()
+
+    def step(self, psi: Any) -> Any:
+        """
+        Do one accepted adaptive step in place on psi, redoing it with
+        smaller timesteps as needed, and return the result. This raises
+        an exception, leaving psi and the solver as they were, if the
+        error is above tol even with the smallest timestep.
+        """
+        p = self._order
+        self._start = self._copy_into(self._start, psi)
+        steps, t = self.solver._steps, self.solver._t
+        while True:
+            self._set_level(self._level)
+            self._trial = self._copy_into(self._trial, psi)
+            self._trial_step(self._trial)
+            self._set_level(self._level - 1)
+            psi = self.solver._evolve_steps(psi, 2)
+            error = np.sqrt(get_norm(self._subtract(self._trial, psi))
+                            / get_norm(psi))/(2.0**p - 1.0)
+            if error <= self.tol:
+                break
+            self.solver._steps, self.solver._t = steps, t
+            psi = self._copy_into(psi, self._start)
+            if self._level <= self._min_level:
+                self._set_level(self._level)
+                raise Exception('The estimated error %g is above the '
+                                'tolerance %g even with the smallest '
+                                'timestep %s. Increase tol or '
+                                'max_halvings.' % (error, self.tol, self.dt))
+            self._level -= 1
+        self.t += self.dt
+        self._history['t'].append(self.t)
+        self._history['dt'].append(self.dt)
+        self._history['error'].append(error)
+        if error*2.0**(p + 1) < 0.5*self.tol and \
+                self._level < self._max_level:
+            self._level += 1
+        return psi
+
+    def evolve(self, psi: Any, t: Any,
+               callback: Callable[[Any, Any], None] = None) -> Any:
+        """
+        Evolve the wavefunction by a time t using adaptive steps and
+        return the result, leaving the input wavefunction unchanged. If
+        callback is given it is called as callback(psi, time) after each
+        accepted step, where the psi passed to it is overwritten by later
+        steps. The last step is shortened to end exactly at t, which
+        is not error checked since it is shorter than an accepted step.
+        """
+        psi = self.solver._copy_wavefunction(psi)
+        t_final = self.t + t
+        while abs(t_final - self.t) > 1e-12*abs(t):
+            remaining = t_final - self.t
+            if abs(remaining) >= abs(self.dt)*(1.0 - 1e-12):
+                psi = self.step(psi)
+            elif self._history['dt'] and \
+                    abs(remaining) <= abs(self._history['dt'][-1]):
+                psi = self._final_step(psi, remaining)
+            elif self._level > self._min_level:
+                self._level -= 1
+                continue
+            else:
+                raise Exception('The remaining time %s is shorter than '
+                                'the smallest timestep %s. Increase '
+                                'max_halvings.' % (remaining, self.dt))
+            if callback is not None:
+                callback(psi, self.t)
+        self._set_level(self._level)
+        return psi
+
+    def get_history(self) -> Dict[str, np.ndarray]:
+        """
+        Get the time at the end of each accepted step, its timestep
+        and its estimated error, as a dictionary of arrays with the keys
+        't', 'dt' and 'error'.
+        """
+        return {key: np.array(value) for key, value in self._history.items()}
+
+    def _trial_step(self, psi: Any) -> None:
+        # Step without counting the step or recording observables,
+        # since the result of this step is only used for the error.
+        steps, t = self.solver._steps, self.solver._t
+        observables = getattr(self.solver, '_observables', None)
+        self.solver._observables = None
+        try:
+            self.solver._evolve_steps(psi, 1)
+        finally:
+            self.solver._observables = observables
+            self.solver._steps, self.solver._t = steps, t
+
+    def _final_step(self, psi: Any, dt: Any) -> Any:
+        # A step shorter than the last accepted one, which is not kept
+        # in the cache since it is not on the ladder of timesteps.
+        self.solver.set_timestep(dt)
+        psi = self.solver._evolve_steps(psi, 1)
+        # The level may have been raised after the last accepted step
+        # without having been used yet.
+        self._set_level(self._level)
+        self.t += dt
+        self._history['t'].append(self.t)
+        self._history['dt'].append(dt)
+        self._history['error'].append(np.nan)
+        return psi
+
+    def _set_level(self, level: int) -> None:
+        if level not in self._states:
+            self.solver.set_timestep(self._dt0*2.0**level)
+            self._states[level] = self._save_state()
+        else:
+            self._load_state(self._states[level])
+
+    def _save_state(self) -> Dict[str, Any]:
+        return {key: getattr(self.solver, key)
+                for key in self.solver._timestep_attributes}
+
+    def _load_state(self, state: Dict[str, Any]) -> None:
+        for key, value in state.items():
+            setattr(self.solver, key, value)
+
+    @classmethod
+    def _copy_into(cls, dst: Any, src: Any) -> Any:
+        if isinstance(src, (list, tuple)):
+            if dst is None:
+                dst = [None]*len(src)
+            return type(src)([cls._copy_into(d, s)
+                              for d, s in zip(dst, src)])
+        if dst is None or dst.shape != src.shape or dst.dtype != src.dtype:
+            return np.array(src)
+        np.copyto(dst, src)
+        return dst
+
+    @classmethod
+    def _subtract(cls, psi1: Any, psi2: Any) -> Any:
+        if isinstance(psi1, (list, tuple)):
+            return [cls._subtract(a, b) for a, b in zip(psi1, psi2)]
+        return psi1 - psi2
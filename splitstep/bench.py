@@ -0,0 +1,254 @@
+"""
+Headless benchmarks of the split-step solvers, built from the
+example scenarios, which can be run as
+
+    python -m splitstep.bench [--sizes small medium]
+                              [--scenarios schrodinger2d dirac2d ...]
+                              [--output results.json]
+                              [--baseline baseline.json]
+
+For each scenario and grid size this reports the steps per second,
+the time per step spent in each phase of the step, as timed by the
+solver's profiling hooks, the time taken to make the solver and its
+propagators, and the peak memory allocated while making it and
+stepping, as measured by tracemalloc. The results are printed and
+can be saved as JSON. If a baseline from an earlier run is given,
+any scenario whose steps per second dropped, or whose peak memory
+grew, by more than the threshold fraction is flagged, and the exit
+status is 1.
+
+"""
+import sys
+import json
+import argparse
+import platform
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+import numpy as np
+import scipy.constants as const
+from . import SplitStepMethod, NonlinearSplitStepMethod
+from . import CoupledTwoSystemNonlinearSplitStepMethod
+from . import DiracSplitStepMethod, KleinGordonSplitstep
+
+
+Scenario = Tuple[Callable[[], Any], Any]
+
+
+def _get_grid(n: int, d: int, extent: float) -> List[np.ndarray]:
+    s = extent*np.linspace(-0.5, 0.5 - 1.0/n, n)
+    return np.meshgrid(*[s]*d)
+
+
+def _get_gaussian(grid: List[np.ndarray], extent: float) -> np.ndarray:
+    sigma = 0.056568
+    r2 = sum([((x/extent + 0.1*(-1)**i)/sigma)**2
+              for i, x in enumerate(grid)])
+    psi = np.exp(-r2/2.0)*(1.0 + 0.0j)
+    return psi/np.sqrt(np.sum(np.abs(psi)**2))
+
+
+def _schrodinger(n: int, d: int) -> Scenario:
+    # The simple harmonic oscillator of sho1d.py, sho2d.py and sho3d.py.
+    L, DT = 1e-8, 5e-17
+    grid = _get_grid(n, d, L)
+    V = 6e-18*sum([(x/L)**2 for x in grid])
+    return (lambda: SplitStepMethod(V, (L, )*d, DT),
+            _get_gaussian(grid, L))
+
+
+def _nonlinear(n: int) -> Scenario:
+    # nonlinear_sho2d.py
+    L, DT = 1e-8, 5e-17
+    grid = _get_grid(n, 2, L)
+    V = 6e-18*sum([(x/L)**2 for x in grid])
+
+    def make_solver() -> NonlinearSplitStepMethod:
+        U = NonlinearSplitStepMethod(V, (L, L), DT)
+        U.set_nonlinear_term(
+            lambda psi: psi*np.exp(-0.25j*1.0e-16*np.abs(psi)**2
+                                   * DT/const.hbar))
+        return U
+    return make_solver, _get_gaussian(grid, L)
+
+
+def _coupled(n: int) -> Scenario:
+    # coupled_wavefunctions.py, with the two systems coupled.
+    L, DT = 1e-8, 5e-17
+    grid = _get_grid(n, 2, L)
+    V = 6e-18*sum([(x/L)**2 for x in grid])
+    psi = _get_gaussian(grid, L)
+    return (lambda: CoupledTwoSystemNonlinearSplitStepMethod(
+        V, (L, L), DT, lambda1=1e-20, lambda2=1e-20),
+        (psi, np.conj(psi)))
+
+
+def _dirac(n: int, d: int) -> Scenario:
+    # The simple harmonic oscillator setup of rel_particle2d.py.
+    L, DT = 2.0, 0.0001
+    grid = _get_grid(n, d, L)
+    V = 10000.0*sum([(x/L)**2 for x in grid])
+    psi = np.zeros((4, ) + V.shape, dtype=np.complex128)
+    psi[0] = _get_gaussian(grid, L)
+    return lambda: DiracSplitStepMethod(V, (L, )*d, DT), psi
+
+
+def _klein_gordon(n: int) -> Scenario:
+    # rel_kg_particle2d.py without its nonlinear term.
+    L, DT = 4.0, 0.00009
+    grid = _get_grid(n, 2, L)
+    V = 10000.0*sum([(x/L)**2 for x in grid]) + 1e-10
+    psi = _get_gaussian(grid, L)
+    return (lambda: KleinGordonSplitstep(V, (L, L), DT, m=0.1,
+                                         shape=(n, n)),
+            [psi, np.zeros_like(psi)])
+
+
+SIZES = ('small', 'medium', 'large')
+
+
+SCENARIOS: Dict[str, Tuple[Callable[[int], Scenario], Tuple[int, ...]]] = {
+    'schrodinger1d': (lambda n: _schrodinger(n, 1), (4096, 32768, 262144)),
+    'schrodinger2d': (lambda n: _schrodinger(n, 2), (128, 256, 512)),
+    'schrodinger3d': (lambda n: _schrodinger(n, 3), (32, 64, 128)),
+    'schrodinger4d': (lambda n: _schrodinger(n, 4), (12, 20, 32)),
+    'nonlinear2d': (_nonlinear, (128, 256, 512)),
+    'coupled2d': (_coupled, (128, 256, 512)),
+    'dirac2d': (lambda n: _dirac(n, 2), (64, 128, 256)),
+    'dirac3d': (lambda n: _dirac(n, 3), (16, 32, 48)),
+    'klein_gordon2d': (_klein_gordon, (128, 256, 512)),
+}
+
+
+def run_benchmark(scenario: str, size: str, min_time: float = 1.0,
+                  min_steps: int = 5) -> Dict[str, Any]:
+    """
+    Benchmark one scenario at one of the grid sizes 'small', 'medium'
+    or 'large', stepping for at least min_time seconds and min_steps
+    steps, and return the results as a dictionary.
+    """
+    builder, sizes = SCENARIOS[scenario]
+    n = sizes[SIZES.index(size)]
+    make_solver, psi = builder(n)
+
+    t0 = perf_counter()
+    U = make_solver()
+    setup_seconds = perf_counter() - t0
+
+    psi = U.evolve(psi, 1)
+    steps = 0
+    t0 = perf_counter()
+    while steps < min_steps or perf_counter() - t0 < min_time:
+        psi = U.evolve(psi, min_steps)
+        steps += min_steps
+    step_seconds = (perf_counter() - t0)/steps
+
+    # The phases are timed in a separate run,
+    # so that the steps per second do not include the profiling.
+    with U.profile() as profiler:
+        U.evolve(psi, min_steps)
+    phases = {phase: record['seconds']/min_steps
+              for phase, record in profiler.get().items()}
+    profiled = sum([seconds for phase, seconds in phases.items()
+                    if not phase.startswith('set_')])
+    phases['other'] = max(step_seconds - profiled, 0.0)
+
+    del U
+    tracemalloc.start()
+    U = make_solver()
+    U.evolve(psi, 2)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'scenario': scenario, 'size': size,
+            'grid': list(U.V.shape) if U.V is not None else [n, n],
+            'steps': steps,
+            'steps_per_second': 1.0/step_seconds,
+            'seconds_per_step': phases,
+            'setup_seconds': setup_seconds,
+            'peak_memory_bytes': peak}
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+            threshold: float = 0.1) -> List[str]:
+    """
+    Compare the results against those of a baseline run, and return
+    a description of each regression larger than the threshold fraction.
+    """
+    baseline = {(r['scenario'], r['size']): r for r in baseline}
+    regressions = []
+    for r in results:
+        key = (r['scenario'], r['size'])
+        if key not in baseline:
+            continue
+        b = baseline[key]
+        speed = r['steps_per_second']/b['steps_per_second']
+        memory = r['peak_memory_bytes']/max(b['peak_memory_bytes'], 1)
+        if speed < 1.0 - threshold:
+            regressions.append('%s %s: %.1f%% fewer steps per second'
+                               % (*key, 100.0*(1.0 - speed)))
+        if memory > 1.0 + threshold:
+            regressions.append('%s %s: %.1f%% more peak memory'
+                               % (*key, 100.0*(memory - 1.0)))
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m splitstep.bench',
+        description='Headless benchmarks of the split-step solvers.')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS),
+                        choices=list(SCENARIOS), metavar='SCENARIO',
+                        help='One or more of: %s.' % ', '.join(SCENARIOS))
+    parser.add_argument('--sizes', nargs='+', default=['small'],
+                        choices=SIZES)
+    parser.add_argument('--min-time', type=float, default=1.0,
+                        help='Minimum seconds of stepping per benchmark.')
+    parser.add_argument('--output', help='Save the results to this file.')
+    parser.add_argument('--baseline',
+                        help='Compare against the results in this file.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Fraction by which a result must be worse '
+                        'than the baseline to be flagged.')
+    args = parser.parse_args(argv)
+
+    results = []
+    print('%-16s %-7s %-16s %10s %10s %10s %10s %10s'
+          % ('scenario', 'size', 'grid', 'steps/s', 'fft ms',
+             'rest ms', 'setup s', 'peak MB'))
+    for scenario in args.scenarios:
+        for size in args.sizes:
+            r = run_benchmark(scenario, size, args.min_time)
+            results.append(r)
+            phases = r['seconds_per_step']
+            fft = phases.get('fft', 0.0) + phases.get('ifft', 0.0)
+            rest = sum([seconds for phase, seconds in phases.items()
+                        if phase not in ('fft', 'ifft')
+                        and not phase.startswith('set_')])
+            print('%-16s %-7s %-16s %10.1f %10.3f %10.3f %10.3f %10.1f'
+                  % (scenario, size, 'x'.join(map(str, r['grid'])),
+                     r['steps_per_second'], 1e3*fft,
+                     1e3*rest,
+                     r['setup_seconds'], r['peak_memory_bytes']/2**20))
+            sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'numpy': np.__version__,
+                       'machine': platform.machine(),
+                       'results': results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f)['results'],
+                                  args.threshold)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        if regressions:
+            return 1
+        print('No regressions compared to the baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
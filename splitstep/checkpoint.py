@@ -0,0 +1,223 @@
+"""
+Saving the state of a split-step solver and its wavefunction to disk,
+so that a run can be resumed from where it was stopped.
+
+A checkpoint is a directory holding a metadata file and one .npy file
+for each array. It records the wavefunction, the timestep, the number
+of steps done so far and the time, which is the sum of the timesteps of
+those steps. Optionally, it also records the propagators that
+set_timestep computes. When these are loaded they are memory mapped
+instead of being recomputed, so that resuming is quick even for large
+grids, and their pages are only read from disk as the steps use them.
+
+The potential is not saved, since the solver that the checkpoint is
+loaded into is made with it in the first place. The saved propagators
+are only valid for that same potential, and for the same timestep.
+
+When a checkpoint is loaded, its grid shape, the shapes and types of
+its wavefunction and propagators, and, if it has propagators, its
+timestep are checked against the solver, and a ValueError is raised
+if they do not match, before the solver is changed.
+
+A checkpoint is first written to the directory <path>.tmp, with its
+metadata written last. The previous checkpoint is then moved to
+<path>.old, the new one is moved to path, and <path>.old is deleted.
+If the run stops between these moves, so that path does not exist,
+loading falls back to <path>.tmp if its metadata is complete, and to
+<path>.old otherwise. A run that is stopped while saving thus still
+leaves the last complete checkpoint.
+
+>>> U = SplitStepMethod(V, (L, L), DT)
+>>> if os.path.exists('checkpoint'):
+>>>     psi = U.load_checkpoint('checkpoint')
+>>> while ...:
+>>>     psi = U.evolve(psi, 1000)
+>>>     U.save_checkpoint('checkpoint', psi, save_propagators=True)
+
+"""
+import os
+import json
+import shutil
+from typing import Any, Dict, Tuple
+import numpy as np
+
+
+_META_FILE = 'checkpoint.json'
+
+
+def save_checkpoint(solver: Any, path: str, psi: Any,
+                    save_propagators: bool = False) -> None:
+    """
+    Save the wavefunction psi and the state of the solver
+    to the directory path.
+    """
+    tmp_path = path.rstrip(os.sep) + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    meta = {'class': type(solver).__name__,
+            'grid_shape': list(np.shape(solver.V)),
+            'dt': _to_json(solver._dt, tmp_path, 'dt'),
+            't': _to_json(solver._t, tmp_path, 't'),
+            'steps': solver._steps,
+            'dtype': solver._dtype.str,
+            'real': getattr(solver, '_real', False),
+            'spinor_last': getattr(solver, '_spinor_last', False),
+            'scheme': list(solver._scheme),
+            'norm': solver._norm,
+            'psi': _to_json(psi, tmp_path, 'psi'),
+            'propagators': None}
+    if save_propagators:
+        meta['propagators'] = {
+            key: _to_json(getattr(solver, key), tmp_path, key)
+            for key in solver._timestep_attributes if key != '_dt'}
+    with open(os.path.join(tmp_path, _META_FILE), 'w') as f:
+        json.dump(meta, f)
+    old_path = path.rstrip(os.sep) + '.old'
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+def load_checkpoint(solver: Any, path: str) -> Any:
+    """
+    Restore the state of the solver from the checkpoint in the directory
+    path, and return the wavefunction that was saved with it. The saved
+    propagators are memory mapped if there are any, and otherwise the
+    propagators are recomputed if the timestep differs.
+    """
+    path, meta = _find_checkpoint(path)
+    if meta['class'] != type(solver).__name__:
+        raise Exception('The checkpoint is for %s, not for %s.'
+                        % (meta['class'], type(solver).__name__))
+    if np.dtype(meta['dtype']) != solver._dtype:
+        raise Exception('The checkpoint has the type %s, but the solver '
+                        'has the type %s.' % (meta['dtype'], solver._dtype))
+    if meta.get('real', False) != getattr(solver, '_real', False):
+        raise Exception('The checkpoint and the solver differ in whether '
+                        'the wavefunction is real.')
+    if meta.get('spinor_last', False) != \
+            getattr(solver, '_spinor_last', False):
+        raise Exception('The checkpoint and the solver differ in the '
+                        'layout of the spinor.')
+    grid_shape = tuple(np.shape(solver.V))
+    if 'grid_shape' in meta and tuple(meta['grid_shape']) != grid_shape:
+        raise ValueError('The checkpoint has the grid shape %s, but the '
+                         'solver has the grid shape %s.'
+                         % (tuple(meta['grid_shape']), grid_shape))
+    dt = _from_json(meta['dt'], path)
+    psi = _from_json(meta['psi'], path)
+    _check_wavefunction(psi, grid_shape,
+                        getattr(solver, '_state_dtype', solver._dtype))
+    propagators = None
+    if meta['propagators'] is not None:
+        if dt != solver._dt:
+            raise ValueError('The propagators in the checkpoint are for the '
+                             'timestep %s, but the solver has the timestep '
+                             '%s.' % (dt, solver._dt))
+        propagators = {key: _from_json(value, path, mmap=True)
+                       for key, value in meta['propagators'].items()}
+        for key, value in propagators.items():
+            _check_propagator(key, value, getattr(solver, key, None))
+    if solver._splitting_schemes_supported:
+        solver.set_splitting_scheme(meta['scheme'])
+    if propagators is not None:
+        for key, value in propagators.items():
+            setattr(solver, key, value)
+    elif dt != solver._dt:
+        solver.set_timestep(dt)
+    solver._t = _from_json(meta['t'], path)
+    solver._steps = meta['steps']
+    solver._norm = meta['norm']
+    return psi
+
+
+def _find_checkpoint(path: str) -> Tuple[str, Dict[str, Any]]:
+    # The directory of the last complete checkpoint at path, and its
+    # metadata, where the new and the previous checkpoint are only found
+    # at <path>.tmp and <path>.old if saving was stopped partway.
+    path = path.rstrip(os.sep)
+    if not os.path.exists(path):
+        for candidate in (path + '.tmp', path + '.old'):
+            try:
+                with open(os.path.join(candidate, _META_FILE), 'r') as f:
+                    return candidate, json.load(f)
+            except (OSError, ValueError):
+                # The metadata is missing or was only partly written.
+                continue
+    with open(os.path.join(path, _META_FILE), 'r') as f:
+        return path, json.load(f)
+
+
+def _check_wavefunction(psi: Any, grid_shape: tuple,
+                        dtype: np.dtype) -> None:
+    # Each array of the wavefunction must hold whole grids, along with
+    # any ensemble or spinor axes, and fit in the type of the solver.
+    for psi_i in (psi if isinstance(psi, (list, tuple)) else [psi]):
+        shape, n = tuple(np.shape(psi_i)), len(grid_shape)
+        if not any(shape[i:i + n] == grid_shape
+                   for i in range(len(shape) - n + 1)):
+            raise ValueError('The wavefunction in the checkpoint has the '
+                             'shape %s, which does not match the grid '
+                             'shape %s.' % (shape, grid_shape))
+        if not np.can_cast(np.asarray(psi_i).dtype, dtype, 'same_kind'):
+            raise ValueError('The wavefunction in the checkpoint has the '
+                             'type %s, but the solver has the type %s.'
+                             % (np.asarray(psi_i).dtype, dtype))
+
+
+def _check_propagator(name: str, value: Any, expected: Any) -> None:
+    # A saved propagator must have the shape and type
+    # of the one that the solver made.
+    if isinstance(expected, np.ndarray):
+        if not isinstance(value, np.ndarray) or \
+                value.shape != expected.shape or \
+                value.dtype != expected.dtype:
+            raise ValueError('The propagator %s in the checkpoint does not '
+                             'match the shape %s and type %s of the '
+                             'solver.' % (name, expected.shape,
+                                          expected.dtype))
+    elif isinstance(expected, (list, tuple)):
+        if not isinstance(value, (list, tuple)) or \
+                len(value) != len(expected):
+            raise ValueError('The propagator %s in the checkpoint does not '
+                             'match that of the solver.' % name)
+        for value_i, expected_i in zip(value, expected):
+            _check_propagator(name, value_i, expected_i)
+
+
+def _to_json(value: Any, path: str, name: str) -> Any:
+    # The arrays are saved to their own files, and everything
+    # else is stored in the metadata.
+    if isinstance(value, np.ndarray):
+        np.save(os.path.join(path, name + '.npy'), value)
+        return {'array': name + '.npy'}
+    if isinstance(value, (list, tuple)):
+        return {type(value).__name__: [
+            _to_json(v, path, '%s_%d' % (name, i))
+            for i, v in enumerate(value)]}
+    if isinstance(value, dict):
+        # These are caches, which are remade when they are needed.
+        return {'dict': None}
+    if value is None:
+        return None
+    if np.iscomplexobj(value):
+        return {'complex': [float(np.real(value)), float(np.imag(value))]}
+    return float(value)
+
+
+def _from_json(value: Any, path: str, mmap: bool = False) -> Any:
+    if not isinstance(value, Dict):
+        return value
+    if 'array' in value:
+        return np.load(os.path.join(path, value['array']),
+                       mmap_mode='r' if mmap else None)
+    if 'list' in value:
+        return [_from_json(v, path, mmap) for v in value['list']]
+    if 'tuple' in value:
+        return tuple([_from_json(v, path, mmap) for v in value['tuple']])
+    if 'dict' in value:
+        return {}
+    return complex(*value['complex'])
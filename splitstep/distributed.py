@@ -0,0 +1,337 @@
+"""
+Stepping the Schrodinger equation on grids that are split into slabs
+over several worker processes, which share the wavefunction
+through shared memory.
+
+Each worker owns a slab of the grid along its first axis, and only
+makes the potential step for its own slab. The Fourier transform is
+done in two parts. Each worker first transforms its slab over all
+axes but the first. The grid is then transposed so that the first two
+axes are swapped, where each worker now owns a slab along the second
+axis, and it transforms this over the first axis. The kinetic step is
+done in this transposed layout, so that it too is local to each worker.
+The inverse transform does the same steps in reverse. The transposes
+are the only steps where a worker reads the data of the other
+workers, and are done after all workers reach a barrier.
+
+The workers compute the propagators for their own slabs, so that
+making them is also done in parallel, and no process holds the
+propagators of the whole grid.
+
+>>> from splitstep.distributed import DistributedSplitStepMethod
+>>> with DistributedSplitStepMethod(V, (L, L, L), DT, n_workers=8) as U:
+>>>     psi = U.evolve(psi, 1000)
+
+References:
+
+Frigo M., Johnson S. G. (2005). The Design and Implementation of FFTW3.
+Proceedings of the IEEE, 93(2), 216-231. See also the section
+Distributed-memory FFTW with MPI of the FFTW manual.
+
+"""
+import os
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Tuple, Union
+import numpy as np
+import scipy.constants as const
+from .splitstep import get_grid_axes
+from .fft_backend import get_fft_backend
+
+
+def _get_bounds(n: int, n_workers: int) -> List[Tuple[int, int]]:
+    edges = [(p*n)//n_workers for p in range(n_workers + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _get_shared_array(name: str, shape: Tuple[int, ...],
+                      dtype: np.dtype
+                      ) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+class _Worker:
+    # The state of one worker process, which steps its own slab.
+
+    def __init__(self, rank: int, n_workers: int, shape: Tuple[int, ...],
+                 dimensions: Tuple[float, ...], dtype: np.dtype,
+                 potential_dtype: np.dtype, names: Dict[str, str],
+                 barrier: Any, fft_backend: str):
+        self.rank = rank
+        self.shape = shape
+        self.dimensions = dimensions
+        self.dtype = np.dtype(dtype)
+        self.barrier = barrier
+        self.fft = get_fft_backend(fft_backend)
+        self.m = const.m_e
+        self.dt = 0.0
+        self._shm = []
+        transposed_shape = (shape[1], shape[0]) + shape[2:]
+        self.psi = self._attach(names['psi'], shape, self.dtype)
+        self.psi_t = self._attach(names['psi_t'], transposed_shape,
+                                  self.dtype)
+        self.V = self._attach(names['V'], shape, np.dtype(potential_dtype))
+        self.norms = self._attach(names['norms'], (n_workers, ), np.float64)
+        self.s0 = slice(*_get_bounds(shape[0], n_workers)[rank])
+        self.s1 = slice(*_get_bounds(shape[1], n_workers)[rank])
+        self.axes = tuple(range(1, len(shape)))
+        self.exp_potential = None
+        self.exp_potential_full = None
+        self.exp_kinetic = None
+
+    def _attach(self, name: str, shape: Tuple[int, ...],
+                dtype: np.dtype) -> np.ndarray:
+        shm, a = _get_shared_array(name, shape, dtype)
+        self._shm.append(shm)
+        return a
+
+    def close(self) -> None:
+        del self.psi, self.psi_t, self.V, self.norms
+        for shm in self._shm:
+            shm.close()
+
+    def set_timestep(self, dt: Union[float, complex], m: float) -> None:
+        self.dt = dt
+        self.m = m
+        # The kinetic energy of this worker's slab of the transposed grid,
+        # which is summed from the kinetic energy along each axis.
+        kinetic = np.zeros((self.s1.stop - self.s1.start, self.shape[0])
+                           + self.shape[2:])
+        for i, d, shape in get_grid_axes(self.shape):
+            p = np.reshape(2.0*np.pi*const.hbar*np.fft.fftfreq(d)*d
+                           / self.dimensions[i], shape)
+            p = np.swapaxes(p, 0, 1)
+            if p.shape[0] != 1:
+                p = p[self.s1]
+            kinetic += p**2/(2.0*self.m)
+        self.exp_kinetic = np.exp(-0.5j*(dt/const.hbar)*kinetic
+                                  ).astype(self.dtype)
+        self.set_potential()
+
+    def set_potential(self) -> None:
+        self.exp_potential = np.exp(-0.25j*(self.dt/const.hbar)
+                                    * self.V[self.s0]).astype(self.dtype)
+        self.exp_potential_full = self.exp_potential**2
+
+    def evolve(self, n_steps: int, norm: bool) -> None:
+        psi = self.psi[self.s0]
+        psi *= self.exp_potential
+        for i in range(n_steps):
+            self._kinetic_step()
+            psi *= self.exp_potential_full if i < n_steps - 1 \
+                else self.exp_potential
+            if norm:
+                self._normalize(psi)
+
+    def _kinetic_step(self) -> None:
+        psi, psi_t = self.psi[self.s0], self.psi_t[self.s1]
+        self.fft.fftn(psi, axes=self.axes, out=psi)
+        self.barrier.wait()
+        psi_t[...] = np.swapaxes(self.psi[:, self.s1], 0, 1)
+        psi_t[...] = self.fft.fftn(psi_t, axes=(1, ))
+        psi_t *= self.exp_kinetic
+        psi_t[...] = self.fft.ifftn(psi_t, axes=(1, ))
+        self.barrier.wait()
+        psi[...] = np.swapaxes(self.psi_t[:, self.s0], 0, 1)
+        self.fft.ifftn(psi, axes=self.axes, out=psi)
+
+    def _normalize(self, psi: np.ndarray) -> None:
+        self.norms[self.rank] = np.vdot(psi, psi).real
+        self.barrier.wait()
+        psi *= 1.0/np.sqrt(np.sum(self.norms))
+        # The norms are not written again until every worker has read them.
+        self.barrier.wait()
+
+
+def _run_worker(rank: int, connection: Any, barrier: Any,
+                kw: Dict[str, Any]) -> None:
+    worker = None
+    try:
+        worker = _Worker(rank, barrier=barrier, **kw)
+        while True:
+            command, *command_args = connection.recv()
+            if command == 'close':
+                break
+            getattr(worker, command)(*command_args)
+            connection.send(None)
+    except Exception as e:
+        # Release the other workers from the barrier, so that they fail
+        # too instead of waiting for this one forever.
+        barrier.abort()
+        connection.send(e)
+    finally:
+        if worker is not None:
+            worker.close()
+        connection.close()
+
+
+class DistributedSplitStepMethod:
+    """
+    The split step method for the Schrodinger equation, where the grid is
+    split into slabs along its first axis over n_workers processes,
+    which is the number of cores by default. The grid must have at least
+    two dimensions, and n_workers can be at most the number of points
+    along either of the first two axes. The wavefunction is a single
+    array with the shape of the potential.
+
+    This gives the same result as SplitStepMethod.evolve, and has the
+    same constructor arguments except for dtype. As for SplitStepMethod,
+    the mass is the attribute m, which is used from the next call to
+    set_timestep. The potential may be complex only if the one that
+    this is constructed with is complex. The workers use the
+    numpy FFT unless another backend is named with fft_backend.
+    Call close, or use this in a with block, to stop the workers and
+    free the shared memory.
+    """
+
+    def __init__(self, potential: np.ndarray,
+                 dimensions: Tuple[float, ...],
+                 timestep: Union[float, np.complex128] = 1e-17,
+                 n_workers: int = None,
+                 dtype: np.dtype = np.complex128,
+                 fft_backend: str = 'numpy'):
+        shape = potential.shape
+        if len(shape) != len(dimensions):
+            raise Exception('Potential shape does not match dimensions')
+        if len(shape) < 2:
+            raise Exception('The grid must have at least two dimensions.')
+        n_workers = n_workers if n_workers else os.cpu_count()
+        n_workers = min(n_workers, shape[0], shape[1])
+        self.n_workers = n_workers
+        self._dtype = np.dtype(dtype)
+        self._potential_dtype = np.result_type(potential, np.float64)
+        self._shape = shape
+        self.m = const.m_e
+        self._norm = False
+        self._dt = timestep
+        self._steps = 0
+        self._t = 0.0
+        self._shm = {}
+        arrays = {'psi': (shape, self._dtype),
+                  'psi_t': ((shape[1], shape[0]) + shape[2:], self._dtype),
+                  'V': (shape, self._potential_dtype),
+                  'norms': ((n_workers, ), np.dtype(np.float64))}
+        for key, (array_shape, array_dtype) in arrays.items():
+            size = max(int(np.prod(array_shape))*array_dtype.itemsize, 1)
+            self._shm[key] = shared_memory.SharedMemory(create=True,
+                                                        size=size)
+        self._psi = np.ndarray(shape, dtype=self._dtype,
+                               buffer=self._shm['psi'].buf)
+        self.V = np.ndarray(shape, dtype=self._potential_dtype,
+                            buffer=self._shm['V'].buf)
+        self.V[...] = potential
+        names = {key: shm.name for key, shm in self._shm.items()}
+        barrier = multiprocessing.Barrier(n_workers)
+        kw = {'n_workers': n_workers, 'shape': shape,
+              'dimensions': tuple(dimensions), 'dtype': self._dtype.str,
+              'potential_dtype': self._potential_dtype.str,
+              'names': names, 'fft_backend': fft_backend}
+        self._connections = []
+        self._processes = []
+        for rank in range(n_workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_run_worker, daemon=True,
+                args=(rank, worker_connection, barrier, kw))
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self.set_timestep(timestep)
+
+    def __enter__(self) -> 'DistributedSplitStepMethod':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _send(self, *command) -> None:
+        # Send a command to all the workers and wait until they are done.
+        for connection in self._connections:
+            connection.send(command)
+        errors = [connection.recv() for connection in self._connections]
+        errors = [e for e in errors if e is not None]
+        if errors:
+            # A failed worker breaks the barrier, so the others fail
+            # too, but it is the error of the first one that matters.
+            first = [e for e in errors
+                     if not isinstance(e, threading.BrokenBarrierError)]
+            raise (first if first else errors)[0]
+
+    def set_timestep(self, timestep: Union[float, np.complex128]) -> None:
+        """
+        Set the timestep. It can be real or complex.
+        """
+        self._dt = timestep
+        self._send('set_timestep', timestep, self.m)
+
+    def set_potential(self, V: np.ndarray) -> None:
+        """
+        Change the potential
+        """
+        if np.iscomplexobj(V) and not np.iscomplexobj(self.V):
+            raise ValueError('The potential can only be complex if the '
+                             'one that the solver is made with is.')
+        self.V[...] = V
+        self._send('set_potential')
+
+    def normalize_at_each_step(self, norm: bool) -> None:
+        """
+        Whether to normalize the wavefunction at each time step or not.
+        """
+        self._norm = norm
+
+    def evolve(self, psi: np.ndarray, n_steps: int,
+               callback: Callable[[np.ndarray, int], None] = None,
+               callback_every: int = 1) -> np.ndarray:
+        """
+        Step the wavefunction n_steps times and return the result,
+        where callback is called as callback(psi, steps) every
+        callback_every steps if it is given, as for SplitStepMethod.
+        The psi passed to the callback is in shared memory and is
+        overwritten by later steps.
+        """
+        self._psi[...] = psi
+        steps = 0
+        while steps < n_steps:
+            n = n_steps - steps
+            if callback is not None:
+                n = min(callback_every, n)
+            self._send('evolve', n, self._norm)
+            steps += n
+            self._steps += n
+            self._t += n*self._dt
+            if callback is not None:
+                callback(self._psi, steps)
+        return np.array(self._psi)
+
+    def __call__(self, psi: np.ndarray) -> np.ndarray:
+        """
+        Step the wavefunction in time.
+        """
+        return self.evolve(psi, 1)
+
+    def close(self) -> None:
+        """
+        Stop the worker processes and free the shared memory.
+        """
+        for connection, process in zip(self._connections, self._processes):
+            if process.is_alive():
+                try:
+                    connection.send(('close', ))
+                except (BrokenPipeError, OSError):
+                    pass
+        for process in self._processes:
+            process.join()
+        self._connections, self._processes = [], []
+        if self._shm:
+            del self._psi, self.V
+            for shm in self._shm.values():
+                shm.close()
+                shm.unlink()
+            self._shm = {}
+
+    def __del__(self):
+        if getattr(self, '_shm', None):
+            self.close()
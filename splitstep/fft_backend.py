@@ -0,0 +1,276 @@
+"""
+Backends for the forward and inverse Fourier transforms
+used by the split-step classes.
+
+Three backends are provided:
+ - numpy: np.fft, single-threaded. This is the default.
+ - scipy: scipy.fft, which can use several threads through its
+   workers argument, and which caches its own plans internally.
+ - pyfftw: FFTW through the optional pyFFTW package. Plans are built
+   once for each array shape, type and set of axes, and are then
+   reused at each step. The FFTW wisdom accumulated from building
+   these plans can be saved to a file and loaded on the next run.
+
+Each backend also has the real to complex transforms rfftn and
+irfftn, which are used for real wavefunctions.
+
+References:
+
+https://docs.scipy.org/doc/scipy/reference/fft.html
+
+https://pyfftw.readthedocs.io/en/latest/
+
+"""
+import os
+import pickle
+from typing import Union, Tuple, Any
+import numpy as np
+import scipy.fft
+
+
+# The out argument of the np.fft functions was added in numpy 2.0.
+_NUMPY_FFT_HAS_OUT = int(np.__version__.split('.')[0]) >= 2
+
+
+def _copy_to_out(result: np.ndarray, out: np.ndarray) -> np.ndarray:
+    if out is None or result is out:
+        return result
+    out[...] = result
+    return out
+
+
+class FFTBackend:
+    """
+    Base class for the Fourier transform backends.
+    This uses np.fft.
+    """
+    name = 'numpy'
+
+    def fftn(self, x: np.ndarray, axes: Tuple[int, ...] = None,
+             out: np.ndarray = None) -> np.ndarray:
+        """
+        Forward Fourier transform over the given axes,
+        or over all axes if none are given. If out is given the result
+        is written to it, where out may be x itself.
+        """
+        if _NUMPY_FFT_HAS_OUT:
+            return np.fft.fftn(x, axes=axes, out=out)
+        return _copy_to_out(np.fft.fftn(x, axes=axes), out)
+
+    def ifftn(self, x: np.ndarray, axes: Tuple[int, ...] = None,
+              out: np.ndarray = None) -> np.ndarray:
+        """
+        Inverse Fourier transform over the given axes,
+        or over all axes if none are given. If out is given the result
+        is written to it, where out may be x itself.
+        """
+        if _NUMPY_FFT_HAS_OUT:
+            return np.fft.ifftn(x, axes=axes, out=out)
+        return _copy_to_out(np.fft.ifftn(x, axes=axes), out)
+
+    def rfftn(self, x: np.ndarray, axes: Tuple[int, ...] = None,
+              out: np.ndarray = None) -> np.ndarray:
+        """
+        Forward Fourier transform of the real array x over the given
+        axes, or over all axes if none are given, which only keeps
+        the non-negative frequencies of the last of these axes.
+        If out is given the result is written to it.
+        """
+        if _NUMPY_FFT_HAS_OUT:
+            return np.fft.rfftn(x, axes=axes, out=out)
+        return _copy_to_out(np.fft.rfftn(x, axes=axes), out)
+
+    def irfftn(self, x: np.ndarray, s: Tuple[int, ...],
+               axes: Tuple[int, ...] = None,
+               out: np.ndarray = None) -> np.ndarray:
+        """
+        Inverse of rfftn, where s is the shape of the real result
+        along the transformed axes. If out is given the result is
+        written to it.
+        """
+        if _NUMPY_FFT_HAS_OUT:
+            return np.fft.irfftn(x, s=s, axes=axes, out=out)
+        return _copy_to_out(np.fft.irfftn(x, s=s, axes=axes), out)
+
+
+class NumpyFFTBackend(FFTBackend):
+    """
+    Fourier transforms using np.fft.
+    """
+    name = 'numpy'
+
+
+class ScipyFFTBackend(FFTBackend):
+    """
+    Fourier transforms using scipy.fft. The number of threads is set by
+    workers, where a negative value counts back from the number of cores,
+    so that -1 uses all of them.
+    """
+    name = 'scipy'
+
+    def __init__(self, workers: int = -1):
+        self.workers = workers
+
+    def fftn(self, x: np.ndarray, axes: Tuple[int, ...] = None,
+             out: np.ndarray = None) -> np.ndarray:
+        return _copy_to_out(scipy.fft.fftn(x, axes=axes,
+                                           overwrite_x=out is x,
+                                           workers=self.workers), out)
+
+    def ifftn(self, x: np.ndarray, axes: Tuple[int, ...] = None,
+              out: np.ndarray = None) -> np.ndarray:
+        return _copy_to_out(scipy.fft.ifftn(x, axes=axes,
+                                            overwrite_x=out is x,
+                                            workers=self.workers), out)
+
+    def rfftn(self, x: np.ndarray, axes: Tuple[int, ...] = None,
+              out: np.ndarray = None) -> np.ndarray:
+        return _copy_to_out(scipy.fft.rfftn(x, axes=axes,
+                                            workers=self.workers), out)
+
+    def irfftn(self, x: np.ndarray, s: Tuple[int, ...],
+               axes: Tuple[int, ...] = None,
+               out: np.ndarray = None) -> np.ndarray:
+        # The half spectrum is a workspace, so it may be overwritten.
+        return _copy_to_out(scipy.fft.irfftn(x, s=s, axes=axes,
+                                             overwrite_x=True,
+                                             workers=self.workers), out)
+
+
+class PyFFTWBackend(FFTBackend):
+    """
+    Fourier transforms using FFTW through pyFFTW.
+
+    A plan is made the first time a given array shape, type and set
+    of axes is transformed, and it is reused after that. If wisdom_file
+    is given, wisdom is loaded from it if it exists,
+    and it is saved to it each time a new plan is made.
+    """
+    name = 'pyfftw'
+
+    def __init__(self, threads: int = None,
+                 planner_effort: str = 'FFTW_MEASURE',
+                 wisdom_file: str = None):
+        try:
+            import pyfftw
+        except ImportError as e:
+            raise ImportError('The pyfftw backend requires '
+                              'the pyFFTW package.') from e
+        self._pyfftw = pyfftw
+        self.threads = threads if threads else os.cpu_count()
+        self.planner_effort = planner_effort
+        self.wisdom_file = wisdom_file
+        self._plans = {}
+        if wisdom_file and os.path.exists(wisdom_file):
+            with open(wisdom_file, 'rb') as f:
+                pyfftw.import_wisdom(pickle.load(f))
+
+    def save_wisdom(self, wisdom_file: str = None) -> None:
+        """
+        Save the FFTW wisdom to a file.
+        """
+        wisdom_file = wisdom_file if wisdom_file else self.wisdom_file
+        with open(wisdom_file, 'wb') as f:
+            pickle.dump(self._pyfftw.export_wisdom(), f)
+
+    def _get_plan(self, x: np.ndarray, axes: Tuple[int, ...],
+                  direction: str) -> Any:
+        axes = tuple(range(x.ndim)) if axes is None else tuple(
+            [axis % x.ndim for axis in axes])
+        key = (x.shape, x.dtype.str, axes, direction)
+        if key not in self._plans:
+            dtype = np.result_type(x.dtype, np.complex64)
+            input_array = self._pyfftw.empty_aligned(x.shape, dtype=dtype)
+            output_array = self._pyfftw.empty_aligned(x.shape, dtype=dtype)
+            self._plans[key] = self._pyfftw.FFTW(
+                input_array, output_array, axes=axes, direction=direction,
+                flags=(self.planner_effort, ), threads=self.threads)
+            if self.wisdom_file:
+                self.save_wisdom()
+        return self._plans[key]
+
+    def _get_real_plan(self, shape: Tuple[int, ...], dtype: np.dtype,
+                       axes: Tuple[int, ...], direction: str) -> Any:
+        # A plan between a real array of the given shape and its half
+        # spectrum, along the last of the axes.
+        axes = tuple(range(len(shape))) if axes is None else tuple(
+            [axis % len(shape) for axis in axes])
+        key = (shape, np.dtype(dtype).str, axes, direction)
+        if key not in self._plans:
+            real_dtype = np.result_type(dtype, np.float32)
+            half_shape = list(shape)
+            half_shape[axes[-1]] = shape[axes[-1]]//2 + 1
+            real_array = self._pyfftw.empty_aligned(shape, dtype=real_dtype)
+            half_array = self._pyfftw.empty_aligned(
+                tuple(half_shape), dtype=np.result_type(real_dtype,
+                                                        np.complex64))
+            arrays = (real_array, half_array) \
+                if direction == 'FFTW_FORWARD' else (half_array, real_array)
+            self._plans[key] = self._pyfftw.FFTW(
+                *arrays, axes=axes, direction=direction,
+                flags=(self.planner_effort, ), threads=self.threads)
+            if self.wisdom_file:
+                self.save_wisdom()
+        return self._plans[key]
+
+    def fftn(self, x: np.ndarray, axes: Tuple[int, ...] = None,
+             out: np.ndarray = None) -> np.ndarray:
+        plan = self._get_plan(x, axes, 'FFTW_FORWARD')
+        plan.input_array[...] = x
+        if out is None:
+            return np.copy(plan())
+        return _copy_to_out(plan(), out)
+
+    def ifftn(self, x: np.ndarray, axes: Tuple[int, ...] = None,
+              out: np.ndarray = None) -> np.ndarray:
+        plan = self._get_plan(x, axes, 'FFTW_BACKWARD')
+        plan.input_array[...] = x
+        if out is None:
+            return np.copy(plan())
+        return _copy_to_out(plan(), out)
+
+    def rfftn(self, x: np.ndarray, axes: Tuple[int, ...] = None,
+              out: np.ndarray = None) -> np.ndarray:
+        plan = self._get_real_plan(x.shape, x.dtype, axes, 'FFTW_FORWARD')
+        plan.input_array[...] = x
+        if out is None:
+            return np.copy(plan())
+        return _copy_to_out(plan(), out)
+
+    def irfftn(self, x: np.ndarray, s: Tuple[int, ...],
+               axes: Tuple[int, ...] = None,
+               out: np.ndarray = None) -> np.ndarray:
+        axes = tuple(range(x.ndim - len(s), x.ndim)) if axes is None \
+            else tuple([axis % x.ndim for axis in axes])
+        shape = list(x.shape)
+        for axis, n in zip(axes, s):
+            shape[axis] = n
+        plan = self._get_real_plan(tuple(shape), x.real.dtype, axes,
+                                   'FFTW_BACKWARD')
+        plan.input_array[...] = x
+        if out is None:
+            return np.copy(plan())
+        return _copy_to_out(plan(), out)
+
+
+FFT_BACKENDS = {'numpy': NumpyFFTBackend,
+                'scipy': ScipyFFTBackend,
+                'pyfftw': PyFFTWBackend}
+
+
+def get_fft_backend(backend: Union[str, FFTBackend] = None,
+                    **kw) -> FFTBackend:
+    """
+    Get a Fourier transform backend from its name, where any keyword
+    arguments are passed to its constructor. If backend is already
+    an FFTBackend instance it is returned as is, and if it is None
+    the numpy backend is returned.
+    """
+    if backend is None:
+        return NumpyFFTBackend()
+    if isinstance(backend, FFTBackend):
+        return backend
+    if backend not in FFT_BACKENDS:
+        raise KeyError('Unknown FFT backend %s. Choose one of: %s.'
+                       % (backend, ', '.join(FFT_BACKENDS.keys())))
+    return FFT_BACKENDS[backend](**kw)
@@ -0,0 +1,310 @@
+"""
+Backends for the element-wise kicks of the split-step classes, which
+multiply the wavefunction by the potential and kinetic propagators and
+by the phase of a nonlinear term.
+
+These kicks do little arithmetic for each value they read and write,
+so their speed is set by memory bandwidth. Done with numpy, each
+operation is its own pass over the whole wavefunction, and the
+nonlinear phase exp(phase*g*|psi|^(2 power)) alone takes several
+passes and temporary arrays. The numba and numexpr backends fuse them:
+
+ - numpy: in-place numpy operations, one pass for each. This is
+   the default.
+ - numba: the optional Numba package. The potential kick, the
+   nonlinear phase and the sum of |psi|^2 used for normalization are
+   done together in one pass, which is split over all the cores.
+   The kernels are compiled the first time they are called with each
+   combination of array types, which takes a few seconds.
+ - numexpr: the optional numexpr package. The potential kick and the
+   nonlinear phase are done in one multithreaded pass, but the sum of
+   |psi|^2 is a second pass, since numexpr can only do a reduction as
+   an expression of its own.
+
+Kicks by arrays that do not have the full shape of the grid, such as
+the separable kinetic factors, and wavefunctions that are not
+contiguous, are done with numpy by every backend.
+
+The wavefunction may also be real, for imaginary time evolution,
+in which case the propagators and the nonlinear phase must be real too.
+
+References:
+
+https://numba.readthedocs.io/en/stable/user/parallel.html
+
+https://numexpr.readthedocs.io/en/latest/user_guide.html
+
+"""
+from typing import Union, Any
+import numpy as np
+
+
+def get_batch_norm(psi: np.ndarray) -> np.ndarray:
+    """
+    The sum of |psi|^2 along the last axis, without
+    making a full size temporary array.
+    """
+    if hasattr(np, 'vecdot'):
+        return np.vecdot(psi, psi).real
+    return np.einsum('...i,...i->...', np.conj(psi), psi).real
+
+
+def _get_batch_shape(psi: np.ndarray,
+                     grid: np.ndarray) -> Union[tuple, None]:
+    # The shape of the leading ensemble axes of psi, or None if psi does
+    # not end with the full shape of the grid, or is not contiguous.
+    batch_ndim = psi.ndim - grid.ndim
+    if batch_ndim < 0 or psi.shape[batch_ndim:] != grid.shape or \
+            not psi.flags.c_contiguous:
+        return None
+    return psi.shape[:batch_ndim]
+
+
+class KernelBackend:
+    """
+    Base class for the kernel backends.
+    This uses numpy.
+    """
+    name = 'numpy'
+
+    def multiply(self, psi: np.ndarray, factor: np.ndarray) -> None:
+        """
+        Multiply psi by factor in place.
+        """
+        psi *= factor
+
+    def kick(self, psi: np.ndarray, exp_potential: np.ndarray,
+             phase: complex = None, coefficient: Any = 1.0,
+             power: float = 1.0, nonlinear_first: bool = False,
+             norm: bool = False) -> Union[np.ndarray, float, None]:
+        """
+        Multiply psi in place by exp_potential, which has the shape of
+        the grid, and then by the nonlinear phase
+        exp(phase*coefficient*|psi|^(2 power)) if phase is given, or
+        by the nonlinear phase first if nonlinear_first is True.
+        The coefficient is a number or an array with the shape of the
+        grid. If norm is True this returns the sum of |psi|^2 after the
+        kick, over the spatial axes of each wavefunction if psi has
+        leading ensemble axes, and otherwise it returns None.
+        """
+        if phase is not None and nonlinear_first:
+            self._nonlinear(psi, phase, coefficient, power)
+        psi *= exp_potential
+        if phase is not None and not nonlinear_first:
+            self._nonlinear(psi, phase, coefficient, power)
+        if norm:
+            return self.get_norm(psi, exp_potential.ndim)
+        return None
+
+    def get_norm(self, psi: np.ndarray,
+                 ndim: int) -> Union[np.ndarray, float]:
+        """
+        The sum of |psi|^2 over its last ndim axes.
+        """
+        if psi.ndim == ndim:
+            return np.vdot(psi, psi).real
+        batch_shape = psi.shape[:psi.ndim - ndim]
+        return get_batch_norm(psi.reshape(batch_shape + (-1, )))
+
+    def _nonlinear(self, psi: np.ndarray, phase: complex,
+                   coefficient: Any, power: float) -> None:
+        density = psi.real**2 + psi.imag**2 if np.iscomplexobj(psi) \
+            else psi**2
+        if power != 1.0:
+            density **= power
+        if np.ndim(coefficient):
+            psi *= np.exp(phase*(density*coefficient))
+        else:
+            psi *= np.exp((phase*coefficient)*density)
+
+
+class NumpyKernelBackend(KernelBackend):
+    """
+    Kicks using numpy.
+    """
+    name = 'numpy'
+
+
+class NumbaKernelBackend(KernelBackend):
+    """
+    Fused kicks using Numba, in parallel over threads.
+    """
+    name = 'numba'
+
+    def __init__(self):
+        try:
+            import numba
+        except ImportError as e:
+            raise ImportError('The numba kernel backend requires '
+                              'the Numba package.') from e
+        self._kick, self._multiply = _get_numba_kernels(numba)
+
+    def multiply(self, psi: np.ndarray, factor: np.ndarray) -> None:
+        batch_shape = _get_batch_shape(psi, factor)
+        # A real factor of the same precision as psi can be used too.
+        if batch_shape is None or \
+                factor.dtype not in (psi.dtype, psi.real.dtype):
+            psi *= factor
+            return
+        self._multiply(psi.reshape(-1, factor.size), factor.reshape(-1))
+
+    def kick(self, psi: np.ndarray, exp_potential: np.ndarray,
+             phase: complex = None, coefficient: Any = 1.0,
+             power: float = 1.0, nonlinear_first: bool = False,
+             norm: bool = False) -> Union[np.ndarray, float, None]:
+        batch_shape = _get_batch_shape(psi, exp_potential)
+        g = np.asarray(coefficient).reshape(-1)
+        if batch_shape is None or g.size not in (1, exp_potential.size):
+            return KernelBackend.kick(self, psi, exp_potential, phase,
+                                      coefficient, power,
+                                      nonlinear_first, norm)
+        n_batch = int(np.prod(batch_shape))
+        norms = np.empty(n_batch)
+        self._kick(psi.reshape(n_batch, -1), exp_potential.reshape(-1),
+                   _to_scalar(psi, 0.0 if phase is None else phase),
+                   g, float(power), phase is not None,
+                   nonlinear_first, norms)
+        if not norm:
+            return None
+        return norms[0] if len(batch_shape) == 0 else \
+            norms.reshape(batch_shape)
+
+
+class NumexprKernelBackend(KernelBackend):
+    """
+    Fused kicks using numexpr, which is multithreaded.
+    """
+    name = 'numexpr'
+
+    def __init__(self):
+        try:
+            import numexpr
+        except ImportError as e:
+            raise ImportError('The numexpr kernel backend requires '
+                              'the numexpr package.') from e
+        self._numexpr = numexpr
+
+    def multiply(self, psi: np.ndarray, factor: np.ndarray) -> None:
+        if _get_batch_shape(psi, factor) is None:
+            psi *= factor
+            return
+        self._numexpr.evaluate('psi*factor', out=psi, casting='same_kind',
+                               local_dict={'psi': psi, 'factor': factor})
+
+    def kick(self, psi: np.ndarray, exp_potential: np.ndarray,
+             phase: complex = None, coefficient: Any = 1.0,
+             power: float = 1.0, nonlinear_first: bool = False,
+             norm: bool = False) -> Union[np.ndarray, float, None]:
+        batch_shape = _get_batch_shape(psi, exp_potential)
+        if batch_shape is None:
+            return KernelBackend.kick(self, psi, exp_potential, phase,
+                                      coefficient, power,
+                                      nonlinear_first, norm)
+        if phase is None:
+            expression = 'psi*v'
+        else:
+            # The density after the potential kick is |v|^2 times
+            # the density before it.
+            if not np.iscomplexobj(psi):
+                density = 'psi**2' if nonlinear_first else 'psi**2*v**2'
+            elif nonlinear_first:
+                density = 'real(psi)**2 + imag(psi)**2'
+            else:
+                density = '(real(psi)**2 + imag(psi)**2)' \
+                    '*(real(v)**2 + imag(v)**2)'
+            density = '(%s)**p' % density if power != 1.0 \
+                else '(%s)' % density
+            expression = 'psi*v*exp(phase*g*%s)' % density
+        self._numexpr.evaluate(expression, out=psi, casting='same_kind',
+                               local_dict={'psi': psi, 'v': exp_potential,
+                                           'phase': _to_scalar(
+                                               psi, 0.0 if phase is None
+                                               else phase),
+                                           'g': coefficient,
+                                           'p': float(power)})
+        if not norm:
+            return None
+        flat = psi.reshape(-1, exp_potential.size)
+        norms = self._numexpr.evaluate(
+            'sum(real(psi)**2 + imag(psi)**2, axis=1)'
+            if np.iscomplexobj(psi) else 'sum(psi**2, axis=1)',
+            local_dict={'psi': flat})
+        return norms[0] if len(batch_shape) == 0 else \
+            norms.reshape(batch_shape)
+
+
+def _to_scalar(psi: np.ndarray, value: complex) -> Union[complex, float]:
+    # A double precision scalar that is complex if psi is,
+    # and real otherwise.
+    if np.iscomplexobj(psi):
+        return np.complex128(value)
+    return np.float64(np.real(value))
+
+
+_NUMBA_KERNELS = None
+
+
+def _get_numba_kernels(numba: Any) -> tuple:
+    # The kernels are only compiled once for each combination
+    # of argument types, and are shared between instances.
+    global _NUMBA_KERNELS
+    if _NUMBA_KERNELS is not None:
+        return _NUMBA_KERNELS
+
+    @numba.njit(parallel=True)
+    def kick(psi, v, phase, coefficient, power, nonlinear,
+             nonlinear_first, norms):
+        n_batch, n = psi.shape
+        per_point = coefficient.shape[0] > 1
+        for b in range(n_batch):
+            total = 0.0
+            for i in numba.prange(n):
+                z = psi[b, i]
+                g = coefficient[i] if per_point else coefficient[0]
+                if nonlinear and nonlinear_first:
+                    density = z.real*z.real + z.imag*z.imag
+                    if power != 1.0:
+                        density = density**power
+                    z = z*np.exp(phase*g*density)
+                z = z*v[i]
+                if nonlinear and not nonlinear_first:
+                    density = z.real*z.real + z.imag*z.imag
+                    if power != 1.0:
+                        density = density**power
+                    z = z*np.exp(phase*g*density)
+                psi[b, i] = z
+                total += z.real*z.real + z.imag*z.imag
+            norms[b] = total
+
+    @numba.njit(parallel=True)
+    def multiply(psi, factor):
+        n_batch, n = psi.shape
+        for b in range(n_batch):
+            for i in numba.prange(n):
+                psi[b, i] *= factor[i]
+
+    _NUMBA_KERNELS = (kick, multiply)
+    return _NUMBA_KERNELS
+
+
+KERNEL_BACKENDS = {'numpy': NumpyKernelBackend,
+                   'numba': NumbaKernelBackend,
+                   'numexpr': NumexprKernelBackend}
+
+
+def get_kernel_backend(backend: Union[str, KernelBackend] = None,
+                       **kw) -> KernelBackend:
+    """
+    Get a kernel backend from its name, where any keyword arguments are
+    passed to its constructor. If backend is already a KernelBackend
+    instance it is returned as is, and if it is None the numpy backend
+    is returned.
+    """
+    if backend is None:
+        return NumpyKernelBackend()
+    if isinstance(backend, KernelBackend):
+        return backend
+    if backend not in KERNEL_BACKENDS:
+        raise KeyError('Unknown kernel backend %s. Choose one of: %s.'
+                       % (backend, ', '.join(KERNEL_BACKENDS.keys())))
+    return KERNEL_BACKENDS[backend](**kw)
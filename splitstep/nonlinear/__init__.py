@@ -1,3 +1,4 @@
 from .nonlinear_splitstep import NonlinearSplitStepMethod
 from .nonlinear_splitstep import CoupledTwoSystemNonlinearSplitStepMethod
+from .nonlinear_splitstep import CoupledNonlinearSplitStepMethod
 
@@ -1,7 +1,38 @@
 from .. import SplitStepMethod
+from ..splitstep import get_grid_axes
 import numpy as np
-from typing import Union, Callable, Tuple
+from typing import Union, Callable, Tuple, Any, Dict, List
 import scipy.constants as const
+import scipy.linalg
+
+
+# The power of |psi|^2 in each of the named nonlinear terms
+# g|psi|^(2 power).
+NONLINEARITY_POWERS: Dict[str, float] = {'cubic': 1.0, 'quintic': 2.0}
+
+
+def _no_nonlinear_term(psi: np.ndarray, c: float = 1.0) -> np.ndarray:
+    # A top level function rather than a lambda,
+    # so that the solvers can be pickled.
+    return psi
+
+
+def _get_power(power: Union[str, float]) -> float:
+    if isinstance(power, str):
+        if power not in NONLINEARITY_POWERS:
+            raise KeyError('Unknown nonlinearity %s. Choose one of: %s.'
+                           % (power, ', '.join(NONLINEARITY_POWERS.keys())))
+        return NONLINEARITY_POWERS[power]
+    return float(power)
+
+
+def _get_coefficient(g: Union[float, np.ndarray],
+                     shape: Tuple[int, ...]) -> Union[float, np.ndarray]:
+    # Arrays are given the shape of the grid, so that
+    # the kernel backends can index them point by point.
+    if np.ndim(g) > 0:
+        return np.ascontiguousarray(np.broadcast_to(g, shape))
+    return g
 
 
 class NonlinearSplitStepMethod(SplitStepMethod):
@@ -17,40 +48,151 @@ class NonlinearSplitStepMethod(SplitStepMethod):
       Comput. Phys. Commun., Vol. 184, pp. 2621-2633, 2013.
       https://arxiv.org/pdf/1305.1093
 
+    With a splitting scheme other than Strang splitting, each step is
+    made of substeps of a fraction c of the timestep, and the nonlinear
+    term is called as nonlinear(psi, c) so that it can scale
+    its phase by c.
+
+    A nonlinear term g|psi|^(2 power) can also be set with
+    set_power_nonlinearity, which is done by the kernel backend in the
+    same pass over the wavefunction as the potential half step.
+
+    With real=True the wavefunction is real, as for SplitStepMethod,
+    so a nonlinear term set with set_nonlinear_term must return
+    a real array.
+
     """
-    def __init__(self, potential, dimensions, timestep):
-        SplitStepMethod.__init__(self, potential, dimensions, timestep)
-        self._nonlinear = lambda psi: psi
+    _profiled_methods = dict(SplitStepMethod._profiled_methods,
+                             nonlinear=('_apply_nonlinear',
+                                        '_nonlinear_potential_step'))
+
+    def __init__(self, potential, dimensions, timestep,
+                 dtype=np.complex128, separable_kinetic=False, real=False):
+        SplitStepMethod.__init__(self, potential, dimensions, timestep,
+                                 dtype, separable_kinetic, real)
+        self._nonlinear = _no_nonlinear_term
+        self._nonlinear_coefficient = None
+        self._nonlinear_power = 1.0
 
     def __call__(self, psi: np.ndarray) -> np.ndarray:
         """
         Step the wavefunction in time.
         """
-        psi = self._nonlinear(psi)
-        psi_p = np.fft.fftn(psi*self._exp_potential)
-        psi_p = psi_p*self._exp_kinetic
-        psi = np.fft.ifftn(psi_p)*self._exp_potential
-        psi = self._nonlinear(psi)
+        if len(self._scheme) > 1 or self._nonlinear_coefficient is not None:
+            return self.step_inplace(self._copy_wavefunction(psi))
+        return self._finish_step(np.multiply(
+            self._nonlinear(np.real(psi) if self._real else psi),
+            self._exp_potential, dtype=self._state_dtype))
+
+    def step_inplace(self, psi: np.ndarray) -> np.ndarray:
+        """
+        Step the wavefunction in time, overwriting psi with the result.
+        """
+        if len(self._scheme) > 1:
+            return self._composed_step(psi)
+        self._kick(psi, nonlinear_first=True)
+        return self._finish_step(psi)
+
+    def _composed_step(self, psi: np.ndarray) -> np.ndarray:
+        # A whole Strang step for each substep of the splitting scheme.
+        for j, c in enumerate(self._scheme):
+            self._kick(psi, c, nonlinear_first=True)
+            self._kinetic_step(psi, c, j == 0)
+            self._kick(psi, c)
         if self._norm:
-            psi = psi/np.sqrt(np.sum(psi*np.conj(psi)))
+            self._normalize(psi)
+        self._end_step(psi)
         return psi
-    
+
+    def _finish_step(self, psi: np.ndarray) -> np.ndarray:
+        psi = self._kinetic_step(psi)
+        norm = self._kick(psi, norm=self._norm)
+        if self._norm:
+            self._normalize(psi, norm)
+        self._end_step(psi)
+        return psi
+
+    def _evolve_steps(self, psi: np.ndarray, n_steps: int) -> np.ndarray:
+        # The nonlinear term is applied in between the potential
+        # half steps, so these cannot be combined.
+        for _ in range(n_steps):
+            self.step_inplace(psi)
+        return psi
+
+    def _kick(self, psi: np.ndarray, c: float = None,
+              nonlinear_first: bool = False, norm: bool = False) -> Any:
+        # The potential half step for a substep of c*dt, where c is None
+        # for Strang splitting, and the nonlinear term either before or
+        # after it. If norm is True this returns the sum of |psi|^2
+        # after both, or None if it is not known.
+        if self._nonlinear_coefficient is not None:
+            return self._nonlinear_potential_step(
+                psi, 1.0 if c is None else c, nonlinear_first, norm)
+        if nonlinear_first:
+            self._apply_nonlinear(psi, c)
+            return self._potential_step(psi, 1.0 if c is None else c, norm)
+        self._potential_step(psi, 1.0 if c is None else c)
+        self._apply_nonlinear(psi, c)
+        return None
+
+    def _nonlinear_potential_step(self, psi: np.ndarray, c: float,
+                                  nonlinear_first: bool,
+                                  norm: bool) -> Any:
+        phase = -0.25j*c*self._dt/const.hbar
+        return self._kernels.kick(psi, self._get_exp_potential(c),
+                                  np.real(phase) if self._real else phase,
+                                  self._nonlinear_coefficient,
+                                  self._nonlinear_power,
+                                  nonlinear_first, norm)
+
+    def _apply_nonlinear(self, psi: np.ndarray, c: float = None) -> None:
+        psi[...] = self._nonlinear(psi) if c is None else \
+            self._nonlinear(psi, c)
+
     def set_nonlinear_term(self, nonlinear_func: Callable) -> None:
         """
-        Set the nonlinear term.
+        Set the nonlinear term, which is called on the wavefunction before
+        and after each potential half step. With a splitting scheme other
+        than Strang splitting, it must also take the fraction of the
+        timestep as its second argument.
         """
         self._nonlinear = nonlinear_func
+        self._nonlinear_coefficient = None
+
+    def set_power_nonlinearity(self, g: Union[float, np.ndarray],
+                               power: Union[str, float] = 1.0) -> None:
+        """
+        Use the nonlinear term g|psi|^(2 power) in place of a function
+        set with set_nonlinear_term. power is either a number or the name
+        of a term, 'cubic' (power 1, as in the Gross-Pitaevskii
+        equation) or 'quintic' (power 2). Each time the term is applied,
+        psi is multiplied by exp(-0.25j*g*|psi|^(2 power)*dt/hbar) using
+        its current density. This is done in the same pass as the
+        potential half step by the kernel backend, so it is timed as
+        part of the nonlinear phase when profiling. g is a number or an
+        array that broadcasts to the shape of the grid.
+        """
+        self._nonlinear_coefficient = _get_coefficient(g, self.V.shape)
+        self._nonlinear_power = _get_power(power)
 
 
 class CoupledTwoSystemNonlinearSplitStepMethod(SplitStepMethod):
+    _splitting_schemes_supported = False
+    _timestep_attributes = ('_dt', '_exp_potential1', '_exp_potential2',
+                            '_exp_kinetic1', '_exp_kinetic2', '_exp_c')
+    _kinetic_attributes = ('_exp_kinetic1', '_exp_kinetic2')
+    _profiled_methods = dict(SplitStepMethod._profiled_methods,
+                             nonlinear=('_apply_nonlinear',
+                                        '_nonlinear_potential_step'),
+                             coupling=('_coupling_step', ))
     
     def __init__(self, potential, dimensions, timestep, **kw):
         params = {'m1': const.m_e, 'm2': const.m_e,
                   'lambda1': 0.0, 'lambda2': 0.0,
                   'V1': potential, 'V2': potential,
-                  'nonlinear1': lambda psi: psi,
-                  'nonlinear2': lambda psi: psi,
-                  'hbar': const.hbar}
+                  'nonlinear1': _no_nonlinear_term,
+                  'nonlinear2': _no_nonlinear_term,
+                  'hbar': const.hbar, 'dtype': np.complex128}
         for key in kw.keys():
             if key in params:
                 params[key] = kw[key]
@@ -64,6 +206,8 @@ class CoupledTwoSystemNonlinearSplitStepMethod(SplitStepMethod):
         self._V2 = params['V2']
         self._nonlinear1 = params['nonlinear1']
         self._nonlinear2 = params['nonlinear2']
+        self._nonlinear_coefficients = None
+        self._nonlinear_powers = (1.0, 1.0)
         self._hbar = params['hbar']
         self._exp_potential1 = None
         self._exp_potential2 = None
@@ -71,11 +215,20 @@ class CoupledTwoSystemNonlinearSplitStepMethod(SplitStepMethod):
         self._exp_kinetic2 = None
         self._exp_c = None
         SplitStepMethod.__init__(self, potential, dimensions, 
-                                 timestep)
+                                 timestep, params['dtype'])
     
     def set_potential(self, V: np.ndarray, V2: np.ndarray = None) -> None:
+        """
+        Change the potential of the first system, and that of the second
+        system to V2, or to V as well if V2 is not given.
+        """
         self._V1 = V
-        self._V2 = V if not V2 else V2
+        self._V2 = V if V2 is None else V2
+        dt_inv_hbar = self._dt/self._hbar
+        self._exp_potential1 = np.exp(-0.25j*dt_inv_hbar*self._V1
+                                      ).astype(self._dtype)
+        self._exp_potential2 = np.exp(-0.25j*dt_inv_hbar*self._V2
+                                      ).astype(self._dtype)
     
     def set_nonlinear_term(self, nonlinear: Callable, 
                            nonlinear2: Callable = None) -> None:
@@ -84,6 +237,27 @@ class CoupledTwoSystemNonlinearSplitStepMethod(SplitStepMethod):
         """
         self._nonlinear1 = nonlinear
         self._nonlinear2 = nonlinear if not nonlinear2 else nonlinear2
+        self._nonlinear_coefficients = None
+
+    def set_power_nonlinearity(self, g: Union[float, np.ndarray],
+                               power: Union[str, float] = 1.0,
+                               g2: Union[float, np.ndarray] = None,
+                               power2: Union[str, float] = None) -> None:
+        """
+        Use the nonlinear term g|psi1|^(2 power) for the first system
+        and g2|psi2|^(2 power2) for the second, in place of the functions
+        set with set_nonlinear_term, where g2 and power2 are the same as
+        for the first system if they are not given. As for
+        NonlinearSplitStepMethod, power is a number, 'cubic' or
+        'quintic', and the phase of each kick is computed from the
+        current density in the same pass as the potential half step.
+        """
+        g2 = g if g2 is None else g2
+        power2 = power if power2 is None else power2
+        self._nonlinear_coefficients = (
+            _get_coefficient(g, self.V.shape),
+            _get_coefficient(g2, self.V.shape))
+        self._nonlinear_powers = (_get_power(power), _get_power(power2))
     
     def set_timestep(self, timestep: Union[float, np.complex128]) -> None:
         """
@@ -111,13 +285,18 @@ class CoupledTwoSystemNonlinearSplitStepMethod(SplitStepMethod):
         dt_inv_hbar = self._dt/hbar
         I = 1.0j
         cosh, sinh = np.cosh, np.sinh
-        self._exp_potential1 = np.exp(-0.25j*dt_inv_hbar*self._V1)
-        self._exp_potential2 = np.exp(-0.25j*dt_inv_hbar*self._V2)
+        dtype = self._dtype
+        self._exp_potential1 = np.exp(-0.25j*dt_inv_hbar*self._V1
+                                      ).astype(dtype)
+        self._exp_potential2 = np.exp(-0.25j*dt_inv_hbar*self._V2
+                                      ).astype(dtype)
         p = np.meshgrid(*[2.0*np.pi*hbar*np.fft.fftfreq(d)*d/
                           self._dim[i] for i, d in enumerate(self.V.shape)])
         p2 = sum([p_i**2 for p_i in p])
-        self._exp_kinetic1 = np.exp(-0.5j*(self._dt*p2/(2.0*m1*hbar)))
-        self._exp_kinetic2 = np.exp(-0.5j*(self._dt*p2/(2.0*m2*hbar)))
+        self._exp_kinetic1 = np.exp(-0.5j*(self._dt*p2/(2.0*m1*hbar))
+                                    ).astype(dtype)
+        self._exp_kinetic2 = np.exp(-0.5j*(self._dt*p2/(2.0*m2*hbar))
+                                    ).astype(dtype)
         if lambda1 == 0.0 and lambda2 == 0.0:
             e00, e01, e10, e11 = 1.0, 0.0, 0.0, 1.0
             self._exp_c = [[e00, e01], [e10, e11]]
@@ -128,7 +307,8 @@ class CoupledTwoSystemNonlinearSplitStepMethod(SplitStepMethod):
         e10 = -1.0*(lambda1*lambda2)**0.5* \
             sinh(dt*I*(lambda1*lambda2)**0.5/hbar)/lambda1
         e11 = 1.0*cosh(dt*I*(lambda1*lambda2)**0.5/hbar)
-        self._exp_c = [[e00, e01], [e10, e11]]
+        self._exp_c = [[dtype.type(e00), dtype.type(e01)],
+                       [dtype.type(e10), dtype.type(e11)]]
 
 
     def __call__(self, psi1: np.ndarray, 
@@ -136,18 +316,357 @@ class CoupledTwoSystemNonlinearSplitStepMethod(SplitStepMethod):
         """
         Step the wavefunction in time.
         """
-        psi1 = self._nonlinear1(psi1)*self._exp_potential1
-        psi2 = self._nonlinear2(psi2)*self._exp_potential2
-        psi1_p = np.fft.fftn(psi1)
-        psi2_p = np.fft.fftn(psi2)
-        psi1 = np.fft.ifftn(psi1_p*self._exp_kinetic1)
-        psi2 = np.fft.ifftn(psi2_p*self._exp_kinetic2)
-        psi1 = self._nonlinear1(psi1)*self._exp_potential1
-        psi2 = self._nonlinear2(psi2)*self._exp_potential2
-        psi1 = self._exp_c[0][0]*psi1 + self._exp_c[0][1]*psi2
-        psi2 = self._exp_c[1][0]*psi1 + self._exp_c[1][1]*psi2
+        if self._nonlinear_coefficients is not None:
+            return self.step_inplace(*self._copy_wavefunction((psi1, psi2)))
+        psi1 = np.multiply(self._nonlinear1(psi1), self._exp_potential1,
+                           dtype=self._dtype)
+        psi2 = np.multiply(self._nonlinear2(psi2), self._exp_potential2,
+                           dtype=self._dtype)
+        return self._finish_step(psi1, psi2)
+
+    def step_inplace(self, psi1: np.ndarray,
+                     psi2: np.ndarray) -> Tuple[np.ndarray]:
+        """
+        Step the wavefunctions in time, overwriting psi1 and psi2
+        with the result.
+        """
+        self._kick((psi1, psi2))
+        return self._finish_step(psi1, psi2)
+
+    def _finish_step(self, psi1: np.ndarray,
+                     psi2: np.ndarray) -> Tuple[np.ndarray]:
+        for psi in (psi1, psi2):
+            self._fft.fftn(psi, axes=self._axes, out=psi)
+        self._kinetic_multiply((psi1, psi2))
+        for psi in (psi1, psi2):
+            self._fft.ifftn(psi, axes=self._axes, out=psi)
+        self._kick((psi1, psi2))
+        if self._lambda1 != 0.0 or self._lambda2 != 0.0:
+            self._coupling_step(psi1, psi2)
         if self._norm:
-            psi1 = psi1/np.sqrt(np.sum(psi1*np.conj(psi1)))
-            psi2 = psi2/np.sqrt(np.sum(psi2*np.conj(psi2)))
+            self._normalize(psi1)
+            self._normalize(psi2)
+        self._count_steps(1)
         return psi1, psi2
-    
+
+    def _copy_wavefunction(self, psi: Tuple[np.ndarray]
+                           ) -> Tuple[np.ndarray]:
+        return tuple(np.array(psi_i, dtype=self._dtype) for psi_i in psi)
+
+    def _evolve_steps(self, psi: Tuple[np.ndarray],
+                      n_steps: int) -> Tuple[np.ndarray]:
+        # The nonlinear and coupling terms separate the
+        # potential half steps, so these cannot be combined.
+        for _ in range(n_steps):
+            psi = self.step_inplace(*psi)
+        return psi
+
+    def _kinetic_multiply(self, psi: Tuple[np.ndarray],
+                          c: float = 1.0) -> None:
+        psi1, psi2 = psi
+        psi1 *= self._exp_kinetic1
+        psi2 *= self._exp_kinetic2
+
+    def _potential_step(self, psi: Tuple[np.ndarray], c: float = 1.0) -> None:
+        psi1, psi2 = psi
+        psi1 *= self._exp_potential1
+        psi2 *= self._exp_potential2
+
+    def _kick(self, psi: Tuple[np.ndarray]) -> None:
+        # The nonlinear term followed by the potential half step.
+        if self._nonlinear_coefficients is not None:
+            self._nonlinear_potential_step(psi)
+        else:
+            self._apply_nonlinear(psi)
+            self._potential_step(psi)
+
+    def _nonlinear_potential_step(self, psi: Tuple[np.ndarray]) -> None:
+        phase = -0.25j*self._dt/self._hbar
+        for psi_i, exp_potential, g, power in zip(
+                psi, (self._exp_potential1, self._exp_potential2),
+                self._nonlinear_coefficients, self._nonlinear_powers):
+            self._kernels.kick(psi_i, exp_potential, phase, g, power,
+                               nonlinear_first=True)
+
+    def _apply_nonlinear(self, psi: Tuple[np.ndarray]) -> None:
+        psi[0][...] = self._nonlinear1(psi[0])
+        psi[1][...] = self._nonlinear2(psi[1])
+
+    def _coupling_step(self, psi1: np.ndarray, psi2: np.ndarray) -> None:
+        (e00, e01), (e10, e11) = self._exp_c
+        tmp1 = self._get_workspace('coupling1', psi1.shape, psi1.dtype)
+        tmp2 = self._get_workspace('coupling2', psi1.shape, psi1.dtype)
+        np.multiply(e10, psi1, out=tmp1)
+        np.multiply(e01, psi2, out=tmp2)
+        psi1 *= e00
+        psi1 += tmp2
+        psi2 *= e11
+        psi2 += tmp1
+
+
+class CoupledNonlinearSplitStepMethod(SplitStepMethod):
+    """
+    Split-Operator method for N coupled nonlinear Schrodinger equations,
+    such as those of spinor Bose-Einstein condensates with three or five
+    components.
+
+    The wavefunction is a single array where the components are stacked
+    along the first axis, which may be preceded by ensemble axes, so
+    that each Fourier transform is done for all of the components at
+    once over the spatial axes. The potential either has the shape of
+    the grid and is the same for all of the components, or has one
+    potential for each of them stacked the same way. masses is the mass
+    of all of the components, or a sequence with the mass of each.
+
+    coupling is an N x N matrix, or an array of shape (N, N) followed by
+    the shape of the grid for a coupling that depends on position.
+    After the potential half step that ends each step, the components
+    are multiplied by the matrix exp(-1j*coupling*dt/hbar), as for
+    CoupledTwoSystemNonlinearSplitStepMethod, whose lambda1 and lambda2
+    are the coupling [[0, lambda2], [lambda1, 0]]. When normalizing at
+    each step, all of the components are normalized together.
+
+    """
+    _splitting_schemes_supported = False
+    _timestep_attributes = ('_dt', '_exp_potential', '_exp_potential_cache',
+                            '_exp_kinetic', '_exp_kinetic_cache',
+                            '_exp_coupling')
+    _kinetic_attributes = ('_kinetic', '_exp_kinetic')
+    _profiled_methods = dict(SplitStepMethod._profiled_methods,
+                             nonlinear=('_apply_nonlinear',
+                                        '_nonlinear_potential_step',
+                                        '_interaction_step'),
+                             coupling=('_coupling_step', ))
+
+    def __init__(self, potential: np.ndarray,
+                 dimensions: Tuple[float, ...],
+                 timestep: Union[float, np.complex128] = 1e-17,
+                 n_components: int = 2,
+                 masses: Union[float, List[float]] = const.m_e,
+                 coupling: np.ndarray = None,
+                 dtype: np.dtype = np.complex128):
+        self._n_components = n_components
+        self._masses = np.broadcast_to(np.asarray(masses, dtype=np.float64),
+                                       (n_components, ))
+        self._coupling = None
+        self._exp_coupling = None
+        self._nonlinear = _no_nonlinear_term
+        self._nonlinear_coefficient = None
+        self._nonlinear_power = 1.0
+        self._interactions = None
+        potential = np.asarray(potential)
+        if potential.ndim == len(dimensions) + 1:
+            if potential.shape[0] != n_components:
+                raise Exception('There must be one potential '
+                                'for each component.')
+            # The base class only needs a potential with
+            # the shape of the grid.
+            SplitStepMethod.__init__(self, potential[0], dimensions,
+                                     timestep, dtype)
+            self.set_potential(potential)
+        else:
+            SplitStepMethod.__init__(self, potential, dimensions,
+                                     timestep, dtype)
+        if coupling is not None:
+            self.set_coupling(coupling)
+
+    def _get_grid_axes(self) -> List[Tuple[int, int, List[int]]]:
+        return get_grid_axes(self._get_grid_shape())
+
+    def _get_grid_shape(self) -> Tuple[int, ...]:
+        return self.V.shape[self.V.ndim - len(self._dim):]
+
+    def set_timestep(self, timestep: Union[float, np.complex128]) -> None:
+        """
+        Set the timestep. It can be real or complex.
+        """
+        self._dt = timestep
+        self._exp_potential_cache = {}
+        self._exp_kinetic_cache = {}
+        masses = self._masses
+        if np.any(masses != masses[0]):
+            masses = np.reshape(masses, (-1, ) + (1, )*len(self._dim))
+        else:
+            masses = masses[0]
+        kinetic = sum([p_i**2 for p_i in self._get_momenta()])/(2.0*masses)
+        self._kinetic = kinetic.astype(np.finfo(self._dtype).dtype)
+        self._exp_kinetic = np.exp(-0.5j*(self._dt/const.hbar)*kinetic
+                                   ).astype(self._dtype)
+        self._exp_potential = self._get_exp_components()
+        self._exp_coupling = self._get_exp_coupling()
+
+    def set_potential(self, V: np.ndarray) -> None:
+        """
+        Change the potential, which either has the shape of the grid,
+        or is one potential for each component stacked
+        along the first axis.
+        """
+        if V.ndim == len(self._dim) + 1 and V.shape[0] != self._n_components:
+            raise Exception('There must be one potential '
+                            'for each component.')
+        self.V = V
+        self._exp_potential = self._get_exp_components()
+        self._exp_potential_cache = {}
+
+    def set_coupling(self, coupling: np.ndarray) -> None:
+        """
+        Change the coupling between the components, which is an N x N
+        matrix, or has the shape (N, N) followed by the shape
+        of the grid. None removes the coupling.
+        """
+        n = self._n_components
+        if coupling is not None:
+            coupling = np.asarray(coupling)
+            if coupling.shape not in ((n, n),
+                                      (n, n) + self._get_grid_shape()):
+                raise Exception('The coupling must have the shape (%d, %d),'
+                                ' optionally followed by the shape of '
+                                'the grid.' % (n, n))
+        self._coupling = coupling
+        self._exp_coupling = self._get_exp_coupling()
+
+    def _get_exp_components(self) -> np.ndarray:
+        # The potential half step of each component.
+        V = np.broadcast_to(self.V, (self._n_components, )
+                            + self._get_grid_shape())
+        return np.exp(-0.25j*(self._dt/const.hbar)*V).astype(self._dtype)
+
+    def _get_exp_coupling(self) -> Union[np.ndarray, None]:
+        if self._coupling is None:
+            return None
+        n = self._n_components
+        phase = -1.0j*self._dt/const.hbar
+        if self._coupling.ndim == 2:
+            return scipy.linalg.expm(phase*self._coupling
+                                     ).astype(self._dtype)
+        # The exponential of the matrix at each point, which
+        # scipy.linalg.expm does for all of them at once.
+        coupling = np.moveaxis(self._coupling.reshape(n, n, -1), -1, 0)
+        exp_coupling = scipy.linalg.expm(phase*coupling)
+        return np.ascontiguousarray(
+            np.moveaxis(exp_coupling, 0, -1).reshape(self._coupling.shape)
+            ).astype(self._dtype)
+
+    def set_nonlinear_term(self, nonlinear_func: Callable) -> None:
+        """
+        Set the nonlinear term, which is called on the stacked
+        wavefunction before each potential half step.
+        """
+        self._nonlinear = nonlinear_func
+        self._nonlinear_coefficient = None
+        self._interactions = None
+
+    def set_power_nonlinearity(self, g: Union[float, np.ndarray],
+                               power: Union[str, float] = 1.0) -> None:
+        """
+        Use a nonlinear term in place of a function set with
+        set_nonlinear_term, where power is a number, 'cubic' or
+        'quintic', as for NonlinearSplitStepMethod. If g is a number or
+        a sequence with a number for each component, the term of each
+        component is g|psi_i|^(2 power), which is done in the same pass
+        as the potential half step by the kernel backend. If g is an
+        N x N matrix, the term of component i is
+        sum_j g[i, j]|psi_j|^(2 power), so that the components
+        also interact through their densities.
+        """
+        n = self._n_components
+        g = np.asarray(g, dtype=np.float64)
+        if g.shape == (n, n):
+            self._interactions = g
+            self._nonlinear_coefficient = None
+        elif g.ndim == 0 or g.shape == (n, ):
+            self._interactions = None
+            self._nonlinear_coefficient = float(g) if g.ndim == 0 else \
+                _get_coefficient(np.reshape(g, (n, ) + (1, )*len(self._dim)),
+                                 (n, ) + self._get_grid_shape())
+        else:
+            raise Exception('g must be a number, or have the shape (%d, ) '
+                            'or (%d, %d).' % (n, n, n))
+        self._nonlinear_power = _get_power(power)
+
+    def __call__(self, psi: np.ndarray) -> np.ndarray:
+        """
+        Step the wavefunction in time.
+        """
+        return self.step_inplace(self._copy_wavefunction(psi))
+
+    def step_inplace(self, psi: np.ndarray) -> np.ndarray:
+        """
+        Step the wavefunction in time, overwriting psi with the result.
+        """
+        self._kick(psi)
+        return self._finish_step(psi)
+
+    def _finish_step(self, psi: np.ndarray) -> np.ndarray:
+        psi = self._kinetic_step(psi)
+        self._kick(psi)
+        if self._exp_coupling is not None:
+            self._coupling_step(psi)
+        if self._norm:
+            self._normalize(psi)
+        self._count_steps(1)
+        return psi
+
+    def _evolve_steps(self, psi: np.ndarray, n_steps: int) -> np.ndarray:
+        # The nonlinear and coupling terms separate the
+        # potential half steps, so these cannot be combined.
+        for _ in range(n_steps):
+            self.step_inplace(psi)
+        return psi
+
+    def _kick(self, psi: np.ndarray) -> None:
+        # The nonlinear term followed by the potential half step.
+        if self._nonlinear_coefficient is not None:
+            self._nonlinear_potential_step(psi)
+            return
+        if self._interactions is not None:
+            self._interaction_step(psi)
+        else:
+            self._apply_nonlinear(psi)
+        self._potential_step(psi)
+
+    def _nonlinear_potential_step(self, psi: np.ndarray) -> None:
+        self._kernels.kick(psi, self._exp_potential,
+                           -0.25j*self._dt/const.hbar,
+                           self._nonlinear_coefficient,
+                           self._nonlinear_power, nonlinear_first=True)
+
+    def _interaction_step(self, psi: np.ndarray) -> None:
+        n = self._n_components
+        density = self._get_workspace('density', psi.shape,
+                                      np.finfo(self._dtype).dtype)
+        np.abs(psi, out=density)
+        density **= 2.0*self._nonlinear_power
+        # The phase of each component is summed from the densities
+        # of all of them, with one matrix product for the whole grid.
+        density = density.reshape(-1, n, int(np.prod(self._get_grid_shape())))
+        phase = np.matmul((-0.25j*self._dt/const.hbar)*self._interactions,
+                          density)
+        psi *= np.exp(phase, out=phase).reshape(psi.shape)
+
+    def _apply_nonlinear(self, psi: np.ndarray) -> None:
+        psi[...] = self._nonlinear(psi)
+
+    def _coupling_step(self, psi: np.ndarray) -> None:
+        n = self._n_components
+        flat = psi.reshape(-1, n, int(np.prod(self._get_grid_shape())))
+        tmp = self._get_workspace('coupling', flat.shape, psi.dtype)
+        if self._exp_coupling.ndim == 2:
+            np.matmul(self._exp_coupling, flat, out=tmp)
+        else:
+            np.einsum('ijm,bjm->bim',
+                      self._exp_coupling.reshape(n, n, -1), flat, out=tmp)
+        psi[...] = tmp.reshape(psi.shape)
+
+    def _normalize(self, psi: np.ndarray, norm: Any = None) -> np.ndarray:
+        # All of the components are normalized together, since the
+        # coupling moves the population between them.
+        ndim = len(self._axes) + 1
+        if norm is None:
+            norm = self._kernels.get_norm(psi, ndim)
+        if psi.ndim == ndim:
+            psi *= 1.0/np.sqrt(norm)
+            return psi
+        batch_shape = psi.shape[:psi.ndim - ndim]
+        psi *= (1.0/np.sqrt(norm)).reshape(batch_shape + (1, )*ndim)
+        return psi
@@ -0,0 +1,142 @@
+"""
+Expectation values that are measured while a split-step solver
+is stepping the wavefunction.
+
+Every so many steps, the norm, the expected position and momentum
+along each dimension, and the expected kinetic and potential energies
+are recorded. No extra Fourier transforms are done to get these:
+the momentum space quantities come from the momentum space wavefunction
+that the step already computes, and the position space ones from the
+wavefunction at the end of the step. All the sums over the grid are done
+through a density array that is kept between measurements, so that no
+new full-grid arrays are allocated.
+
+Note that the momentum space wavefunction of a step is that of the
+wavefunction after the first potential half step. In real time this
+adds the momentum impulse of that half step, which is of order dt,
+to the expected momentum and kinetic energy.
+
+"""
+from typing import Any, Dict, List
+import numpy as np
+
+
+KEYS = ('steps', 'norm', 'x', 'p', 'kinetic', 'potential', 'energy')
+
+
+class Observables:
+    """
+    Record expectation values of the wavefunction every given number
+    of steps. For an ensemble of wavefunctions each recorded quantity
+    has the ensemble's batch shape, and the expected position and
+    momentum have an extra last axis for the dimensions.
+    Positions are measured from the centre of the grid.
+    """
+
+    def __init__(self, every: int = 1):
+        self.every = every
+        self._records = {key: [] for key in KEYS}
+        self._density = None
+        self._momentum_values = None
+
+    def is_due(self, step: int) -> bool:
+        """
+        Whether the given step is one where the observables are recorded.
+        """
+        return step % self.every == 0
+
+    def measure_momentum(self, solver: Any, psi_p: np.ndarray) -> None:
+        """
+        Measure the momentum space quantities from the
+        unnormalized Fourier transform psi_p of the wavefunction.
+        """
+        density = get_density(psi_p, self._get_density(psi_p))
+        norm = sum_grid(solver, density)
+        p = get_marginal_expectations(solver, density,
+                                      solver._get_momenta())
+        self._momentum_values = (p/norm[..., None],
+                                 get_kinetic_energy(solver, density)/norm)
+
+    def measure_position(self, solver: Any, psi: np.ndarray,
+                         step: int) -> None:
+        """
+        Measure the position space quantities, and add a record for this
+        step together with the last momentum space measurement.
+        """
+        density = get_density(psi, self._get_density(psi))
+        norm = sum_grid(solver, density)
+        x = get_marginal_expectations(solver, density,
+                                      solver._get_positions())
+        potential = dot_grid(solver, density, solver.V)/norm
+        p, kinetic = self._momentum_values
+        for key, value in (('steps', step), ('norm', norm),
+                           ('x', x/norm[..., None]), ('p', p),
+                           ('kinetic', kinetic), ('potential', potential),
+                           ('energy', kinetic + potential)):
+            self._records[key].append(value)
+
+    def get(self) -> Dict[str, np.ndarray]:
+        """
+        Get the recorded values as a dictionary of arrays, where the first
+        axis of each corresponds to the steps at which they were recorded.
+        """
+        return {key: np.array(value) for key, value in self._records.items()}
+
+    def _get_density(self, psi: np.ndarray) -> np.ndarray:
+        dtype = np.finfo(psi.dtype).dtype
+        if self._density is None or self._density.shape != psi.shape \
+                or self._density.dtype != dtype:
+            self._density = np.empty(psi.shape, dtype=dtype)
+        return self._density
+
+
+def get_density(psi: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    |psi|^2, which is written to out if it is given.
+    """
+    out = np.abs(psi, out=out)
+    return np.square(out, out=out)
+
+
+def sum_grid(solver: Any, a: np.ndarray) -> np.ndarray:
+    """
+    Sum over the spatial axes, where the result has the batch shape.
+    """
+    return np.asarray(np.sum(a, axis=solver._axes))
+
+
+def dot_grid(solver: Any, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Sum of a*b over the spatial axes, where b has the shape of the grid.
+    """
+    grid_size = np.size(b)
+    a_flat = a.reshape(a.shape[:a.ndim - len(solver._axes)] + (grid_size, ))
+    return np.asarray(a_flat @ np.ravel(b))
+
+
+def get_marginal_expectations(solver: Any, density: np.ndarray,
+                              values: List[np.ndarray]) -> np.ndarray:
+    """
+    Sum of the density times each of the given values, where each value
+    only varies along one axis of the grid. The results for each value are
+    stacked along the last axis. This reduces the density along all other
+    axes first, so that only arrays the length of that axis are multiplied.
+    """
+    results = []
+    for value in values:
+        axis = int(np.argmax(value.shape))
+        other_axes = tuple([a for a in solver._axes
+                            if a % len(solver._axes) != axis])
+        marginal = np.sum(density, axis=other_axes)
+        results.append(marginal @ np.ravel(value))
+    return np.stack(results, axis=-1)
+
+
+def get_kinetic_energy(solver: Any, density_p: np.ndarray) -> np.ndarray:
+    """
+    Sum of the momentum space density times the kinetic energy.
+    """
+    if solver._kinetic is not None:
+        return dot_grid(solver, density_p, solver._kinetic)
+    return sum([get_marginal_expectations(solver, density_p, [k_i])[..., 0]
+                for k_i in solver._kinetic_factors])
@@ -0,0 +1,87 @@
+"""
+Checking how far a single precision simulation drifts from
+the same simulation done in double precision.
+
+For example, with a potential V on a grid of extent (L, L):
+
+>>> from splitstep import SplitStepMethod
+>>> from splitstep.precision import precision_drift
+>>> U32 = SplitStepMethod(V, (L, L), DT, dtype=np.complex64)
+>>> U64 = SplitStepMethod(V, (L, L), DT, dtype=np.complex128)
+>>> drift = precision_drift(U32, U64, psi, 1000, every=100,
+>>>                         energy=U64.get_expected_energy)
+>>> print(drift['norm_single'] - drift['norm_double'])
+>>> print(drift['energy_single'] - drift['energy_double'])
+>>> print(drift['difference'])
+
+"""
+from typing import Any, Callable, Dict
+import numpy as np
+
+
+def get_norm(psi: Any) -> float:
+    """
+    The sum of the squared magnitudes of the wavefunction. If it has
+    several components, given as a sequence of arrays or as the
+    leading axis of an array, these are summed together.
+    """
+    if isinstance(psi, (list, tuple)):
+        return sum([get_norm(psi_i) for psi_i in psi])
+    psi = np.asarray(psi, dtype=np.complex128)
+    return np.vdot(psi, psi).real
+
+
+def precision_drift(single: Any, double: Any, psi: Any, n_steps: int,
+                    every: int = 1,
+                    energy: Callable[[Any], float] = None
+                    ) -> Dict[str, np.ndarray]:
+    """
+    Step psi n_steps times using both the single precision solver
+    and the double precision one, and record every so many steps the
+    norm of each wavefunction and the relative difference between them.
+    If an energy function is given, such as the get_expected_energy
+    method of the double precision solver, the energy of each
+    wavefunction is recorded as well. The solvers must be otherwise
+    identical, and are stepped using their evolve methods.
+
+    This returns a dictionary of arrays with the keys 'steps',
+    'norm_single', 'norm_double' and 'difference', as well as
+    'energy_single' and 'energy_double' if energy is given.
+    """
+    records = {'single': [], 'double': []}
+
+    def get_recorder(key: str) -> Callable[[Any, int], None]:
+        def record(psi_i: Any, steps: int) -> None:
+            records[key].append(_to_double(psi_i))
+        return record
+
+    single.evolve(psi, n_steps, get_recorder('single'), every)
+    double.evolve(psi, n_steps, get_recorder('double'), every)
+    steps = [min(every*(i + 1), n_steps)
+             for i in range(len(records['double']))]
+    drift = {'steps': np.array(steps),
+             'norm_single': np.array([get_norm(psi_i) for psi_i
+                                      in records['single']]),
+             'norm_double': np.array([get_norm(psi_i) for psi_i
+                                      in records['double']])}
+    drift['difference'] = np.array([
+        np.sqrt(get_norm(_subtract(psi1, psi2))/get_norm(psi2))
+        for psi1, psi2 in zip(records['single'], records['double'])])
+    if energy is not None:
+        drift['energy_single'] = np.array([energy(psi_i) for psi_i
+                                           in records['single']])
+        drift['energy_double'] = np.array([energy(psi_i) for psi_i
+                                           in records['double']])
+    return drift
+
+
+def _to_double(psi: Any) -> Any:
+    if isinstance(psi, (list, tuple)):
+        return type(psi)([_to_double(psi_i) for psi_i in psi])
+    return np.array(psi, dtype=np.complex128)
+
+
+def _subtract(psi1: Any, psi2: Any) -> Any:
+    if isinstance(psi1, (list, tuple)):
+        return [_subtract(a, b) for a, b in zip(psi1, psi2)]
+    return psi1 - psi2
@@ -0,0 +1,113 @@
+"""
+Timing the phases of the steps of a split-step solver.
+
+Profiling is off by default, and then costs nothing: the solvers only
+replace their phase methods and their Fourier transform backend with
+timed versions while it is on. The phases of each solver are listed in
+its _profiled_methods, and include the potential and kinetic steps,
+the nonlinear term, normalization, set_timestep and set_potential,
+as well as the forward and inverse Fourier transforms as 'fft' and
+'ifft'. Some phases are done as part of others, for example
+set_timestep calls set_potential in the relativistic solvers, in which
+case the time of the inner phase is counted in both.
+
+>>> with U.profile() as profiler:
+>>>     psi = U.evolve(psi, 100)
+>>> for phase, record in profiler.get().items():
+>>>     print(phase, record['seconds'], record['calls'])
+
+"""
+from time import perf_counter
+from typing import Any, Callable, Dict
+from .fft_backend import FFTBackend
+
+
+class Profiler:
+    """
+    Accumulate the wall time and the number of calls of each phase.
+    """
+
+    def __init__(self):
+        self._seconds = {}
+        self._calls = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        """
+        Add one call of the phase that took the given number of seconds.
+        """
+        self._seconds[phase] = self._seconds.get(phase, 0.0) + seconds
+        self._calls[phase] = self._calls.get(phase, 0) + 1
+
+    def wrap(self, phase: str, func: Callable) -> Callable:
+        """
+        Get a version of func whose calls are timed as the given phase.
+        """
+        def timed(*args, **kw):
+            t0 = perf_counter()
+            try:
+                return func(*args, **kw)
+            finally:
+                self.add(phase, perf_counter() - t0)
+        return timed
+
+    def get(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get the total seconds and the number of calls of each phase,
+        as a dictionary of dictionaries with the keys 'seconds'
+        and 'calls'.
+        """
+        return {phase: {'seconds': self._seconds[phase],
+                        'calls': self._calls[phase]}
+                for phase in self._seconds}
+
+    def reset(self) -> None:
+        """
+        Clear the accumulated times and calls.
+        """
+        self._seconds = {}
+        self._calls = {}
+
+
+class ProfiledFFTBackend(FFTBackend):
+    """
+    Time the Fourier transforms of another backend.
+    """
+
+    def __init__(self, backend: FFTBackend, profiler: Profiler):
+        self.backend = backend
+        self.name = backend.name
+        self.fftn = profiler.wrap('fft', backend.fftn)
+        self.ifftn = profiler.wrap('ifft', backend.ifftn)
+        self.rfftn = profiler.wrap('fft', backend.rfftn)
+        self.irfftn = profiler.wrap('ifft', backend.irfftn)
+
+
+def enable(solver: Any, profiler: Profiler) -> None:
+    """
+    Time the phases of the solver with the given profiler.
+    """
+    disable(solver)
+    for phase, names in solver._profiled_methods.items():
+        for name in names:
+            setattr(solver, name,
+                    profiler.wrap(phase, getattr(solver, name)))
+    solver._fft = ProfiledFFTBackend(solver._fft, profiler)
+    solver._profiler = profiler
+
+
+def disable(solver: Any) -> None:
+    """
+    Stop timing the phases of the solver.
+    """
+    if solver._profiler is None:
+        return
+    for names in solver._profiled_methods.values():
+        for name in names:
+            # This removes the instance attribute,
+            # which leaves the method of the class.
+            if name in vars(solver):
+                delattr(solver, name)
+    if isinstance(solver._fft, ProfiledFFTBackend):
+        solver._fft = solver._fft.backend
+    solver._profiler = None
+
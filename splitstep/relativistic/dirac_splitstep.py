@@ -1,6 +1,7 @@
 from .. import SplitStepMethod
+from ..splitstep import get_grid_axes
 import numpy as np
-from typing import Tuple, Union, List, Dict
+from typing import Tuple, Union, List, Dict, Callable
 
 class DiracSplitStepMethod(SplitStepMethod):
     """
@@ -25,25 +26,80 @@ class DiracSplitStepMethod(SplitStepMethod):
 
     https://en.wikipedia.org/wiki/Hartree_atomic_units
 
+    If closed_form_momentum is True, the momentum step
+    exp(-1j*theta*(alpha.p + beta*m*c)), where theta = 0.5*c*dt/hbar,
+    is applied through its closed form
+    cos(theta*omega)*I - 1j*sin(theta*omega)/omega*(alpha.p + beta*m*c),
+    where omega = sqrt(p^2 + (m*c)^2). Only the grids of
+    cos(theta*omega) +/- m*c*s and s = -1j*sin(theta*omega)/omega
+    are stored, instead of the matrices of the eigenvectors and of the
+    step itself, and the alpha and beta matrices are applied
+    term by term. This uses far less memory and fewer operations.
+
+    The potential half step with a vector potential A is applied the
+    same way, as exp(-0.25j*V*dt/hbar) times
+    cos(phi*|A|)*I + 1j*sin(phi*|A|)*alpha.A/|A|, where phi = 0.25*dt/hbar.
+    A vector potential that changes in time as envelope(t)*A(x) is set
+    with set_time_dependent_vector_potential.
+
+    The spinor is an array of shape (4, ...) with its four components
+    first, followed by the grid. If spinor_last is True it is instead of
+    shape (..., 4), with the components last, where the 4x4 matrices of
+    the steps are stored as arrays of shape (..., 4, 4), so that their
+    products at each point are contiguous small matrix products.
+    In either layout the components are Fourier transformed together,
+    by a single transform over the spatial axes.
+
     """
+    _timestep_attributes = ('_dt', '_exp_e', '_exp_p', '_exp_p_cache',
+                            '_exp_V', '_exp_V_full', '_exp_V_cache',
+                            '_exp_V_factors')
+    _kinetic_attributes = ('_omega', '_u', '_u_dagger', '_exp_e', '_exp_p')
+    _profiled_methods = {'potential': ('_exp_potential_inplace', ),
+                         'kinetic': ('_momentum_matrix_inplace', ),
+                         'set_timestep': ('set_timestep', ),
+                         'set_potential': ('set_potential', )}
 
     def __init__(self, potential: np.ndarray,
                  dimensions: Tuple[float, ...],
                  timestep: Union[float, np.complex128] = 1.0,
                  m: float = 1.0,
                  vector_potential: List[np.ndarray] = None,
-                 units: Dict[str, float] = None):
+                 units: Dict[str, float] = None,
+                 dtype: np.dtype = np.complex128,
+                 closed_form_momentum: bool = False,
+                 spinor_last: bool = False):
+        self._closed_form_momentum = closed_form_momentum
+        self._spinor_last = spinor_last
+        n_dims = len(potential.shape)
+        self._spinor_axes = tuple(range(n_dims)) if spinor_last else \
+            tuple(range(1, n_dims + 1))
+        self._p = None
+        self._u = None
+        self._u_dagger = None
+        self._exp_e = None
         self._exp_p = None
         self._exp_V = None
+        self._exp_V_full = None
+        self._omega = None
+        self._exp_p_cache = {}
+        self._exp_V_cache = {}
+        self._exp_V_factors = {}
         self._m = m
         self._vector_potential = vector_potential
+        self._vector_terms = None
+        self._envelope = None
         self.use_one_matrix_for_momentum_step = True
         self.C = units['c'] if units and 'c' in units.keys() else 137.036
         self.HBAR = (units['hbar'] if units and 'hbar' 
                         in units.keys() else 1.0)
-        SplitStepMethod.__init__(self, potential, dimensions, timestep)
+        SplitStepMethod.__init__(self, potential, dimensions, timestep,
+                                 dtype)
 
     def set_timestep(self, timestep: Union[float, np.complex128]) -> None:
+        if self._closed_form_momentum:
+            self._set_closed_form_timestep(timestep)
+            return
         p_list = []
         for i, d in enumerate(self.V.shape):
             freq = np.pi*np.fft.fftfreq(d)
@@ -59,6 +115,8 @@ class DiracSplitStepMethod(SplitStepMethod):
         mc = self._m*self.C
         cdt_hbar = self.C*dt/self.HBAR
         omega = np.sqrt(mc*mc + p2)
+        self._omega = omega
+        self._exp_p_cache = {}
         den1 = p*np.sqrt((mc - omega)**2 + p2)
         den2 = p*np.sqrt((mc + omega)**2 + p2)
         # Originally, the matrix involving the momentum and mass terms was
@@ -90,73 +148,343 @@ class DiracSplitStepMethod(SplitStepMethod):
         u = np.array(u).reshape([4, 4] + list(self.V.shape))
         ind = [i for i in range(len(self.V.shape) + 2)]
         ind[0], ind[1] = ind[1], ind[0]
-        u_dagger = np.conj(np.transpose(u, ind))
+        u_dagger = self._to_layout(np.conj(np.transpose(u, ind)))
+        u = self._to_layout(u)
+        self._u = u.astype(self._dtype)
+        self._u_dagger = u_dagger.astype(self._dtype)
+        self._exp_e, self._exp_p = self._make_exp_p(cdt_hbar, u, u_dagger)
+        self.set_potential(self.V, self._vector_potential)
+
+    def _set_closed_form_timestep(self, timestep: Union[float,
+                                                        np.complex128]
+                                  ) -> None:
+        # The momenta only broadcast along their own axes, and they
+        # are stored as pz, px - 1j*py and px + 1j*py.
+        p = [np.zeros([1]*len(self.V.shape)) for _ in range(3)]
+        for i, d, shape in get_grid_axes(self.V.shape):
+            p[i] = np.reshape(2.0*np.pi*np.fft.fftfreq(d)*d/self._dim[i],
+                              shape)
+        px, py, pz = p
+        self._p = tuple(p_i.astype(self._dtype)
+                        for p_i in (pz, px - 1.0j*py, px + 1.0j*py))
+        self._dt = np.complex128(timestep)
+        mc = self._m*self.C
+        self._omega = np.sqrt(mc*mc + px**2 + py**2 + pz**2)
+        self._exp_p_cache = {}
+        self._u, self._u_dagger = None, None
+        self._exp_e, self._exp_p = self._make_exp_p(
+            self.C*self._dt/self.HBAR, None, None)
+        self.set_potential(self.V, self._vector_potential)
+
+    def _make_closed_form_exp_p(self, cdt_hbar: np.complex128
+                                ) -> Tuple[np.ndarray, ...]:
+        # The diagonal terms cos(theta*omega) + m*c*s for the upper
+        # components and cos(theta*omega) - m*c*s for the lower ones,
+        # and s = -1j*sin(theta*omega)/omega, which multiplies alpha.p.
+        # np.sinc keeps s finite where omega is 0, for a massless
+        # particle at rest.
+        theta = 0.5*cdt_hbar
+        mc = self._m*self.C
+        cos = np.cos(theta*self._omega)
+        s = -1.0j*theta*np.sinc(theta*self._omega/np.pi)
+        return ((cos + mc*s).astype(self._dtype),
+                (cos - mc*s).astype(self._dtype),
+                s.astype(self._dtype))
+
+    def _make_exp_p(self, cdt_hbar: np.complex128, u: np.ndarray,
+                    u_dagger: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # The diagonal eigenvalue matrix of the momentum step
+        # and the momentum step itself, for a step of c*dt/hbar.
+        # With the closed form there is no eigenvalue matrix, and the
+        # step is given by the terms of _make_closed_form_exp_p.
+        if self._closed_form_momentum:
+            return None, self._make_closed_form_exp_p(cdt_hbar)
+        omega = self._omega
+        zeros = np.zeros(omega.shape, dtype=np.complex128)
         e1 = np.exp(0.5j*omega*cdt_hbar)
         e2 = np.exp(-0.5j*omega*cdt_hbar)
-        exp_e = np.array([[e1, zeros, zeros, zeros],
-                          [zeros, e1, zeros, zeros],
-                          [zeros, zeros, e2, zeros],
-                          [zeros, zeros, zeros, e2]])
-        exp_e_u = np.einsum('ij...,jk...->ik...', exp_e, u_dagger)
-        self._u = u
-        self._u_dagger = u_dagger
-        self._exp_e = exp_e
-        self._exp_p = np.einsum('ij...,jk...->ik...', u, exp_e_u)
-        self.set_potential(self.V, self._vector_potential)
+        exp_e = self._to_layout(np.array([[e1, zeros, zeros, zeros],
+                                          [zeros, e1, zeros, zeros],
+                                          [zeros, zeros, e2, zeros],
+                                          [zeros, zeros, zeros, e2]]))
+        exp_e_u = self._matmul(exp_e, u_dagger)
+        return (exp_e.astype(self._dtype),
+                self._matmul(u, exp_e_u).astype(self._dtype))
+
+    def _to_layout(self, matrix: np.ndarray) -> np.ndarray:
+        # A 4x4 matrix of shape (4, 4, ...) in the layout of the spinor.
+        if self._spinor_last:
+            return np.ascontiguousarray(np.moveaxis(matrix, (0, 1),
+                                                    (-2, -1)))
+        return matrix
+
+    def _matmul(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        # The product of the 4x4 matrices a and b at each point.
+        if self._spinor_last:
+            return np.matmul(a, b)
+        return np.einsum('ij...,jk...->ik...', a, b)
+
+    def _apply_matrix(self, matrix: np.ndarray, psi: np.ndarray,
+                      out: np.ndarray) -> None:
+        # out = matrix*psi at each point, where out is not psi.
+        if self._spinor_last:
+            np.einsum('...ij,...j->...i', matrix, psi, out=out)
+        else:
+            np.einsum('ij...,j...->i...', matrix, psi, out=out)
+
+    def _component(self, psi: np.ndarray, i: int) -> np.ndarray:
+        return psi[..., i] if self._spinor_last else psi[i]
 
     def set_potential(self, potential: np.ndarray, 
                       vector_potential: List[np.ndarray] = None) -> None:
         if self.V is not potential:
             self.V = potential
-        if self._vector_potential is not vector_potential:
+        if self._vector_potential is not vector_potential or \
+                self._vector_terms is None:
+            # A new vector potential is constant
+            # unless it is given an envelope.
             self._vector_potential = vector_potential
-        V = potential
-        dt = np.complex128(self._dt)
-        m = np.complex128(self._m)
-        if vector_potential:
-            exp_vec = get_exp_vector_potential(dt, self._vector_potential, m,
-                                               hbar=self.HBAR)
-            exp_A_V = [[0.0, 0.0, 0.0, 0.0] for i in range(4)]
-            for i in range(4):
-                for j in range(4):
-                    exp_A_V[i][j] = exp_vec[i][j]*np.exp(-0.25*1.0j*V*dt)
-            self._exp_V = np.array(exp_A_V)
+            self._vector_terms = self._make_vector_terms()
+            self._envelope = None
+        self._exp_V_full = None
+        self._exp_V_cache = {}
+        self._exp_V_factors = {}
+        self._exp_V = self._make_exp_V(np.complex128(self._dt))
+
+    def set_time_dependent_vector_potential(
+            self, vector_potential: List[np.ndarray],
+            envelope: Callable[[float], float]) -> None:
+        """
+        Use the vector potential envelope(t)*vector_potential, where
+        vector_potential is the fixed spatial profile [Ax, Ay, Az] and
+        envelope is a function of the time t of the solver.
+        The terms of the profile and the factor exp(-1j*phi*V) of each
+        substep are made once, so that each potential half step only
+        evaluates the cosine and sine of envelope(t)*phi*|A| at the time
+        of that half step, into arrays that are kept between steps.
+        An envelope of None makes the vector potential constant again.
+        """
+        self.set_potential(self.V, vector_potential)
+        self._envelope = envelope
+
+    def _make_vector_terms(self) -> Union[Tuple[np.ndarray, ...], None]:
+        # The terms of alpha.A/|A| that mix the upper and lower
+        # components, Az, Ax - 1j*Ay and Ax + 1j*Ay divided by |A|,
+        # followed by |A|. The terms are 0 where A is 0.
+        if self._vector_potential is None:
+            return None
+        Ax, Ay, Az = np.broadcast_arrays(
+            *[np.asarray(A_i, dtype=np.complex128)
+              for A_i in self._vector_potential])
+        norm = np.sqrt(Ax*Ax + Ay*Ay + Az*Az)
+        if np.all(np.imag(norm) == 0.0):
+            norm = np.real(norm)
+        terms = [np.divide(A_i, norm, out=np.zeros_like(A_i),
+                           where=(norm != 0.0)).astype(self._dtype)
+                 for A_i in (Az, Ax - 1.0j*Ay, Ax + 1.0j*Ay)]
+        return tuple(terms) + (norm, )
+
+    def _get_phi(self, c: float) -> Union[float, complex]:
+        # phi = 0.25*c*dt/hbar, which is real for a real timestep.
+        phi = 0.25*c*np.complex128(self._dt)/self.HBAR
+        return phi.real if phi.imag == 0.0 else phi
+
+    def _make_exp_V(self, dt: np.complex128) -> np.ndarray:
+        # The potential half step for a step of dt, which with a vector
+        # potential is given by the diagonal and alpha.A/|A| terms of
+        # its closed form.
+        V = self.V
+        if self._vector_terms is not None:
+            phi = 0.25*dt/self.HBAR
+            exp_V = np.exp(-1.0j*phi*V)
+            A = self._vector_terms[3]
+            return ((exp_V*np.cos(phi*A)).astype(self._dtype),
+                    (1.0j*exp_V*np.sin(phi*A)).astype(self._dtype))
         else:
             dt_hbar = dt/self.HBAR
             # exp_V = [[np.exp(-0.25*1.0j*V*dt_hbar), zeros, zeros, zeros], 
             #          [zeros, np.exp(-0.25*1.0j*V*dt_hbar), zeros, zeros], 
             #          [zeros, zeros, np.exp(-0.25*1.0j*V*dt_hbar), zeros], 
             #          [zeros, zeros, zeros, np.exp(-0.25*1.0j*V*dt_hbar)]]
+            if self._spinor_last:
+                # This broadcasts along the components.
+                return np.exp(-0.25*1.0j*V*dt_hbar
+                              )[..., None].astype(self._dtype)
             exp_V = [np.exp(-0.25*1.0j*V*dt_hbar) for i in range(4)]
-            self._exp_V = np.array(exp_V)
-
-    def _exp_p_call(self, psi: np.ndarray) -> np.ndarray:
-        if self.use_one_matrix_for_momentum_step:
-            psi = np.einsum('ij...,j...->i...', self._exp_p, psi)
-            return psi 
-        psi = np.einsum('ij...,j...->i...', self._u_dagger, psi)
-        psi = np.einsum('ij...,j...->i...', self._exp_e, psi)
-        psi = np.einsum('ij...,j...->i...', self._u, psi)
-        return psi
+            return np.array(exp_V).astype(self._dtype)
 
-    def _exp_potential_call(self, psi: np.ndarray) -> np.ndarray:
-        if self._vector_potential is not None:
-            return np.einsum('ij...,j...->i...', self._exp_V, psi)
-        else:
-            for i in range(4):
-                psi[i] *= self._exp_V[i]
-            return psi
+    def set_splitting_scheme(self, scheme: Union[str, List[float]]) -> None:
+        SplitStepMethod.set_splitting_scheme(self, scheme)
+        self._exp_p_cache = {}
+        self._exp_V_cache = {}
+
+    def _get_exp_p(self, c: float) -> Tuple[np.ndarray, np.ndarray]:
+        # The eigenvalue matrix of the momentum step and the momentum
+        # step itself for a substep of c*dt.
+        if c == 1.0:
+            return self._exp_e, self._exp_p
+        if c not in self._exp_p_cache:
+            self._exp_p_cache[c] = self._make_exp_p(
+                self.C*c*np.complex128(self._dt)/self.HBAR,
+                self._u, self._u_dagger)
+        return self._exp_p_cache[c]
+
+    def _get_exp_V(self, c: float, t: float = None) -> np.ndarray:
+        # The potential half step for a substep of c*dt, which is
+        # remade for each step at the time t if the vector potential
+        # changes in time.
+        if self._envelope is not None:
+            return self._make_enveloped_exp_V(c, self._envelope(np.real(t)))
+        if c == 1.0:
+            return self._exp_V
+        if c == 2.0:
+            return self._get_exp_V_full()
+        if c not in self._exp_V_cache:
+            self._exp_V_cache[c] = self._make_exp_V(c*np.complex128(self._dt))
+        return self._exp_V_cache[c]
+
+    def _make_enveloped_exp_V(self, c: float,
+                              envelope: float) -> Tuple[np.ndarray, ...]:
+        # The potential half step for a substep of c*dt with the vector
+        # potential scaled by envelope. Only the cosine and sine of
+        # envelope*phi*|A| are computed here, and the result is written
+        # into workspace arrays, which the next call overwrites.
+        phi = self._get_phi(c)
+        if c not in self._exp_V_factors:
+            self._exp_V_factors[c] = np.exp(-1.0j*phi*self.V
+                                            ).astype(self._dtype)
+        exp_V = self._exp_V_factors[c]
+        A = self._vector_terms[3]
+        x = np.multiply(A, envelope*phi, out=self._get_workspace(
+            'vector_phase', A.shape, np.result_type(A, phi)))
+        diag = self._get_workspace('vector_diag', exp_V.shape)
+        s = self._get_workspace('vector_s', exp_V.shape)
+        np.cos(x, out=diag)
+        diag *= exp_V
+        np.sin(x, out=s)
+        s *= exp_V
+        s *= 1.0j
+        return diag, s
 
     def __call__(self, psi: np.ndarray) -> np.ndarray:
-        psi = self._exp_potential_call(psi)
-        psi_p = np.array([np.fft.fftn(psi[i]) for i in range(4)])
-        psi_p = self._exp_p_call(psi_p)
-        psi = np.array([np.fft.ifftn(psi_p[i]) for i in range(4)])
-        psi = self._exp_potential_call(psi)
-        if self._norm:
-            pass
+        """
+        Step the spinor in time and return the result,
+        leaving psi unchanged.
+        """
+        return self.step_inplace(np.array(psi, dtype=self._dtype))
+
+    def step_inplace(self, psi: np.ndarray) -> np.ndarray:
+        """
+        Step the spinor in time, overwriting psi with the result.
+        Instead of allocating new arrays at each step, the matrix products
+        are done into workspace arrays that are kept between steps.
+        """
+        return self._evolve_steps(psi, 1)
+
+    def _evolve_steps(self, psi: np.ndarray, n_steps: int) -> np.ndarray:
+        # The times of the potential steps are only used
+        # by a vector potential that changes in time.
+        work = self._get_workspace('spinor', psi.shape, psi.dtype)
+        c = self._scheme
+        dt = self._dt
+        self._exp_potential_inplace(psi, work, self._get_exp_V(c[0], self._t))
+        for i in range(n_steps):
+            t = self._t + i*dt
+            for j in range(len(c) - 1):
+                self._momentum_step_inplace(psi, work, c[j])
+                t += c[j]*dt
+                self._exp_potential_inplace(
+                    psi, work, self._get_exp_V(c[j] + c[j + 1], t))
+            self._momentum_step_inplace(psi, work, c[-1])
+            t = self._t + (i + 1)*dt
+            exp_V = self._get_exp_V(c[-1], t) if i == n_steps - 1 else \
+                self._get_exp_V(c[-1] + c[0], t)
+            self._exp_potential_inplace(psi, work, exp_V)
+        self._count_steps(n_steps)
         return psi
 
+    def _momentum_step_inplace(self, psi: np.ndarray,
+                               work: np.ndarray, c: float = 1.0) -> None:
+        # The four components are transformed together
+        # by one transform over the spatial axes.
+        self._fft.fftn(psi, axes=self._spinor_axes, out=psi)
+        self._momentum_matrix_inplace(psi, work, c)
+        self._fft.ifftn(work, axes=self._spinor_axes, out=psi)
+
+    def _momentum_matrix_inplace(self, psi: np.ndarray, work: np.ndarray,
+                                 c: float = 1.0) -> None:
+        # Apply the momentum step to the spinor psi in momentum space,
+        # where the result is left in work.
+        exp_e, exp_p = self._get_exp_p(c)
+        if self._closed_form_momentum:
+            self._apply_closed_form_momentum(psi, work, exp_p)
+        elif self.use_one_matrix_for_momentum_step:
+            self._apply_matrix(exp_p, psi, work)
+        else:
+            self._apply_matrix(self._u_dagger, psi, work)
+            self._apply_matrix(exp_e, work, psi)
+            self._apply_matrix(self._u, psi, work)
+
+    def _apply_closed_form_momentum(self, psi: np.ndarray, work: np.ndarray,
+                                    exp_p: Tuple[np.ndarray, ...]) -> None:
+        # work = (cos(theta*omega) + s*beta*m*c)*psi + s*(alpha.p)*psi.
+        diag_upper, diag_lower, s = exp_p
+        self._apply_closed_form(psi, work, diag_upper, diag_lower, s,
+                                self._p)
+
+    def _apply_vector_potential(self, psi: np.ndarray, work: np.ndarray,
+                                exp_V: Tuple[np.ndarray, ...]) -> None:
+        # work = exp(-1j*phi*V)*(cos(phi*|A|) + s*alpha.A)*psi.
+        diag, s = exp_V
+        self._apply_closed_form(psi, work, diag, diag, s,
+                                self._vector_terms[:3])
+
+    def _apply_closed_form(self, psi: np.ndarray, work: np.ndarray,
+                           diag_upper: np.ndarray, diag_lower: np.ndarray,
+                           s: np.ndarray,
+                           terms: Tuple[np.ndarray, ...]) -> None:
+        # work = diag*psi + s*(alpha.p)*psi, where diag is diag_upper for
+        # the upper components and diag_lower for the lower ones, and
+        # terms are pz, px - 1j*py and px + 1j*py of the vector p.
+        # alpha.p only mixes the upper and lower components,
+        # as [[0, sigma.p], [sigma.p, 0]], with
+        # sigma.p = [[pz, px - 1j*py], [px + 1j*py, -pz]].
+        pz, p_minus, p_plus = terms
+        tmp = self._get_workspace('closed_form', self.V.shape, psi.dtype)
+        rows = ((0, diag_upper, 2, pz, 3, p_minus),
+                (1, diag_upper, 2, p_plus, 3, -pz),
+                (2, diag_lower, 0, pz, 1, p_minus),
+                (3, diag_lower, 0, p_plus, 1, -pz))
+        for i, diag, j, p_j, k, p_k in rows:
+            work_i = self._component(work, i)
+            np.multiply(p_j, self._component(psi, j), out=work_i)
+            np.multiply(p_k, self._component(psi, k), out=tmp)
+            work_i += tmp
+            work_i *= s
+            np.multiply(diag, self._component(psi, i), out=tmp)
+            work_i += tmp
+
+    def _exp_potential_inplace(self, psi: np.ndarray, work: np.ndarray,
+                               exp_V: np.ndarray) -> None:
+        if self._vector_terms is not None:
+            self._apply_vector_potential(psi, work, exp_V)
+            psi[...] = work
+        else:
+            psi *= exp_V
+
+    def _get_exp_V_full(self) -> np.ndarray:
+        # The potential step for a whole timestep, which is used in between
+        # steps in place of two consecutive half steps.
+        if self._exp_V_full is None:
+            if self._vector_terms is not None:
+                # The half steps commute, so their product
+                # is the step for 2*dt.
+                self._exp_V_full = self._make_exp_V(
+                    2.0*np.complex128(self._dt))
+            else:
+                self._exp_V_full = self._exp_V**2
+        return self._exp_V_full
+
 
 def get_exp_vector_potential(dt: float, 
                              A: List[np.ndarray], m: float, 
@@ -1,7 +1,6 @@
 from .. import SplitStepMethod
 import numpy as np
 from typing import Tuple, Union, List, Dict, Callable
-np.seterr(all='raise')
 
 
 class KleinGordonSplitstep(SplitStepMethod):
@@ -25,16 +24,27 @@ class KleinGordonSplitstep(SplitStepMethod):
     https://en.wikipedia.org/wiki/Hartree_atomic_units
 
     """
+    _splitting_schemes_supported = False
+    _timestep_attributes = ('_dt', '_exp_p', '_exp_V', '_exp_V_full')
+    _kinetic_attributes = ('_exp_p', )
+    _profiled_methods = {'potential': ('_exp_potential_inplace',
+                                       '_exp_potential_wavefunc',
+                                       '_potential_full_inplace'),
+                         'kinetic': ('_momentum_matrix_inplace', ),
+                         'set_timestep': ('set_timestep', ),
+                         'set_potential': ('set_potential', )}
 
     def __init__(self, potential: np.ndarray,
                  dimensions: Tuple[float, ...],
                  timestep: Union[float, np.complex128] = 1.0,
                  m: float = 1.0,
                  units: Dict[str, float] = None,
-                 shape: Tuple[int, ...] = None) -> None:
+                 shape: Tuple[int, ...] = None,
+                 dtype: np.dtype = np.complex128) -> None:
         self._m = m
         self._exp_p = None
         self._exp_V = None
+        self._exp_V_full = None
         self._V = potential
         self._nonlinear = None
         self._dimensions = dimensions
@@ -44,7 +54,7 @@ class KleinGordonSplitstep(SplitStepMethod):
         self.HBAR = (units['hbar'] if units and 'hbar' 
                      in units.keys() else 1.0)
         tmp = np.zeros(self._shape)
-        SplitStepMethod.__init__(self, tmp, dimensions, timestep)
+        SplitStepMethod.__init__(self, tmp, dimensions, timestep, dtype)
 
     def set_timestep(self, timestep: Union[float, np.complex128]) -> None:
         """
@@ -95,7 +105,8 @@ class KleinGordonSplitstep(SplitStepMethod):
         e01 =  np.sin(dt*omega)/(f*omega)
         e10 =  -f*omega*np.sin(dt*omega)
         e11 =  np.cos(dt*omega)
-        self._exp_p = [[e00, e01], [e10, e11]]
+        self._exp_p = [[e.astype(self._dtype) for e in (e00, e01)],
+                       [e.astype(self._dtype) for e in (e10, e11)]]
         self.set_potential(self._V)
 
     def set_nonlinear_term(self, nonlinear: Callable) -> None:
@@ -106,6 +117,7 @@ class KleinGordonSplitstep(SplitStepMethod):
 
     def set_potential(self, potential: np.ndarray) -> None:
         self._V = potential
+        self._exp_V_full = None
         if potential is None:
             return
         V = potential
@@ -114,17 +126,20 @@ class KleinGordonSplitstep(SplitStepMethod):
         invsqrt2 = np.complex128(1.0/np.sqrt(2.0))
         c2_hbar2 = np.complex128(self.C**2/self.HBAR**2)
         try:
-            e00 =  1.0*np.cos(invsqrt2*V**0.5*c2_hbar2**0.5*dt)
-            e01 =  invsqrt2*V**(-0.5)*c2_hbar2**(-0.5)
-            e01 *= np.sin(invsqrt2*V**0.5*c2_hbar2**0.5*dt)
-            e10 =  -sqrt2*V**0.5*c2_hbar2**0.5
-            e10 *= np.sin(invsqrt2*V**0.5*c2_hbar2**0.5*dt)
-            e11 =  1.0*np.cos(invsqrt2*V**0.5*c2_hbar2**0.5*dt)
-            self._exp_V = [[e00, e01], [e10, e11]]
+            with np.errstate(all='raise'):
+                e00 =  1.0*np.cos(invsqrt2*V**0.5*c2_hbar2**0.5*dt)
+                e01 =  invsqrt2*V**(-0.5)*c2_hbar2**(-0.5)
+                e01 *= np.sin(invsqrt2*V**0.5*c2_hbar2**0.5*dt)
+                e10 =  -sqrt2*V**0.5*c2_hbar2**0.5
+                e10 *= np.sin(invsqrt2*V**0.5*c2_hbar2**0.5*dt)
+                e11 =  1.0*np.cos(invsqrt2*V**0.5*c2_hbar2**0.5*dt)
         except FloatingPointError as e:
             print(np.max(invsqrt2*V**0.5*c2_hbar2**0.5*dt))
             print(np.min(invsqrt2*V**0.5*c2_hbar2**0.5*dt))
             print(e)
+            return
+        self._exp_V = [[np.asarray(e, dtype=self._dtype) for e in (e00, e01)],
+                       [np.asarray(e, dtype=self._dtype) for e in (e10, e11)]]
 
     def _exp_potential_wavefunc(self, 
                                 psi: List[np.ndarray]) -> List[np.ndarray]:
@@ -140,11 +155,85 @@ class KleinGordonSplitstep(SplitStepMethod):
         """
         Step the wavefunction in time.
         """
+        psi = [np.asarray(psi_i, dtype=self._dtype) for psi_i in psi]
         psi = self._exp_potential_wavefunc(psi)
-        psi_p = [np.fft.fftn(psi[i]) for i in range(2)]
+        psi_p = [self._fft.fftn(psi[i]) for i in range(2)]
         exp_p = self._exp_p
         psi_p = [exp_p[0][0]*psi_p[0] + exp_p[0][1]*psi_p[1], 
                  exp_p[1][0]*psi_p[0] + exp_p[1][1]*psi_p[1]]
-        psi = [np.fft.ifftn(psi_p[i]) for i in range(2)]
+        psi = [self._fft.ifftn(psi_p[i]) for i in range(2)]
         psi = self._exp_potential_wavefunc(psi)
+        self._count_steps(1)
+        return psi
+
+    def step_inplace(self, psi: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Step the wavefunction in time, overwriting the two arrays
+        in psi with the result. These must be complex arrays.
+        """
+        self._exp_potential_inplace(psi)
+        self._momentum_step_inplace(psi)
+        self._exp_potential_inplace(psi)
+        self._count_steps(1)
         return psi
+
+    def _copy_wavefunction(self,
+                           psi: List[np.ndarray]) -> List[np.ndarray]:
+        return [np.array(psi_i, dtype=self._dtype) for psi_i in psi]
+
+    def _evolve_steps(self, psi: List[np.ndarray],
+                      n_steps: int) -> List[np.ndarray]:
+        if self._V is None or self._nonlinear is not None:
+            # The potential changes at every half step with the nonlinear
+            # term, so the potential half steps cannot be combined.
+            for _ in range(n_steps):
+                self.step_inplace(psi)
+            return psi
+        self._exp_potential_inplace(psi)
+        for _ in range(n_steps - 1):
+            self._momentum_step_inplace(psi)
+            self._potential_full_inplace(psi)
+        self._momentum_step_inplace(psi)
+        self._exp_potential_inplace(psi)
+        self._count_steps(n_steps)
+        return psi
+
+    def _get_exp_V_full(self) -> List[List[np.ndarray]]:
+        # The product of two potential half steps.
+        if self._exp_V_full is None:
+            e = self._exp_V
+            self._exp_V_full = [[e[0][0]*e[0][0] + e[0][1]*e[1][0],
+                                 e[0][0]*e[0][1] + e[0][1]*e[1][1]],
+                                [e[1][0]*e[0][0] + e[1][1]*e[1][0],
+                                 e[1][0]*e[0][1] + e[1][1]*e[1][1]]]
+        return self._exp_V_full
+
+    def _momentum_step_inplace(self, psi: List[np.ndarray]) -> None:
+        for i in range(2):
+            self._fft.fftn(psi[i], out=psi[i])
+        self._momentum_matrix_inplace(psi)
+        for i in range(2):
+            self._fft.ifftn(psi[i], out=psi[i])
+
+    def _momentum_matrix_inplace(self, psi: List[np.ndarray]) -> None:
+        self._matrix_step_inplace(self._exp_p, psi)
+
+    def _potential_full_inplace(self, psi: List[np.ndarray]) -> None:
+        self._matrix_step_inplace(self._get_exp_V_full(), psi)
+
+    def _exp_potential_inplace(self, psi: List[np.ndarray]) -> None:
+        if self._V is not None:
+            if self._nonlinear is not None:
+                self.set_potential(self._V + self._nonlinear(psi[0]))
+            self._matrix_step_inplace(self._exp_V, psi)
+
+    def _matrix_step_inplace(self, e: List[List[np.ndarray]],
+                             psi: List[np.ndarray]) -> None:
+        tmp1 = self._get_workspace('matrix1', psi[0].shape, psi[0].dtype)
+        tmp2 = self._get_workspace('matrix2', psi[0].shape, psi[0].dtype)
+        np.multiply(e[1][0], psi[0], out=tmp1)
+        np.multiply(e[0][1], psi[1], out=tmp2)
+        psi[0] *= e[0][0]
+        psi[0] += tmp2
+        psi[1] *= e[1][1]
+        psi[1] += tmp1
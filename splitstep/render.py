@@ -0,0 +1,376 @@
+"""
+Rendering simulations to images without tying the speed of the
+simulation to that of the plotting.
+
+A FrameProducer steps a solver in a background thread, and queues a
+copy of the wavefunction every steps_per_frame steps. The frames are
+taken from it in the main thread, where they are turned into RGBA
+images and either written to PNG files or an MP4 video, or shown in a
+live figure. The Fourier transforms and the element-wise numpy
+operations of the solver release the GIL, as do zlib and the pipe to
+ffmpeg, so the stepping runs alongside the rendering. If the queue is
+full the producer waits, so when writing files no frame is dropped,
+while a live figure can take only the latest frame with latest().
+
+To write a video of 600 frames of 10 steps each:
+
+>>> from splitstep.render import render
+>>> render(U, psi, 'sho2d.mp4', n_frames=600, steps_per_frame=10)
+
+or a directory of PNG files with 'frames/frame_%05d.png' as the path.
+In a live figure:
+
+>>> producer = FrameProducer(U, psi, steps_per_frame=10)
+>>> producer.start()
+>>> def animation_func(*_):
+>>>     steps, psi = producer.latest()
+>>>     im.set_data(complex_to_rgba(psi, max_val, alpha=True))
+>>>     return im,
+
+"""
+import os
+import zlib
+import queue
+import shutil
+import struct
+import threading
+import subprocess
+from typing import Any, Callable, Iterator, Tuple
+import numpy as np
+
+
+def complex_to_rgba(psi: np.ndarray, max_val: float = None,
+                    alpha: bool = False) -> np.ndarray:
+    """
+    Colour a 2D wavefunction by its phase, as with the hsv colour map
+    that the examples use, and shade it by its magnitude divided by
+    max_val, which is the largest magnitude by default. If psi has
+    leading component axes, as for a spinor, the magnitude is that of
+    all the components, and the phase is that of the first one.
+    The magnitude darkens the colour if alpha is False, which suits
+    videos, and is the alpha channel otherwise, which suits drawing
+    the image over the potential. This returns an array of
+    shape (rows, columns, 4) of type uint8.
+    """
+    psi = np.asarray(psi)
+    if psi.ndim > 2:
+        components = psi.reshape((-1, ) + psi.shape[-2:])
+        magnitude = np.sqrt(np.sum(np.abs(components)**2, axis=0))
+        phase = np.angle(components[0])
+    else:
+        magnitude = np.abs(psi)
+        phase = np.angle(psi)
+    max_val = np.amax(magnitude) if max_val is None else max_val
+    shade = np.clip(magnitude/max_val if max_val > 0.0 else magnitude,
+                    0.0, 1.0)
+    # The hue goes once around the colour wheel as the phase goes
+    # from -pi to pi, with full saturation and value.
+    hue = 6.0*(phase + np.pi)/(2.0*np.pi)
+    rgb = np.stack([np.clip(np.abs(np.mod(hue + k, 6.0) - 3.0) - 1.0,
+                            0.0, 1.0) for k in (0.0, 4.0, 2.0)], axis=-1)
+    rgba = np.empty(psi.shape[-2:] + (4, ), dtype=np.uint8)
+    if alpha:
+        rgba[..., :3] = 255.0*rgb
+        rgba[..., 3] = 255.0*shade
+    else:
+        rgba[..., :3] = 255.0*rgb*shade[..., np.newaxis]
+        rgba[..., 3] = 255
+    return rgba
+
+
+def write_png(filename: str, rgba: np.ndarray, level: int = 6) -> None:
+    """
+    Write an RGBA image of type uint8 to a PNG file.
+    """
+    rows, columns = rgba.shape[:2]
+    # Each row starts with a byte giving its filter, which is none.
+    raw = np.zeros((rows, 1 + 4*columns), dtype=np.uint8)
+    raw[:, 1:] = np.ascontiguousarray(rgba, dtype=np.uint8).reshape(
+        rows, -1)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', columns, rows,
+                                           8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), level)))
+        f.write(chunk(b'IEND', b''))
+
+
+class PNGWriter:
+    """
+    Write each frame to its own PNG file, where the filename of each
+    is the pattern formatted with the number of the frame,
+    such as 'frames/frame_%05d.png'.
+    """
+
+    def __init__(self, pattern: str, level: int = 6):
+        self.pattern = pattern
+        self.level = level
+        self._n_frames = 0
+        directory = os.path.dirname(pattern)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self) -> 'PNGWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, rgba: np.ndarray) -> None:
+        """
+        Write the next frame.
+        """
+        write_png(self.pattern % self._n_frames, rgba, self.level)
+        self._n_frames += 1
+
+    def close(self) -> None:
+        pass
+
+
+class FFmpegWriter:
+    """
+    Write the frames to a video by piping them to ffmpeg, which must be
+    installed. The type of video is that of the extension of filename,
+    where an MP4 file is encoded with H.264.
+    """
+
+    def __init__(self, filename: str, fps: float = 30.0,
+                 ffmpeg: str = 'ffmpeg'):
+        if shutil.which(ffmpeg) is None:
+            raise Exception('Writing a video requires ffmpeg, '
+                            'which was not found.')
+        self.filename = filename
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self._process = None
+        self._shape = None
+
+    def __enter__(self) -> 'FFmpegWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, rgba: np.ndarray) -> None:
+        """
+        Write the next frame. All the frames must have the same shape.
+        """
+        if self._process is None:
+            self._shape = rgba.shape
+            rows, columns = rgba.shape[:2]
+            # H.264 with yuv420p needs an even width and height.
+            self._process = subprocess.Popen(
+                [self.ffmpeg, '-y', '-loglevel', 'error',
+                 '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                 '-s', '%dx%d' % (columns, rows), '-r', str(self.fps),
+                 '-i', '-', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                 '-pix_fmt', 'yuv420p', self.filename],
+                stdin=subprocess.PIPE)
+        elif rgba.shape != self._shape:
+            raise Exception('The frame has the shape %s, but the video '
+                            'has frames of the shape %s.'
+                            % (str(rgba.shape), str(self._shape)))
+        self._process.stdin.write(
+            np.ascontiguousarray(rgba, dtype=np.uint8).tobytes())
+
+    def close(self) -> None:
+        """
+        Finish writing the video.
+        """
+        if self._process is None:
+            return
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise Exception('ffmpeg failed to write %s.' % self.filename)
+        self._process = None
+
+
+class FrameProducer:
+    """
+    Step a solver in a background thread, and queue a copy of the
+    wavefunction every steps_per_frame steps, for n_frames frames,
+    or until stop is called if n_frames is None.
+
+    At most max_queued frames wait in the queue, after which the
+    producer waits for them to be taken. Wavefunctions with several
+    components given as a list or tuple of arrays are stacked into one
+    array. The copies are made into buffers that are reused once the
+    frames are taken, so the arrays returned by get, latest and the
+    iterator are only valid until the next frame is taken.
+    """
+
+    def __init__(self, solver: Any, psi: Any, steps_per_frame: int = 1,
+                 n_frames: int = None, max_queued: int = 4):
+        self.solver = solver
+        self.steps_per_frame = steps_per_frame
+        self.n_frames = n_frames
+        self.psi = psi
+        self._queue = queue.Queue(max_queued)
+        self._free = queue.Queue()
+        self._n_buffers = 0
+        self._max_queued = max_queued
+        self._taken = None
+        self._stopped = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> 'FrameProducer':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """
+        Start stepping.
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop stepping, and wait for the background thread to finish.
+        The last wavefunction is left in psi.
+        """
+        self._stopped.set()
+        while self._thread.is_alive():
+            # Take any frames so that the producer is not left waiting
+            # for room in the queue.
+            try:
+                item = self._queue.get(timeout=0.01)
+            except queue.Empty:
+                continue
+            if item is not None:
+                self._free.put(item[1])
+        self._check_error()
+
+    def get(self, block: bool = True,
+            timeout: float = None) -> Tuple[int, np.ndarray]:
+        """
+        Take the next frame, as the number of steps done so far and the
+        wavefunction. This returns None once all the frames have been
+        taken, and raises queue.Empty if block is False or the timeout
+        passes before a frame is ready.
+        """
+        self._release()
+        item = self._queue.get(block, timeout)
+        if item is None:
+            # Leave the end marker for any later calls.
+            self._queue.put(None)
+            self._check_error()
+            return None
+        self._taken = item[1]
+        return item
+
+    def latest(self) -> Tuple[int, np.ndarray]:
+        """
+        Take the most recent frame that is ready, dropping any older
+        ones, or wait for the next one if none is ready. This is for
+        live figures, which need not show every frame.
+        """
+        item = self.get()
+        while item is not None:
+            try:
+                newer = self.get(block=False)
+            except queue.Empty:
+                break
+            if newer is None:
+                break
+            item = newer
+        return item
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        while True:
+            item = self.get()
+            if item is None:
+                return
+            yield item
+
+    def _release(self) -> None:
+        if self._taken is not None:
+            self._free.put(self._taken)
+            self._taken = None
+
+    def _get_buffer(self, psi: np.ndarray) -> np.ndarray:
+        while True:
+            try:
+                buffer = self._free.get_nowait()
+            except queue.Empty:
+                # One more buffer than the queue holds, for the frame
+                # that has been taken but not yet released.
+                if self._n_buffers < self._max_queued + 2:
+                    self._n_buffers += 1
+                    return np.empty(psi.shape, dtype=psi.dtype)
+                buffer = self._free.get()
+            if buffer.shape == psi.shape and buffer.dtype == psi.dtype:
+                return buffer
+            self._n_buffers -= 1
+
+    def _put(self, item: Any) -> bool:
+        # Wait for room in the queue, unless the producer is stopped.
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.01)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self) -> None:
+        try:
+            frames = 0
+            steps = 0
+            while not self._stopped.is_set() and \
+                    (self.n_frames is None or frames < self.n_frames):
+                self.psi = self.solver.evolve(self.psi, self.steps_per_frame)
+                steps += self.steps_per_frame
+                frames += 1
+                psi = np.asarray(self.psi)
+                buffer = self._get_buffer(psi)
+                np.copyto(buffer, psi)
+                if not self._put((steps, buffer)):
+                    return
+        except Exception as e:
+            self._error = e
+        self._put(None)
+
+    def _check_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+def render(solver: Any, psi: Any, path: str, n_frames: int,
+           steps_per_frame: int = 1,
+           to_frame: Callable[[np.ndarray], np.ndarray] = None,
+           fps: float = 30.0, max_queued: int = 4) -> Any:
+    """
+    Step the solver from psi for n_frames frames of steps_per_frame
+    steps each, and write the frames to path, which is a video if it
+    ends with .mp4, .mkv, .webm or .gif, and otherwise is the pattern
+    of the filenames of PNG files, such as 'frames/frame_%05d.png'.
+    to_frame turns each wavefunction into an RGBA image of type uint8,
+    and is complex_to_rgba by default, with the magnitude scaled by
+    that of the initial wavefunction. This returns the last wavefunction.
+    """
+    if to_frame is None:
+        max_val = np.amax(np.abs(np.asarray(psi)))
+
+        def to_frame(psi_i: np.ndarray) -> np.ndarray:
+            return complex_to_rgba(psi_i, max_val)
+    if os.path.splitext(path)[1].lower() in ('.mp4', '.mkv',
+                                             '.webm', '.gif'):
+        writer = FFmpegWriter(path, fps)
+    else:
+        writer = PNGWriter(path)
+    producer = FrameProducer(solver, psi, steps_per_frame,
+                             n_frames, max_queued)
+    with writer, producer:
+        for _, psi_i in producer:
+            writer.write(to_frame(psi_i))
+    return producer.psi
@@ -9,74 +9,628 @@ split-operator_method/split-operator_method.html
 https://en.wikipedia.org/wiki/Split-step_method
 
 """
-from typing import Union, Any, Tuple, Callable, List
+from contextlib import contextmanager
+from typing import Union, Any, Tuple, Callable, List, Dict, Iterator
 import numpy as np
 import scipy.constants as const
+from .fft_backend import FFTBackend, get_fft_backend
+from .kernels import KernelBackend, get_kernel_backend, get_batch_norm
+from .observables import Observables, get_density, get_kinetic_energy
+from .observables import sum_grid, dot_grid
+from .splitting_schemes import get_scheme_coefficients
+from . import checkpoint
+from . import profiling
 
 
 class SplitStepMethod:
     """
     Class for the split step method.
+
+    The propagators are stored with the complex type given by dtype,
+    and the wavefunction is stepped with this type. Using np.complex64
+    halves the memory used and speeds up the Fourier transforms,
+    at the cost of precision. The function precision_drift in
+    splitstep.precision can be used to compare a single precision
+    run against one done in double precision.
+
+    The wavefunction may have extra leading axes in front of the spatial
+    ones, so that an ensemble of wavefunctions with the same potential
+    is stepped at once. The Fourier transforms are then only done over
+    the spatial axes, and normalization is done separately
+    for each wavefunction in the ensemble.
+
+    If separable_kinetic is True, the kinetic propagator is stored as one
+    factor for each axis, which are applied one after the other, instead
+    of as a single array the size of the grid. This uses far less memory
+    and makes set_timestep cheaper, at the cost of one pass over the
+    momentum space wavefunction per axis instead of one in total.
+
+    By default each step uses second order Strang splitting. Higher order
+    schemes can be chosen with set_splitting_scheme.
+
+    If real is True the wavefunction is stored with the real type of
+    the same precision as dtype, which halves its memory, and the
+    kinetic steps use the real to complex transforms rfftn and irfftn,
+    which only keep half of the spectrum. This is for imaginary time
+    evolution, such as finding ground states and eigenstates, where
+    a real wavefunction stays real, so the timestep must be purely
+    imaginary and the potential real. The imaginary part of any
+    wavefunction passed in is dropped, and observables
+    cannot be recorded.
     """
+    _splitting_schemes_supported = True
+    # The attributes that set_timestep changes, which splitstep.adaptive
+    # saves and restores to switch between timesteps without
+    # recomputing the propagators.
+    _timestep_attributes = ('_dt', '_exp_potential', '_exp_potential_cache',
+                            '_exp_kinetic', '_exp_kinetic_factors',
+                            '_exp_kinetic_cache')
+    # The attributes that only depend on the grid and the timestep,
+    # which splitstep.sweep shares between processes.
+    _kinetic_attributes = ('_kinetic', '_kinetic_factors', '_exp_kinetic',
+                           '_exp_kinetic_factors')
+    # The methods that are timed as each phase of a step when profiling.
+    _profiled_methods = {'potential': ('_potential_step', ),
+                         'kinetic': ('_kinetic_multiply', ),
+                         'normalize': ('_normalize', ),
+                         'set_timestep': ('set_timestep', ),
+                         'set_potential': ('set_potential', )}
 
     def __init__(self, potential: np.ndarray,
                  dimensions: Tuple[float, ...],
-                 timestep: Union[float, np.complex128] = 1e-17):
+                 timestep: Union[float, np.complex128] = 1e-17,
+                 dtype: np.dtype = np.complex128,
+                 separable_kinetic: bool = False, real: bool = False):
         if len(potential.shape) != len(dimensions):
             raise Exception('Potential shape does not match dimensions')
+        self._dtype = np.dtype(dtype)
+        self._real = real
+        self._state_dtype = np.finfo(self._dtype).dtype if real \
+            else self._dtype
+        self._check_potential(potential)
         self.m = const.m_e
         self.V = potential
         self._dim = dimensions
+        self._axes = tuple(range(-len(dimensions), 0))
         self._exp_potential = None
+        self._exp_potential_cache = {}
+        self._exp_kinetic_cache = {}
+        self._scheme = (1.0, )
         self._kinetic = None
         self._exp_kinetic = None
+        self._kinetic_factors = None
+        self._exp_kinetic_factors = None
+        self._separable_kinetic = separable_kinetic
         self._norm = False
         self._dt = 0
+        self._steps = 0
+        self._t = 0.0
+        self._observables = None
+        self._fft = get_fft_backend()
+        self._kernels = get_kernel_backend()
+        self._profiler = None
+        self._workspace = {}
         self.set_timestep(timestep)
 
     def set_timestep(self, timestep: Union[float, np.complex128]) -> None:
         """
         Set the timestep. It can be real or complex.
         """
+        if self._real and np.real(timestep) != 0.0:
+            raise Exception('The timestep must be purely imaginary '
+                            'for a real wavefunction.')
         self._dt = timestep
-        self._exp_potential = np.exp(-0.25j*(self._dt/const.hbar)*self.V)
-        p = np.meshgrid(*[2.0*np.pi*const.hbar*np.fft.fftfreq(d)*d/
-                          self._dim[i] for i, d in enumerate(self.V.shape)])
-        self._kinetic = sum([p_i**2 for p_i in p])/(2.0*self.m)
-        self._exp_kinetic = np.exp(-0.5j*(self._dt/(2.0*self.m*const.hbar))
-                                   * sum([p_i**2 for p_i in p]))
+        self._exp_potential = self._to_propagator(
+            np.exp(-0.25j*(self._dt/const.hbar)*self.V))
+        self._exp_potential_cache = {}
+        self._exp_kinetic_cache = {}
+        real_dtype = np.finfo(self._dtype).dtype
+        kinetic_factors = [p_i**2/(2.0*self.m) for p_i in self._get_momenta()]
+        exp_kinetic_factors = [
+            self._to_propagator(np.exp(-0.5j*(self._dt/const.hbar)*k_i),
+                                True)
+            for k_i in kinetic_factors]
+        if self._separable_kinetic:
+            self._kinetic = None
+            self._exp_kinetic = None
+            self._kinetic_factors = [k_i.astype(real_dtype)
+                                     for k_i in kinetic_factors]
+            self._exp_kinetic_factors = exp_kinetic_factors
+        else:
+            self._kinetic_factors = None
+            self._exp_kinetic_factors = None
+            self._kinetic = sum(kinetic_factors).astype(real_dtype)
+            self._exp_kinetic = self._to_propagator(
+                np.exp(-0.5j*(self._dt/const.hbar)*sum(kinetic_factors)),
+                True)
+
+    def _to_propagator(self, a: np.ndarray,
+                       kinetic: bool = False) -> np.ndarray:
+        # Give a propagator the type of the solver. For a real
+        # wavefunction it is real, and a kinetic propagator only keeps
+        # the half of the spectrum that rfftn gives.
+        if not self._real:
+            return a.astype(self._dtype)
+        a = a.real.astype(self._state_dtype)
+        return np.ascontiguousarray(self._half_spectrum(a)) if kinetic \
+            else a
+
+    def _half_spectrum(self, a: np.ndarray) -> np.ndarray:
+        # For a real wavefunction, the non-negative frequencies along
+        # the last axis of an array over momentum space. It is left as
+        # is if it is constant along that axis, or otherwise.
+        n = self.V.shape[-1]
+        if not self._real or a.shape[-1] != n:
+            return a
+        return a[..., :n//2 + 1]
+
+    def _get_momenta(self) -> List[np.ndarray]:
+        # The momenta for each dimension, shaped so that they broadcast
+        # along their axis of the grid.
+        return [np.reshape(2.0*np.pi*const.hbar*np.fft.fftfreq(d)*d
+                           / self._dim[i], shape)
+                for i, d, shape in self._get_grid_axes()]
+
+    def _get_positions(self) -> List[np.ndarray]:
+        # Positions measured from the centre of the grid
+        # for each dimension, shaped like the momenta.
+        return [np.reshape(self._dim[i]*(np.arange(d)/d - 0.5), shape)
+                for i, d, shape in self._get_grid_axes()]
+
+    def _get_grid_axes(self) -> List[Tuple[int, int, List[int]]]:
+        return get_grid_axes(self.V.shape)
+
+    def set_fft_backend(self, backend: Union[str, FFTBackend],
+                        **kw) -> None:
+        """
+        Set the backend used for the Fourier transforms, either by its name
+        ('numpy', 'scipy' or 'pyfftw') or as an FFTBackend instance.
+        Keyword arguments such as workers or threads
+        are passed to the backend's constructor.
+        """
+        self._fft = get_fft_backend(backend, **kw)
+        if self._profiler is not None:
+            profiling.enable(self, self._profiler)
+
+    def set_kernel_backend(self, backend: Union[str, KernelBackend],
+                           **kw) -> None:
+        """
+        Set the backend used for the element-wise kicks by the potential
+        and kinetic propagators, either by its name ('numpy', 'numba' or
+        'numexpr') or as a KernelBackend instance. The numba backend
+        also sums |psi|^2 for normalization in the same pass as the
+        potential kick. See splitstep.kernels.
+        """
+        self._kernels = get_kernel_backend(backend, **kw)
 
     def set_potential(self, V: np.ndarray) -> None:
         """
         Change the potential
         """
+        self._check_potential(V)
         self.V = V
-        self._exp_potential = np.exp(-0.25j*(self._dt/const.hbar)*self.V)
+        self._exp_potential = self._to_propagator(
+            np.exp(-0.25j*(self._dt/const.hbar)*self.V))
+        self._exp_potential_cache = {}
+
+    def _check_potential(self, V: np.ndarray) -> None:
+        if self._real and np.iscomplexobj(V) and np.any(np.imag(V)):
+            raise Exception('The potential must be real '
+                            'for a real wavefunction.')
+
+    def set_splitting_scheme(self, scheme: Union[str, List[float]]) -> None:
+        """
+        Set the splitting scheme used for each step, either by its name
+        ('strang', 'yoshida4', 'suzuki4', 'yoshida6' or 'kahan-li6'),
+        or as the list of coefficients of its Strang substeps.
+        The fourth and sixth order schemes allow for much larger
+        timesteps, but these have negative substeps, so they should not
+        be used in imaginary time. See splitstep.splitting_schemes.
+        """
+        if not self._splitting_schemes_supported:
+            raise NotImplementedError(
+                '%s only supports Strang splitting.' % type(self).__name__)
+        self._scheme = get_scheme_coefficients(scheme)
+        self._exp_potential_cache = {}
+        self._exp_kinetic_cache = {}
 
     def __call__(self, psi: np.ndarray) -> np.ndarray:
         """
         Step the wavefunction in time.
         """
-        psi_p = np.fft.fftn(psi*self._exp_potential)
-        psi_p = psi_p*self._exp_kinetic
-        psi = np.fft.ifftn(psi_p)*self._exp_potential
+        return self._finish_step(np.multiply(
+            np.real(psi) if self._real else psi,
+            self._get_exp_potential(self._scheme[0]),
+            dtype=self._state_dtype))
+
+    def step_inplace(self, psi: np.ndarray) -> np.ndarray:
+        """
+        Step the wavefunction in time, overwriting psi with the result,
+        which is also returned. Unlike calling the instance,
+        this does not allocate any new full-grid arrays.
+        psi must be a complex array, or a real one for a real
+        wavefunction, which should have the same type as the solver.
+        """
+        self._potential_step(psi, self._scheme[0])
+        return self._finish_step(psi)
+
+    def evolve(self, psi: Any, n_steps: int,
+               callback: Callable[[Any, int], None] = None,
+               callback_every: int = 1) -> Any:
+        """
+        Step the wavefunction n_steps times and return the result.
+        The input wavefunction is left unchanged.
+
+        Where possible, the potential half step that ends one step and
+        the one that begins the next are done together as a single full
+        step, so the result is the same as calling the instance n_steps
+        times but with less work. If callback is given it is called as
+        callback(psi, steps) every callback_every steps, where steps is
+        the number of steps done so far. The psi passed to it is
+        overwritten by later steps, so it must be copied if it is kept.
+        """
+        psi = self._copy_wavefunction(psi)
+        steps = 0
+        while steps < n_steps:
+            n = n_steps - steps
+            if callback is not None:
+                n = min(callback_every, n)
+            psi = self._evolve_steps(psi, n)
+            steps += n
+            if callback is not None:
+                callback(psi, steps)
+        return psi
+
+    def _copy_wavefunction(self, psi: np.ndarray) -> np.ndarray:
+        return np.array(np.real(psi) if self._real else psi,
+                        dtype=self._state_dtype)
+
+    def _evolve_steps(self, psi: np.ndarray, n_steps: int) -> np.ndarray:
+        # Do n_steps steps in place on psi, where the potential half steps
+        # in between the kinetic steps are combined into one.
+        c = self._scheme
+        self._potential_step(psi, c[0])
+        for _ in range(n_steps - 1):
+            self._substeps(psi)
+            if self._is_observed(self._steps + 1):
+                # The observables are measured at the end of a step,
+                # so the potential step is split back into two.
+                self._potential_step(psi, c[-1])
+                if self._norm:
+                    self._normalize(psi)
+                self._end_step(psi)
+                self._potential_step(psi, c[0])
+            else:
+                norm = self._potential_step(psi, c[-1] + c[0], self._norm)
+                if self._norm:
+                    self._normalize(psi, norm)
+                self._end_step(psi)
+        return self._finish_step(psi)
+
+    def _get_exp_potential(self, c: float) -> np.ndarray:
+        # The potential half step for a substep of c*dt. Those other than
+        # the one for the whole timestep are only made when first needed,
+        # since each is as big as the potential itself.
+        if c == 1.0:
+            return self._exp_potential
+        if c not in self._exp_potential_cache:
+            self._exp_potential_cache[c] = (
+                self._exp_potential**2 if c == 2.0 else
+                self._to_propagator(
+                    np.exp(-0.25j*c*(self._dt/const.hbar)*self.V)))
+        return self._exp_potential_cache[c]
+
+    def _get_exp_kinetic(self, c: float) -> Union[np.ndarray,
+                                                  List[np.ndarray]]:
+        # The kinetic step for a substep of c*dt,
+        # which is a list of factors if these are separable.
+        if c == 1.0:
+            if self._exp_kinetic is not None:
+                return self._exp_kinetic
+            return self._exp_kinetic_factors
+        if c not in self._exp_kinetic_cache:
+            phase = -0.5j*c*(self._dt/const.hbar)
+            if self._kinetic is not None:
+                exp_kinetic = self._to_propagator(
+                    np.exp(phase*self._kinetic), True)
+            else:
+                exp_kinetic = [self._to_propagator(np.exp(phase*k_i), True)
+                               for k_i in self._kinetic_factors]
+            self._exp_kinetic_cache[c] = exp_kinetic
+        return self._exp_kinetic_cache[c]
+
+    def _finish_step(self, psi: np.ndarray) -> np.ndarray:
+        # Everything in the step after the first potential half step.
+        # This is done in place on psi.
+        psi = self._substeps(psi)
+        norm = self._potential_step(psi, self._scheme[-1], self._norm)
         if self._norm:
-            psi = psi/np.sqrt(np.sum(psi*np.conj(psi)))
+            self._normalize(psi, norm)
+        self._end_step(psi)
         return psi
 
+    def _substeps(self, psi: np.ndarray) -> np.ndarray:
+        # The kinetic steps of the splitting scheme and the potential
+        # steps in between them, but not the potential steps at either end.
+        c = self._scheme
+        for j in range(len(c) - 1):
+            self._kinetic_step(psi, c[j], j == 0)
+            self._potential_step(psi, c[j] + c[j + 1])
+        return self._kinetic_step(psi, c[-1], len(c) == 1)
+
+    def _end_step(self, psi: np.ndarray) -> None:
+        self._count_steps(1)
+        if self._is_observed(self._steps):
+            self._observables.measure_position(self, psi, self._steps)
+
+    def _count_steps(self, n_steps: int) -> None:
+        # The time is the sum of the timesteps of the steps done so far.
+        self._steps += n_steps
+        self._t += n_steps*self._dt
+
+    def _is_observed(self, step: int) -> bool:
+        return self._observables is not None and \
+            self._observables.is_due(step)
+
+    def _kinetic_step(self, psi: np.ndarray, c: float = 1.0,
+                      measure: bool = True) -> np.ndarray:
+        if self._real:
+            return self._real_kinetic_step(psi, c)
+        psi = self._fft.fftn(psi, axes=self._axes, out=psi)
+        if measure and self._is_observed(self._steps + 1):
+            self._observables.measure_momentum(self, psi)
+        self._kinetic_multiply(psi, c)
+        return self._fft.ifftn(psi, axes=self._axes, out=psi)
+
+    def _real_kinetic_step(self, psi: np.ndarray,
+                           c: float = 1.0) -> np.ndarray:
+        # The kinetic step of a real wavefunction, where the half
+        # spectrum is kept in a complex workspace.
+        shape = psi.shape[psi.ndim - len(self._axes):]
+        psi_p = self._get_workspace(
+            'half_spectrum', psi.shape[:-1] + (shape[-1]//2 + 1, ))
+        self._fft.rfftn(psi, axes=self._axes, out=psi_p)
+        self._kinetic_multiply(psi_p, c)
+        return self._fft.irfftn(psi_p, shape, axes=self._axes, out=psi)
+
+    def _kinetic_multiply(self, psi: np.ndarray, c: float = 1.0) -> None:
+        exp_kinetic = self._get_exp_kinetic(c)
+        if isinstance(exp_kinetic, list):
+            for exp_kinetic_i in exp_kinetic:
+                self._kernels.multiply(psi, exp_kinetic_i)
+        else:
+            self._kernels.multiply(psi, exp_kinetic)
+
+    def _potential_step(self, psi: np.ndarray, c: float = 1.0,
+                        norm: bool = False) -> Any:
+        # If norm is True, this returns the sum of |psi|^2 after the step,
+        # which the kernel backend may compute in the same pass.
+        return self._kernels.kick(psi, self._get_exp_potential(c),
+                                  norm=norm)
+
+    def _normalize(self, psi: np.ndarray, norm: Any = None) -> np.ndarray:
+        # norm is the sum of |psi|^2, if this is already known.
+        if norm is None:
+            norm = self._kernels.get_norm(psi, len(self._axes))
+        if psi.ndim == len(self._axes):
+            psi *= 1.0/np.sqrt(norm)
+            return psi
+        batch_shape = psi.shape[:psi.ndim - len(self._axes)]
+        psi *= (1.0/np.sqrt(norm)).reshape(
+            batch_shape + (1, )*len(self._axes))
+        return psi
+
+    def _get_workspace(self, key: str, shape: Tuple[int, ...],
+                       dtype: np.dtype = None) -> np.ndarray:
+        # Reusable scratch arrays, which are only
+        # reallocated when the requested shape or type changes.
+        dtype = self._dtype if dtype is None else dtype
+        if key not in self._workspace or \
+                self._workspace[key].shape != tuple(shape) or \
+                self._workspace[key].dtype != dtype:
+            self._workspace[key] = np.empty(shape, dtype=dtype)
+        return self._workspace[key]
+
     def get_expected_energy(self, psi: np.ndarray) -> float:
         """
-        Get the energy expectation value of the wavefunction
+        Get the energy expectation value of the wavefunction.
+        For an ensemble of wavefunctions this is an array
+        with the energy of each one.
         """
-        psi_p = np.fft.fftn(psi)
-        psi_p = psi_p/np.sqrt(np.sum(psi_p*np.conj(psi_p)))
-        kinetic = np.real(np.sum(np.conj(psi_p)*self._kinetic*psi_p))
-        potential = np.real(np.sum(self.V*np.conj(psi)*psi))
+        density = get_density(self._fft.fftn(psi, axes=self._axes))
+        kinetic = get_kinetic_energy(self, density)/sum_grid(self, density)
+        potential = dot_grid(self, get_density(psi, density), self.V)
         return kinetic + potential
 
+    def get_eigenstates(self, n_states: int, psi: np.ndarray = None,
+                        timestep: Union[float, np.complex128] = None,
+                        tol: float = 1e-6, max_sweeps: int = 1000,
+                        steps_per_sweep: int = 10, n_extra: int = 2
+                        ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the n_states lowest energy eigenstates by propagating a block
+        of states together in imaginary time. After every steps_per_sweep
+        steps, the block is orthonormalized with one QR decomposition,
+        and then rotated to the eigenvectors of the Hamiltonian within
+        the space that the block spans (Rayleigh-Ritz). This stops once
+        the residual |H psi - E psi| of each of the wanted states, relative
+        to the largest energy in the block, is less than tol.
+
+        The block has n_extra more states than are wanted, since the
+        highest states of the block converge the slowest. Its initial
+        states are taken from psi if it is given, where the first axis
+        enumerates the states, and are random otherwise. The imaginary
+        timestep is -i times the magnitude of the current timestep, unless
+        timestep is given. The solver's own timestep and settings are
+        restored afterwards.
+
+        This returns the energies and the states, which are normalized
+        and stacked along the first axis.
+        """
+        k = n_states + n_extra
+        shape = self.V.shape
+        if psi is None:
+            rng = np.random.default_rng(0)
+            psi = rng.standard_normal((k, ) + shape)
+        psi = self._copy_wavefunction(psi)
+        if psi.shape != (k, ) + shape:
+            raise Exception('The initial states must have the shape %s'
+                            % str((k, ) + shape))
+        saved = {key: getattr(self, key) for key in
+                 self._timestep_attributes + ('_norm', '_scheme',
+                                              '_observables', '_steps',
+                                              '_t')}
+        try:
+            self._scheme = (1.0, )
+            self._observables = None
+            self.set_timestep(-1.0j*abs(self._dt) if timestep is None
+                              else timestep)
+            self._norm = True
+            for _ in range(max_sweeps):
+                psi = self._evolve_steps(psi, steps_per_sweep)
+                energies, psi, residuals = self._rayleigh_ritz(psi)
+                if np.all(residuals[:n_states] < tol):
+                    break
+        finally:
+            for key, value in saved.items():
+                setattr(self, key, value)
+        return energies[:n_states], psi[:n_states]
+
+    def _rayleigh_ritz(self, psi: np.ndarray
+                       ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Orthonormalize the block of states psi, rotate it to the
+        # eigenvectors of the Hamiltonian in the space it spans,
+        # and get their energies and relative residuals.
+        k = psi.shape[0]
+        q, _ = np.linalg.qr(psi.reshape(k, -1).T)
+        psi = q.T.reshape(psi.shape)
+        h_psi = self._apply_hamiltonian(psi)
+        h = np.conj(psi.reshape(k, -1)) @ h_psi.reshape(k, -1).T
+        energies, c = np.linalg.eigh(0.5*(h + np.conj(h.T)))
+        psi = (c.T @ psi.reshape(k, -1)).reshape(psi.shape)
+        h_psi = (c.T @ h_psi.reshape(k, -1)).reshape(psi.shape)
+        h_psi -= energies.reshape((k, ) + (1, )*len(self._axes))*psi
+        residuals = np.sqrt(get_batch_norm(h_psi.reshape(k, -1)))
+        return energies, psi, residuals/np.amax(np.abs(energies))
+
+    def _apply_hamiltonian(self, psi: np.ndarray) -> np.ndarray:
+        # H psi, using the same kinetic and potential energies
+        # as the propagators.
+        if self._real:
+            psi_p = self._fft.rfftn(psi, axes=self._axes)
+        else:
+            psi_p = self._fft.fftn(psi, axes=self._axes)
+        if self._kinetic is not None:
+            psi_p *= self._half_spectrum(self._kinetic)
+        else:
+            psi_p_i = psi_p
+            psi_p = np.zeros_like(psi_p_i)
+            for k_i in self._kinetic_factors:
+                psi_p += self._half_spectrum(k_i)*psi_p_i
+        if self._real:
+            h_psi = self._fft.irfftn(
+                psi_p, psi.shape[psi.ndim - len(self._axes):],
+                axes=self._axes)
+        else:
+            h_psi = self._fft.ifftn(psi_p, axes=self._axes, out=psi_p)
+        h_psi += self.V*psi
+        return h_psi
+
+    def record_observables(self, every: int = 1) -> None:
+        """
+        Record the norm, the expected position and momentum, and the
+        expected kinetic, potential and total energy every given number
+        of steps, where 0 stops recording. These reuse the momentum space
+        wavefunction of the step instead of doing extra Fourier transforms;
+        see splitstep.observables for what this implies.
+        """
+        if every and self._real:
+            raise Exception('Observables cannot be recorded '
+                            'for a real wavefunction.')
+        self._observables = Observables(every) if every else None
+
+    def get_observables(self) -> Dict[str, np.ndarray]:
+        """
+        Get the recorded observables as a dictionary of arrays with the
+        keys 'steps', 'norm', 'x', 'p', 'kinetic', 'potential' and
+        'energy', where the first axis corresponds to the recorded steps.
+        """
+        return self._observables.get()
+
+    def save_checkpoint(self, path: str, psi: Any,
+                        save_propagators: bool = False) -> None:
+        """
+        Save the wavefunction together with the timestep, the number of
+        steps so far and the time to the directory path, so that the run
+        can be resumed with load_checkpoint. If save_propagators is True
+        the propagators are saved as well, so that these are not
+        recomputed when loading. See splitstep.checkpoint.
+        """
+        checkpoint.save_checkpoint(self, path, psi, save_propagators)
+
+    def load_checkpoint(self, path: str) -> Any:
+        """
+        Restore the state saved by save_checkpoint from the directory
+        path, and return the wavefunction that was saved with it.
+        The solver must have been made with the same potential.
+        """
+        return checkpoint.load_checkpoint(self, path)
+
+    def enable_profiling(self, enable: bool = True) -> None:
+        """
+        Start or stop timing each phase of the steps, such as the
+        potential and kinetic steps and the Fourier transforms, as well as
+        set_timestep and set_potential. Starting clears any previous
+        times. When profiling is off, which is the default,
+        it adds no overhead. See splitstep.profiling.
+        """
+        if enable:
+            profiling.enable(self, profiling.Profiler())
+        else:
+            profiling.disable(self)
+
+    def get_profile(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get the total seconds and number of calls of each phase
+        since profiling was started, as a dictionary of dictionaries
+        with the keys 'seconds' and 'calls'.
+        """
+        return self._profiler.get() if self._profiler is not None else {}
+
+    @contextmanager
+    def profile(self) -> Iterator[profiling.Profiler]:
+        """
+        Profile the steps done within a with block, where the profiler
+        that is returned keeps the times after the block ends.
+        """
+        profiler = profiling.Profiler()
+        profiling.enable(self, profiler)
+        try:
+            yield profiler
+        finally:
+            profiling.disable(self)
+
     def normalize_at_each_step(self, norm: bool) -> None:
         """
         Whether to normalize the wavefunction at each time step or not.
         """
         self._norm = norm
 
+
+def get_grid_axes(shape: Tuple[int, ...]) -> List[Tuple[int, int, List[int]]]:
+    """
+    For each dimension of a grid of the given shape, get its index,
+    the number of points along it, and the shape that broadcasts along
+    its axis of the grid. Like the arrays made by np.meshgrid, the first
+    two axes of the grid are y and x, while the first two entries of
+    the dimensions are the extents in x and y.
+    """
+    axes = list(range(len(shape)))
+    if len(axes) > 1:
+        axes[0], axes[1] = 1, 0
+    grid_axes = []
+    for i, axis in enumerate(axes):
+        broadcast_shape = [1]*len(shape)
+        broadcast_shape[axis] = shape[axis]
+        grid_axes.append((i, shape[axis], broadcast_shape))
+    return grid_axes
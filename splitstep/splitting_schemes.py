@@ -0,0 +1,104 @@
+"""
+Higher order splitting schemes, which are made by composing
+the second order Strang splitting step
+exp(-iV dt/2) exp(-iT dt) exp(-iV dt/2)
+over substeps c_1 dt, c_2 dt, ..., c_s dt, where the coefficients c_i
+sum to one. The potential half steps between consecutive substeps are
+combined into one, so a scheme with s substeps costs s Fourier transform
+pairs per step. Some of the coefficients are negative, which means
+that these schemes should not be used with an imaginary timestep.
+
+References:
+
+Yoshida H. (1990). Construction of higher order symplectic integrators.
+Physics Letters A, 150(5-7), 262-268.
+https://doi.org/10.1016/0375-9601(90)90092-3
+
+Suzuki M. (1990). Fractal decomposition of exponential operators with
+applications to many-body theories and Monte Carlo simulations.
+Physics Letters A, 146(6), 319-323.
+https://doi.org/10.1016/0375-9601(90)90962-N
+
+Kahan W., Li R. (1997). Composition constants for raising the orders of
+unconventional schemes for ordinary differential equations.
+Mathematics of Computation, 66(219), 1089-1099.
+
+Hairer E., Lubich C., Wanner G. (2006). Geometric Numerical Integration,
+section V.3. Springer.
+
+"""
+from typing import Dict, Tuple, Union, Sequence
+import numpy as np
+
+
+def _yoshida4() -> Tuple[float, ...]:
+    w1 = 1.0/(2.0 - 2.0**(1.0/3.0))
+    w0 = 1.0 - 2.0*w1
+    return (w1, w0, w1)
+
+
+def _suzuki4() -> Tuple[float, ...]:
+    p = 1.0/(4.0 - 4.0**(1.0/3.0))
+    return (p, p, 1.0 - 4.0*p, p, p)
+
+
+def _yoshida6() -> Tuple[float, ...]:
+    # Solution A from Yoshida's paper
+    w1 = -1.17767998417887
+    w2 = 0.235573213359357
+    w3 = 0.784513610477560
+    w0 = 1.0 - 2.0*(w1 + w2 + w3)
+    return (w3, w2, w1, w0, w1, w2, w3)
+
+
+def _kahan_li6() -> Tuple[float, ...]:
+    # The nine stage method s9odr6a of Kahan and Li
+    g = (0.39216144400731413928, 0.33259913678935943860,
+         -0.70624617255763935981, 0.08221359629355080023)
+    g5 = 1.0 - 2.0*sum(g)
+    return g + (g5, ) + g[::-1]
+
+
+SCHEMES: Dict[str, Tuple[float, ...]] = {
+    'strang': (1.0, ),
+    'yoshida4': _yoshida4(),
+    'suzuki4': _suzuki4(),
+    'yoshida6': _yoshida6(),
+    'kahan-li6': _kahan_li6(),
+}
+
+
+ORDERS: Dict[str, int] = {'strang': 2, 'yoshida4': 4, 'suzuki4': 4,
+                          'yoshida6': 6, 'kahan-li6': 6}
+
+
+def get_scheme_coefficients(scheme: Union[str, Sequence[float]]
+                            ) -> Tuple[float, ...]:
+    """
+    Get the substep coefficients of a splitting scheme from its name, or
+    check those that are given directly, which must be symmetric and sum
+    to one.
+    """
+    if isinstance(scheme, str):
+        if scheme not in SCHEMES:
+            raise KeyError('Unknown splitting scheme %s. Choose one of: %s.'
+                           % (scheme, ', '.join(SCHEMES.keys())))
+        return SCHEMES[scheme]
+    coefficients = tuple([float(c) for c in scheme])
+    if not np.isclose(sum(coefficients), 1.0) or \
+            not np.allclose(coefficients, coefficients[::-1]):
+        raise ValueError('The coefficients of a splitting scheme '
+                         'must be symmetric and sum to one.')
+    return coefficients
+
+
+def get_scheme_order(coefficients: Sequence[float]) -> int:
+    """
+    Get the order of the splitting scheme with the given coefficients.
+    This is 2 for coefficients that are not those of a named scheme.
+    """
+    for name, scheme in SCHEMES.items():
+        if len(scheme) == len(coefficients) and \
+                np.allclose(scheme, coefficients):
+            return ORDERS[name]
+    return 2
@@ -0,0 +1,150 @@
+"""
+Running many variants of a simulation in parallel, where each variant
+has its own potential and initial wavefunction, but all of them share
+the same grid and timestep.
+
+The propagators that only depend on the grid and the timestep, such as
+the kinetic propagator, are made once by the solver that is given, and
+are then put in shared memory, which each worker process maps without
+copying it. The attributes that are shared are listed in the
+_kinetic_attributes of the solver's class. For each variant, a worker
+only makes the potential propagator, by calling set_potential.
+
+The variants are described by dictionaries of parameters, and a
+function that is given one of these returns the potential and the
+initial wavefunction of that variant. This function is called in the
+worker, so only the parameters are sent to it. After stepping, another
+function measures the final wavefunction, and returns a dictionary of
+results. The results of all the variants are gathered into a table,
+which is a list with one row for each variant, in the order of the
+variants, where each row holds its parameters and its results.
+
+>>> from splitstep.sweep import run_sweep
+>>>
+>>> def make_variant(params):
+>>>     V = params['height']*barrier
+>>>     psi = np.exp(1j*params['k']*X)*envelope
+>>>     return V, psi
+>>>
+>>> def measure(U, psi):
+>>>     return {'transmitted': np.sum(np.abs(psi[..., N//2:])**2)}
+>>>
+>>> U = SplitStepMethod(V0, (L, L, L), DT)
+>>> variants = [{'height': h, 'k': k} for h in heights for k in ks]
+>>> table = run_sweep(U, make_variant, variants, 1000, measure)
+
+The functions make_variant and measure must be defined at the top level
+of a module, so that they can be sent to the workers. With the spawn
+start method, which is the default on Windows and macOS, the solver is
+also pickled, so a nonlinear term set with set_nonlinear_term must then
+be a top level function too.
+
+"""
+import os
+import copy
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Tuple
+import numpy as np
+from .precision import get_norm
+
+
+# The solver and functions of a worker process,
+# which are set when it starts.
+_worker_state = {}
+
+
+def _share(value: Any, blocks: List[shared_memory.SharedMemory]) -> Any:
+    # Copy the arrays in value into shared memory, and replace them
+    # with descriptions of where they are, which _attach undoes.
+    if isinstance(value, np.ndarray):
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(value.nbytes, 1))
+        np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf)[...] = \
+            value
+        blocks.append(shm)
+        return {'shared_array': shm.name, 'shape': value.shape,
+                'dtype': value.dtype.str}
+    if isinstance(value, (list, tuple)):
+        return type(value)([_share(v, blocks) for v in value])
+    return value
+
+
+def _attach(value: Any, blocks: List[shared_memory.SharedMemory]) -> Any:
+    if isinstance(value, dict) and 'shared_array' in value:
+        shm = shared_memory.SharedMemory(name=value['shared_array'])
+        blocks.append(shm)
+        return np.ndarray(value['shape'], dtype=np.dtype(value['dtype']),
+                          buffer=shm.buf)
+    if isinstance(value, (list, tuple)):
+        return type(value)([_attach(v, blocks) for v in value])
+    return value
+
+
+def _init_worker(solver: Any, shared: Dict[str, Any],
+                 make_variant: Callable, measure: Callable,
+                 n_steps: int) -> None:
+    blocks = []
+    for key, value in shared.items():
+        setattr(solver, key, _attach(value, blocks))
+    _worker_state.update({'solver': solver, 'V': solver.V,
+                          'make_variant': make_variant,
+                          'measure': measure, 'n_steps': n_steps,
+                          'blocks': blocks})
+
+
+def _run_variant(params: Dict[str, Any]) -> Dict[str, Any]:
+    U = _worker_state['solver']
+    V, psi = _worker_state['make_variant'](params)
+    U.set_potential(_worker_state['V'] if V is None else V)
+    U._steps, U._t = 0, 0.0
+    psi = U.evolve(psi, _worker_state['n_steps'])
+    row = dict(params)
+    row.update(_worker_state['measure'](U, psi))
+    return row
+
+
+def _measure_norm(U: Any, psi: Any) -> Dict[str, float]:
+    return {'norm': get_norm(psi)}
+
+
+def run_sweep(solver: Any, make_variant: Callable[[Dict[str, Any]],
+                                                  Tuple[Any, Any]],
+              variants: List[Dict[str, Any]], n_steps: int,
+              measure: Callable[[Any, Any], Dict[str, Any]] = None,
+              n_workers: int = None) -> List[Dict[str, Any]]:
+    """
+    Step each variant n_steps times, using n_workers processes,
+    which is the number of cores by default.
+
+    make_variant is called as make_variant(params) for the parameters
+    of each variant, and returns its potential and initial wavefunction,
+    where the potential may be None to keep that of the solver.
+    measure is called as measure(U, psi) with the solver of the worker
+    and the final wavefunction, and returns a dictionary of results.
+    By default this only records the norm. The solver itself is left
+    unchanged. This returns a list with a dictionary of the parameters
+    and results of each variant, in the same order as variants.
+    """
+    measure = _measure_norm if measure is None else measure
+    n_workers = n_workers if n_workers else os.cpu_count()
+    n_workers = max(min(n_workers, len(variants)), 1)
+    blocks = []
+    try:
+        shared = {key: _share(getattr(solver, key), blocks)
+                  for key in solver._kinetic_attributes
+                  if getattr(solver, key, None) is not None}
+        # The workers get a copy of the solver without the shared
+        # arrays, so that these are not pickled.
+        template = copy.copy(solver)
+        for key in shared:
+            setattr(template, key, None)
+        template._workspace = {}
+        with multiprocessing.Pool(n_workers, _init_worker,
+                                  (template, shared, make_variant,
+                                   measure, n_steps)) as pool:
+            return list(pool.imap(_run_variant, variants))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
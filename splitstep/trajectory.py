@@ -0,0 +1,369 @@
+"""
+Storing the wavefunction at many steps of a simulation on disk,
+and reading it back without loading the whole trajectory into memory.
+
+A trajectory is a directory holding a metadata file and the frames,
+which are grouped along time into chunks of at most a fixed number of
+frames. Each chunk is its own file, and the metadata records how many
+frames each chunk holds, since a chunk that is flushed early is short. Uncompressed chunks are .npy files that
+are memory mapped when read, so that slicing them only reads the parts
+that are needed. Compressed chunks are compressed with zlib, where the
+bytes of each value are first grouped by their significance,
+as in the shuffle filter of HDF5 and Blosc, which makes
+floating point data compress better. A compressed chunk is only
+decompressed when a frame in it is read.
+
+For example, to save every 10th step of a run:
+
+>>> from splitstep.trajectory import TrajectoryWriter, TrajectoryReader
+>>> with TrajectoryWriter('run', chunk_frames=16) as writer:
+>>>     psi = U.evolve(psi, 10000, writer.append, 10)
+>>> trajectory = TrajectoryReader('run')
+>>> print(trajectory.shape, trajectory.steps)
+>>> density = np.abs(trajectory[-1, 64])**2
+>>> for psi in trajectory.frames():
+>>>     ...
+
+To compress and write the snapshots in a background thread while
+the solver keeps stepping, wrap the writer in an AsyncSnapshotWriter:
+
+>>> with AsyncSnapshotWriter(TrajectoryWriter('run')) as writer:
+>>>     psi = U.evolve(psi, 10000, writer.append, 10)
+
+"""
+import os
+import re
+import json
+import zlib
+import queue
+import threading
+from typing import Any, Iterator, Tuple
+import numpy as np
+
+
+_META_FILE = 'trajectory.json'
+_TRAJECTORY_FILE = re.compile(r'^(chunk_\d{6}\.(npy|zlib)|%s(\.tmp)?)$'
+                              % re.escape(_META_FILE))
+
+
+def _get_chunk_file(path: str, index: int, compressed: bool) -> str:
+    return os.path.join(path, 'chunk_%06d.%s'
+                        % (index, 'zlib' if compressed else 'npy'))
+
+
+def _shuffle(a: np.ndarray) -> bytes:
+    itemsize = a.dtype.itemsize
+    return np.ascontiguousarray(
+        a.reshape(-1).view(np.uint8).reshape(-1, itemsize).T).tobytes()
+
+
+def _unshuffle(data: bytes, dtype: np.dtype,
+               shape: Tuple[int, ...]) -> np.ndarray:
+    itemsize = dtype.itemsize
+    a = np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1)
+    return np.ascontiguousarray(a.T).view(dtype).reshape(shape)
+
+
+class TrajectoryWriter:
+    """
+    Append wavefunctions to a trajectory in the directory path.
+
+    The frames are buffered in memory until chunk_frames of them have
+    been appended, after which they are written out as one chunk.
+    If compression is 'zlib' the chunks are compressed at the given
+    level, and if it is None they are written as is, so that they can
+    be memory mapped when read. Wavefunctions with several components
+    given as a list or tuple of arrays are stacked into one array.
+
+    If path already holds a trajectory, this raises FileExistsError,
+    unless overwrite is True, in which case the chunks and metadata of
+    the old trajectory are deleted first, so that none of its frames
+    are read back as part of the new one.
+    """
+
+    def __init__(self, path: str, chunk_frames: int = 16,
+                 compression: str = 'zlib', level: int = 1,
+                 overwrite: bool = False):
+        if compression not in ('zlib', None):
+            raise KeyError('Unknown compression %s. '
+                           'Choose either zlib or None.' % compression)
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.compression = compression
+        self.level = level
+        self._buffer = None
+        self._n_buffered = 0
+        self._n_chunks = 0
+        self._chunk_sizes = []
+        self._steps = []
+        os.makedirs(path, exist_ok=True)
+        old_files = [name for name in sorted(os.listdir(path))
+                     if _TRAJECTORY_FILE.match(name)]
+        if old_files and not overwrite:
+            raise FileExistsError('%s already holds a trajectory. Pass '
+                                  'overwrite=True to replace it.' % path)
+        # The metadata is removed first, so that a reader never sees
+        # it with some of its chunks missing.
+        for name in sorted(old_files, key=lambda name: name != _META_FILE):
+            os.remove(os.path.join(path, name))
+
+    def __enter__(self) -> 'TrajectoryWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def append(self, psi: Any, step: int = None) -> None:
+        """
+        Append a wavefunction, where step is the step that it was saved
+        at, which is the number of frames so far if it is not given.
+        This can be passed as the callback of a solver's evolve method.
+        """
+        psi = np.asarray(psi)
+        if self._buffer is None:
+            self._buffer = np.empty((self.chunk_frames, ) + psi.shape,
+                                    dtype=psi.dtype)
+        elif psi.shape != self._buffer.shape[1:]:
+            raise Exception('The wavefunction has the shape %s, but the '
+                            'trajectory has frames of the shape %s.'
+                            % (str(psi.shape), str(self._buffer.shape[1:])))
+        self._buffer[self._n_buffered] = psi
+        self._n_buffered += 1
+        self._steps.append(len(self._steps) if step is None else int(step))
+        if self._n_buffered == self.chunk_frames:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write out the frames that are buffered, even if there are fewer
+        of them than a whole chunk.
+        """
+        if self._n_buffered == 0:
+            return
+        self._write_chunk(self._buffer[:self._n_buffered])
+        self._n_chunks += 1
+        self._chunk_sizes.append(self._n_buffered)
+        self._n_buffered = 0
+        self._write_meta()
+
+    def close(self) -> None:
+        """
+        Write out any buffered frames.
+        """
+        self.flush()
+
+    def _write_chunk(self, frames: np.ndarray) -> None:
+        compressed = self.compression is not None
+        filename = _get_chunk_file(self.path, self._n_chunks, compressed)
+        if compressed:
+            with open(filename, 'wb') as f:
+                f.write(zlib.compress(_shuffle(frames), self.level))
+        else:
+            np.save(filename, frames)
+
+    def _write_meta(self) -> None:
+        meta = {'frame_shape': list(self._buffer.shape[1:]),
+                'dtype': self._buffer.dtype.str,
+                'chunk_frames': self.chunk_frames,
+                'chunk_sizes': self._chunk_sizes,
+                'compression': self.compression,
+                'steps': self._steps[:len(self._steps) - self._n_buffered]}
+        # Write to a temporary file first, so that the trajectory can
+        # still be read if the run stops while this is being written.
+        filename = os.path.join(self.path, _META_FILE)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(filename + '.tmp', filename)
+
+
+class AsyncSnapshotWriter:
+    """
+    Pass snapshots to a writer from a background thread, so that
+    compressing and writing them overlaps with stepping.
+
+    Each snapshot is copied into one of max_queued buffers, which are
+    reused once the background thread has written them, so no new
+    arrays are made after the first few snapshots. If all the buffers
+    are waiting to be written, append blocks until one is free, which
+    bounds the memory used when the disk cannot keep up. The writer
+    can be anything with an append(psi, step) method, such as a
+    TrajectoryWriter. zlib and file writes release the GIL, so these
+    run alongside the Fourier transforms of the solver.
+    """
+
+    def __init__(self, writer: Any, max_queued: int = 4):
+        self.writer = writer
+        self.max_queued = max_queued
+        self._free = queue.Queue()
+        self._n_buffers = 0
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'AsyncSnapshotWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def append(self, psi: Any, step: int = None) -> None:
+        """
+        Copy the wavefunction and queue it to be written. This can be
+        passed as the callback of a solver's evolve method.
+        """
+        self._check_error()
+        psi = np.asarray(psi)
+        buffer = self._get_buffer(psi)
+        np.copyto(buffer, psi)
+        self._queue.put((buffer, step))
+
+    def flush(self) -> None:
+        """
+        Wait until all the queued snapshots have been written,
+        and then flush the writer.
+        """
+        self._queue.join()
+        self._check_error()
+        if hasattr(self.writer, 'flush'):
+            self.writer.flush()
+
+    def close(self) -> None:
+        """
+        Write the remaining snapshots, stop the background thread,
+        and close the writer.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._check_error()
+        if hasattr(self.writer, 'close'):
+            self.writer.close()
+
+    def _get_buffer(self, psi: np.ndarray) -> np.ndarray:
+        while True:
+            try:
+                buffer = self._free.get_nowait()
+            except queue.Empty:
+                if self._n_buffers < self.max_queued:
+                    self._n_buffers += 1
+                    return np.empty(psi.shape, dtype=psi.dtype)
+                buffer = self._free.get()
+            if buffer.shape == psi.shape and buffer.dtype == psi.dtype:
+                return buffer
+            # The snapshots changed shape, so the old buffer is dropped.
+            self._n_buffers -= 1
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            buffer, step = item
+            try:
+                if self._error is None:
+                    self.writer.append(buffer, step)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._free.put(buffer)
+                self._queue.task_done()
+
+    def _check_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+class TrajectoryReader:
+    """
+    Read a trajectory that was written by TrajectoryWriter.
+
+    Indexing this is like indexing an array whose first axis is time
+    and whose other axes are those of the frames, except that only
+    the chunks that hold the requested frames are read. The spatial
+    part of the index is applied to each frame separately, which only
+    differs from indexing an array when it mixes integers and lists.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, _META_FILE), 'r') as f:
+            meta = json.load(f)
+        self.frame_shape = tuple(meta['frame_shape'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.chunk_frames = meta['chunk_frames']
+        self.compression = meta['compression']
+        self.steps = np.array(meta['steps'], dtype=int)
+        # Trajectories written before the sizes of the chunks were
+        # recorded only have whole chunks, except for the last one.
+        n_frames = len(self.steps)
+        chunk_sizes = meta.get('chunk_sizes', [
+            min(self.chunk_frames, n_frames - i)
+            for i in range(0, n_frames, self.chunk_frames)])
+        self._chunk_sizes = np.array(chunk_sizes, dtype=int)
+        self._chunk_starts = np.concatenate(
+            ([0], np.cumsum(self._chunk_sizes)[:-1])).astype(int)
+        self._chunks = {}
+        self._last_chunk = (None, None)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        The number of frames followed by the shape of each frame.
+        """
+        return (len(self.steps), ) + self.frame_shape
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        key = key if isinstance(key, tuple) else (key, )
+        time_key, space_key = key[0], key[1:]
+        indices = np.arange(len(self))[time_key]
+        if np.ndim(indices) == 0:
+            return np.array(self._get_frame(int(indices))[space_key])
+        frames = np.empty((len(indices), ) + np.broadcast_to(
+            np.uint8(0), self.frame_shape)[space_key].shape, dtype=self.dtype)
+        for j, i in enumerate(indices):
+            frames[j] = self._get_frame(i)[space_key]
+        return frames
+
+    def get_step(self, step: int) -> np.ndarray:
+        """
+        Get the frame that was saved at the given step.
+        """
+        indices = np.flatnonzero(self.steps == step)
+        if len(indices) == 0:
+            raise KeyError('No frame was saved at step %d.' % step)
+        return self[int(indices[0])]
+
+    def frames(self) -> Iterator[np.ndarray]:
+        """
+        Iterate over the frames in order, reading one chunk at a time.
+        """
+        for i in range(len(self)):
+            yield self._get_frame(i)
+
+    def _get_frame(self, i: int) -> np.ndarray:
+        index = int(np.searchsorted(self._chunk_starts, i, side='right')) - 1
+        return self._get_chunk(index)[i - self._chunk_starts[index]]
+
+    def _get_chunk(self, index: int) -> np.ndarray:
+        if self.compression is None:
+            # Memory mapping a chunk does not read it,
+            # so these are all kept open.
+            if index not in self._chunks:
+                self._chunks[index] = np.load(
+                    _get_chunk_file(self.path, index, False), mmap_mode='r')
+            return self._chunks[index]
+        # Only the last decompressed chunk is kept in memory.
+        if self._last_chunk[0] != index:
+            n_frames = int(self._chunk_sizes[index])
+            with open(_get_chunk_file(self.path, index, True), 'rb') as f:
+                data = zlib.decompress(f.read())
+            self._last_chunk = (index, _unshuffle(
+                data, self.dtype, (n_frames, ) + self.frame_shape))
+        return self._last_chunk[1]
+
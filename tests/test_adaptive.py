@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from splitstep import SplitStepMethod
+from splitstep.adaptive import AdaptiveStepper
+
+
+N = 128
+L = 4e-9
+DT = 1e-17
+X = L*np.linspace(-0.5, 0.5 - 1.0/N, N)
+V = 15e-18*(X/L)**2
+
+
+def get_wavefunction() -> np.ndarray:
+    psi = np.exp(-((X/L + 0.25)/0.07)**2/2.0) + 0.0j
+    return psi/np.sqrt(np.sum(np.abs(psi)**2))
+
+
+def test_final_step_on_unvisited_level():
+    # With a loose tolerance dt doubles after every step, so the last,
+    # shortened step is taken when the next level was never used.
+    psi0 = get_wavefunction()
+    stepper = AdaptiveStepper(SplitStepMethod(V, (L, ), DT), tol=1e3)
+    psi = stepper.evolve(psi0, 1e-16)
+    dt = stepper.get_history()['dt']
+    assert np.allclose(dt, [1e-17, 2e-17, 4e-17, 3e-17])
+    assert np.isclose(stepper.t, 1e-16)
+    # Each accepted step keeps the result of the two half steps,
+    # while the last step is a single step.
+    U = SplitStepMethod(V, (L, ), DT)
+    expected = np.array(psi0)
+    for dt_i in dt[:-1]:
+        U.set_timestep(dt_i/2.0)
+        expected = U(U(expected))
+    U.set_timestep(dt[-1])
+    expected = U(expected)
+    assert np.allclose(psi, expected, atol=1e-12)
+
+
+def test_tolerance_that_cannot_be_met():
+    psi0 = get_wavefunction()
+    solver = SplitStepMethod(V, (L, ), 1e-15)
+    stepper = AdaptiveStepper(solver, tol=1e-30, max_halvings=2)
+    with pytest.raises(Exception, match='above the tolerance'):
+        stepper.evolve(psi0, 1e-15)
+    # The solver is left with the timestep of the rejected step,
+    # not half of it.
+    assert solver._dt == stepper.dt == 1e-15*2.0**-2
+    assert solver._steps == 0
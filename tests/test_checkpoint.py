@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from splitstep import SplitStepMethod, DiracSplitStepMethod
+
+
+N = 32
+L = 4e-9
+DT = 1e-17
+
+
+def get_problem(n=N):
+    x = L*np.linspace(-0.5, 0.5 - 1.0/n, n)
+    X, Y = np.meshgrid(x, x)
+    V = 15e-18*((X/L)**2 + (Y/L)**2)
+    psi = np.exp(-((X/L + 0.25)**2 + (Y/L)**2)/(2.0*0.07**2)) + 0.0j
+    return V, psi/np.sqrt(np.sum(np.abs(psi)**2))
+
+
+@pytest.mark.parametrize('save_propagators', [False, True])
+def test_resume_matches_uninterrupted_run(tmp_path, save_propagators):
+    V, psi = get_problem()
+    U = SplitStepMethod(V, (L, L), DT)
+    psi = U.evolve(psi, 5)
+    U.save_checkpoint(str(tmp_path/'c'), psi, save_propagators)
+    expected = U.evolve(psi, 5)
+    U2 = SplitStepMethod(V, (L, L), DT)
+    assert np.allclose(U2.evolve(U2.load_checkpoint(str(tmp_path/'c')), 5),
+                       expected, atol=1e-14)
+
+
+def test_grid_shape_mismatch(tmp_path):
+    V, psi = get_problem()
+    SplitStepMethod(V, (L, L), DT).save_checkpoint(str(tmp_path/'c'), psi)
+    V2, _ = get_problem(N//2)
+    with pytest.raises(ValueError, match='grid shape'):
+        SplitStepMethod(V2, (L, L), DT).load_checkpoint(str(tmp_path/'c'))
+
+
+def test_timestep_mismatch_with_propagators(tmp_path):
+    V, psi = get_problem()
+    SplitStepMethod(V, (L, L), DT).save_checkpoint(str(tmp_path/'c'), psi,
+                                                   True)
+    U = SplitStepMethod(V, (L, L), 2.0*DT)
+    with pytest.raises(ValueError, match='timestep'):
+        U.load_checkpoint(str(tmp_path/'c'))
+    # Nothing is changed when the checkpoint is rejected.
+    assert U._dt == 2.0*DT and U._steps == 0
+
+
+def test_wavefunction_type_mismatch(tmp_path):
+    V, psi = get_problem()
+    U = SplitStepMethod(V, (L, L), -1j*DT, real=True)
+    U.save_checkpoint(str(tmp_path/'c'), psi)
+    with pytest.raises(ValueError, match='type'):
+        SplitStepMethod(V, (L, L), -1j*DT, real=True).load_checkpoint(
+            str(tmp_path/'c'))
+
+
+def test_spinor_propagators(tmp_path):
+    x = np.linspace(-10.0, 10.0, 16, endpoint=False)
+    X, Y = np.meshgrid(x, x)
+    psi = np.zeros((16, 16, 4), np.complex128)
+    psi[..., 0] = np.exp(-(X**2 + Y**2)/4.0)
+    U = DiracSplitStepMethod(0.02*(X**2 + Y**2), (20.0, 20.0), 1e-3,
+                             closed_form_momentum=True, spinor_last=True)
+    U.save_checkpoint(str(tmp_path/'c'), psi, True)
+    expected = U.evolve(psi, 3)
+    U2 = DiracSplitStepMethod(0.02*(X**2 + Y**2), (20.0, 20.0), 1e-3,
+                              closed_form_momentum=True, spinor_last=True)
+    psi2 = U2.load_checkpoint(str(tmp_path/'c'))
+    assert np.allclose(U2.evolve(psi2, 3), expected)
+
+
+@pytest.mark.parametrize('new_is_complete', [True, False])
+def test_interrupted_swap(tmp_path, monkeypatch, new_is_complete):
+    from splitstep import checkpoint
+    V, psi = get_problem()
+    path = str(tmp_path/'c')
+    U = SplitStepMethod(V, (L, L), DT)
+    psi = U.evolve(psi, 5)
+    U.save_checkpoint(path, psi)
+    psi = U.evolve(psi, 5)
+    # Stop the save after the previous checkpoint is moved aside,
+    # before the new one is moved into place.
+    replace = checkpoint.os.replace
+
+    def interrupted_replace(src, dst):
+        replace(src, dst)
+        if dst.endswith('.old'):
+            raise KeyboardInterrupt
+    monkeypatch.setattr(checkpoint.os, 'replace', interrupted_replace)
+    with pytest.raises(KeyboardInterrupt):
+        U.save_checkpoint(path, psi)
+    monkeypatch.undo()
+    assert not (tmp_path/'c').exists()
+    if not new_is_complete:
+        with open(str(tmp_path/'c.tmp'/'checkpoint.json'), 'w') as f:
+            f.write('{"class": ')
+    U2 = SplitStepMethod(V, (L, L), DT)
+    psi2 = U2.load_checkpoint(path)
+    assert U2._steps == (10 if new_is_complete else 5)
+    if new_is_complete:
+        assert np.allclose(psi2, psi)
@@ -0,0 +1,47 @@
+import numpy as np
+import scipy.constants as const
+from splitstep import SplitStepMethod
+from splitstep.distributed import DistributedSplitStepMethod
+
+
+N = 16
+L = 4e-9
+DT = 1e-17
+
+
+def get_problem(complex_potential: bool = False):
+    x = L*np.linspace(-0.5, 0.5 - 1.0/N, N)
+    X, Y = np.meshgrid(x, x)
+    V = 15e-18*((X/L)**2 + (Y/L)**2)
+    if complex_potential:
+        V = V - 1e-18j*np.exp(-((X/L)**2 + (Y/L)**2)/0.02)
+    psi = np.exp(-((X/L + 0.25)**2 + (Y/L)**2)/(2.0*0.07**2)) + 0.0j
+    return V, psi/np.sqrt(np.sum(np.abs(psi)**2))
+
+
+def evolve_both(V, psi, m, n_steps=10):
+    U = SplitStepMethod(V, (L, L), DT)
+    U.m = m
+    U.set_timestep(DT)
+    expected = U.evolve(psi, n_steps)
+    with DistributedSplitStepMethod(V, (L, L), DT, n_workers=2) as D:
+        D.m = m
+        D.set_timestep(DT)
+        result = D.evolve(psi, n_steps)
+    return expected, result
+
+
+def test_mass_matches_serial_solver():
+    V, psi = get_problem()
+    expected, result = evolve_both(V, psi, 10.0*const.m_e)
+    assert np.allclose(result, expected, atol=1e-12)
+    # The mass changes the result, so it is not ignored.
+    default, _ = evolve_both(V, psi, const.m_e)
+    assert not np.allclose(default, expected, atol=1e-6)
+
+
+def test_complex_potential_matches_serial_solver():
+    V, psi = get_problem(complex_potential=True)
+    expected, result = evolve_both(V, psi, const.m_e)
+    assert np.allclose(result, expected, atol=1e-12)
+    assert np.sum(np.abs(result)**2) < 0.999
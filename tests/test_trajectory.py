@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from splitstep.trajectory import TrajectoryWriter, TrajectoryReader
+from splitstep.trajectory import AsyncSnapshotWriter
+
+
+def get_frame(i):
+    return np.exp(1.0j*i*np.arange(12.0)).reshape(3, 4)
+
+
+def write_frames(path, n_frames, **kw):
+    with TrajectoryWriter(path, chunk_frames=2, **kw) as writer:
+        for i in range(n_frames):
+            writer.append(np.full(3, i + 0.0j))
+
+
+def test_existing_trajectory_is_not_overwritten(tmp_path):
+    write_frames(str(tmp_path), 5)
+    with pytest.raises(FileExistsError):
+        TrajectoryWriter(str(tmp_path))
+
+
+def test_overwrite_drops_the_old_frames(tmp_path):
+    write_frames(str(tmp_path), 7)
+    write_frames(str(tmp_path), 3, compression=None, overwrite=True)
+    trajectory = TrajectoryReader(str(tmp_path))
+    assert trajectory.shape == (3, 3)
+    assert np.array_equal(trajectory[:, 0], [0.0, 1.0, 2.0])
+    assert sorted(p.name for p in tmp_path.iterdir()) == \
+        ['chunk_000000.npy', 'chunk_000001.npy', 'trajectory.json']
+
+
+@pytest.mark.parametrize('compression', ['zlib', None])
+@pytest.mark.parametrize('n_frames', [8, 11])
+def test_round_trip(tmp_path, compression, n_frames):
+    # 11 frames leave a trailing partial chunk.
+    with TrajectoryWriter(str(tmp_path), chunk_frames=4,
+                          compression=compression) as writer:
+        for i in range(n_frames):
+            writer.append(get_frame(i), 10*i)
+    trajectory = TrajectoryReader(str(tmp_path))
+    assert trajectory.shape == (n_frames, 3, 4)
+    expected = np.array([get_frame(i) for i in range(n_frames)])
+    assert np.array_equal(trajectory[:], expected)
+    assert np.array_equal(np.array(list(trajectory.frames())), expected)
+    assert np.array_equal(trajectory[::-3, 1], expected[::-3, 1])
+    assert np.array_equal(trajectory.get_step(30), expected[3])
+
+
+@pytest.mark.parametrize('compression', ['zlib', None])
+def test_flush_mid_run(tmp_path, compression):
+    # The flush writes a short chunk in the middle of the trajectory.
+    with TrajectoryWriter(str(tmp_path), chunk_frames=4,
+                          compression=compression) as writer:
+        for i in range(2):
+            writer.append(get_frame(i))
+        writer.flush()
+        for i in range(2, 8):
+            writer.append(get_frame(i))
+    trajectory = TrajectoryReader(str(tmp_path))
+    assert len(trajectory) == 8
+    for i in range(8):
+        assert np.array_equal(trajectory[i], get_frame(i))
+    assert np.array_equal(trajectory[:], [get_frame(i) for i in range(8)])
+
+
+@pytest.mark.parametrize('compression', ['zlib', None])
+def test_async_flush_mid_run(tmp_path, compression):
+    with AsyncSnapshotWriter(TrajectoryWriter(
+            str(tmp_path), chunk_frames=4, compression=compression),
+            max_queued=2) as writer:
+        for i in range(3):
+            writer.append(get_frame(i), i)
+        writer.flush()
+        # The flushed frames can be read while the run goes on.
+        assert len(TrajectoryReader(str(tmp_path))) == 3
+        for i in range(3, 10):
+            writer.append(get_frame(i), i)
+    trajectory = TrajectoryReader(str(tmp_path))
+    assert np.array_equal(trajectory.steps, np.arange(10))
+    for i, psi in enumerate(trajectory.frames()):
+        assert np.array_equal(psi, get_frame(i))
+    assert np.array_equal(trajectory[:], [get_frame(i) for i in range(10)])